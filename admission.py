@@ -0,0 +1,191 @@
+# admission.py
+# Contrôle d'admission devant le backend LLM : nombre borné d'appels simultanés vers l'API amont,
+# file d'attente bornée (premier arrivé, premier servi) avec délai maximal, débit par joueur
+# (seau à jetons) et pause après une erreur de quota. Les requêtes refusées reçoivent un 429/503
+# avec Retry-After au lieu d'aller chercher l'erreur de quota chez le fournisseur.
+# L'état est propre au processus : les plafonds s'entendent par worker.
+import math
+import time
+import asyncio
+import logging
+import threading
+import collections
+import concurrent.futures
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_EVENTS = metrics.Counter(
+    "chat_admission_total", "Admission des appels au modèle : admitted, queued, rate_limited, queue_full, queue_timeout, paused.",
+    labelnames=("outcome",)
+)
+
+
+class AdmissionRejected(Exception):
+    """Appel refusé par le contrôle d'admission (à renvoyer au client avec Retry-After)."""
+    def __init__(self, message, status, retry_after, reason):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after # Secondes
+        self.reason = reason
+
+
+class Slot:
+    """Place occupée vers l'API amont, libérée une seule fois (release ou fin du bloc with)."""
+    def __init__(self, controller):
+        self.controller = controller
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self, error=None):
+        if self.released: return
+        self.released = True
+        self.controller._release(time.monotonic() - self.started, error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release(exc)
+
+
+class AdmissionController:
+    """Places vers l'API amont (max_concurrency), file d'attente (max_queue, queue_timeout_s) et débit
+    par joueur (rate_per_minute, burst). Une valeur nulle désactive la limite correspondante."""
+
+    def __init__(self, max_concurrency=64, max_queue=1024, queue_timeout_s=10, rate_per_minute=20, burst=5,
+                 quota_cooldown_s=30, quota_errors=(), max_buckets=10000):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.rate_per_s = rate_per_minute / 60
+        self.burst = max(1, burst)
+        self.quota_cooldown_s = quota_cooldown_s
+        self.quota_errors = tuple(quota_errors) # Erreurs du modèle signalant un quota épuisé
+        self.max_buckets = max_buckets
+        self._inflight = 0
+        self._waiters = collections.deque() # Futures des appels en attente, dans l'ordre d'arrivée
+        self._buckets = {} # joueur -> [jetons, dernier remplissage]
+        self._paused_until = 0.0
+        self._hold_s = 5.0 # Durée moyenne (glissante) d'occupation d'une place, pour estimer Retry-After
+        self._lock = threading.Lock()
+
+    # --- Débit par joueur ---
+    def _take_token(self, key, now):
+        """Consomme un jeton du joueur ; retourne 0 ou le délai avant le prochain jeton (appelé sous verrou)."""
+        if key is None or self.rate_per_s <= 0: return 0
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets: self._prune(now)
+            bucket = self._buckets[key] = [float(self.burst), now]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate_per_s)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return (1 - bucket[0]) / self.rate_per_s
+        bucket[0] -= 1
+        return 0
+
+    def _refund_token(self, key):
+        """Rend le jeton d'un appel finalement refusé (file pleine ou délai dépassé) : seuls les appels admis comptent (sous verrou)."""
+        bucket = self._buckets.get(key) if key is not None and self.rate_per_s > 0 else None
+        if bucket is not None: bucket[0] = min(self.burst, bucket[0] + 1)
+
+    def _prune(self, now):
+        """Oublie les seaux redevenus pleins (joueurs inactifs)."""
+        refill_s = self.burst / self.rate_per_s
+        for key in [key for key, (_, updated) in self._buckets.items() if now - updated >= refill_s]:
+            del self._buckets[key]
+
+    # --- Places vers l'API amont ---
+    def _retry_after(self, waiting):
+        """Estimation du délai avant qu'une place se libère pour `waiting` appels en attente."""
+        return max(1, math.ceil(self._hold_s * (waiting + 1) / max(1, self.max_concurrency)))
+
+    def _enter(self, key, queue):
+        """Retourne None si une place est obtenue, sinon la future à attendre ; lève AdmissionRejected."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                ADMISSION_EVENTS.inc(outcome="paused")
+                raise AdmissionRejected("Le quota d'utilisation de l'API IA a été atteint, réessayez dans un instant.",
+                                        429, math.ceil(self._paused_until - now), "paused")
+            wait_s = self._take_token(key, now)
+            if wait_s:
+                ADMISSION_EVENTS.inc(outcome="rate_limited")
+                raise AdmissionRejected("Trop de messages en peu de temps, patientez un instant.", 429, math.ceil(wait_s), "rate_limited")
+            if not self.max_concurrency or (self._inflight < self.max_concurrency and not self._waiters):
+                self._inflight += 1
+                ADMISSION_EVENTS.inc(outcome="admitted")
+                return None
+            if not queue or len(self._waiters) >= self.max_queue:
+                self._refund_token(key)
+                ADMISSION_EVENTS.inc(outcome="queue_full")
+                raise AdmissionRejected("Le serveur est très sollicité, réessayez dans un instant.",
+                                        429, self._retry_after(len(self._waiters)), "queue_full")
+            waiter = concurrent.futures.Future()
+            self._waiters.append(waiter)
+            ADMISSION_EVENTS.inc(outcome="queued")
+            return waiter
+
+    def _abandon(self, waiter, key):
+        """Délai d'attente dépassé : retire l'appel de la file (et rend son jeton), sauf si une place vient de lui être cédée."""
+        with self._lock:
+            if waiter.done(): return False
+            waiter.cancel()
+            self._waiters.remove(waiter)
+            self._refund_token(key)
+            ADMISSION_EVENTS.inc(outcome="queue_timeout")
+            return True
+
+    def _timeout_error(self):
+        return AdmissionRejected("Le serveur est très sollicité, réessayez dans un instant.",
+                                 503, self._retry_after(len(self._waiters)), "queue_timeout")
+
+    def _release(self, held_s, error=None):
+        with self._lock:
+            self._hold_s = 0.9 * self._hold_s + 0.1 * held_s
+            if error is not None and isinstance(error, self.quota_errors):
+                self._paused_until = time.monotonic() + self.quota_cooldown_s
+                logger.warning("Quota du modèle atteint : nouveaux appels refusés pendant %ss", self.quota_cooldown_s)
+            # La place passe directement au premier appel en attente (sinon elle est rendue)
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(True)
+                    return
+            self._inflight -= 1
+
+    def admit(self, key=None, queue=True):
+        """Obtient une place (en attendant au plus queue_timeout_s) ; à utiliser en bloc with.
+        `key` identifie le joueur pour le débit ; queue=False refuse au lieu d'attendre."""
+        waiter = self._enter(key, queue)
+        if waiter is not None:
+            with metrics.span("admission_wait"):
+                try:
+                    waiter.result(timeout=self.queue_timeout_s)
+                except concurrent.futures.TimeoutError:
+                    if self._abandon(waiter, key): raise self._timeout_error()
+        return Slot(self)
+
+    async def admit_async(self, key=None, queue=True):
+        """Équivalent asyncio de admit (l'attente ne bloque pas la boucle)."""
+        waiter = self._enter(key, queue)
+        if waiter is not None:
+            with metrics.span("admission_wait"):
+                try:
+                    await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter)), self.queue_timeout_s)
+                except asyncio.TimeoutError:
+                    if self._abandon(waiter, key): raise self._timeout_error()
+                except asyncio.CancelledError:
+                    # Requête abandonnée pendant l'attente : la place éventuellement cédée est rendue
+                    if not self._abandon(waiter, key): self._release(0)
+                    raise
+        return Slot(self)
+
+    def quota_retry_after(self):
+        """Secondes avant la fin de la pause consécutive à une erreur de quota."""
+        return max(1, math.ceil(self._paused_until - time.monotonic()))
+
+# --- FIN admission.py ---
@@ -1,54 +1,123 @@
 # app.py
 import os
-import re
+import gzip
+import zlib
 import json
-import datetime
-import sqlite3 # Import sqlite3 pour la gestion d'erreur spécifique
-from flask import Flask, request, jsonify, render_template
-import google.generativeai as genai
+import time
+import logging
+import functools
+import threading
+import concurrent.futures
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from dotenv import load_dotenv
 
+# --- Configuration ---
+load_dotenv() # Avant l'import de llm.py, qui lit sa configuration dans l'environnement
+
+# Journalisation : LOG_LEVEL=DEBUG pour le détail de chaque tour, WARNING en production, OFF pour tout couper
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(
+    level=getattr(logging, LOG_LEVEL, logging.INFO),
+    format="%(asctime)s %(levelname)s [%(name)s] %(message)s"
+)
+if LOG_LEVEL == "OFF":
+    logging.disable(logging.CRITICAL)
+logger = logging.getLogger(__name__)
+
 # Importer depuis les modules locaux
 import database
+import llm
+import metrics
+import speculation
+import coalescing
+import admission
+import openings
+import structured
 
 
 from prompts import (
     THEMES, AGE_INSTRUCTIONS, GENDER_INSTRUCTIONS,
     PLAYER_NAME_INSTRUCTION_TEMPLATE, FORMAT_CHOIX_INSTRUCTION, TONE_TWIST_INSTRUCTION,
+    STRUCTURED_FORMAT_INSTRUCTION, INVENTORY_STATE_TEMPLATE,
     TURN_COUNT_INSTRUCTION_TEMPLATE, LANGUAGE_INSTRUCTION,
-    IMMERSION_INSTRUCTION, INVENTORY_INSTRUCTION, NPC_INSTRUCTION
+    IMMERSION_INSTRUCTION, INVENTORY_INSTRUCTION, NPC_INSTRUCTION,
+    SUMMARY_INSTRUCTION, SUMMARY_HEADER
 )
 
-# --- Configuration ---
-load_dotenv()
-GEMINI_API_KEY_FROM_ENV = os.getenv("GEMINI_API_KEY")
-DEFAULT_MODEL = "gemini-1.5-flash-latest" # Modèle par défaut mis à jour
-GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL", DEFAULT_MODEL)
+# Compaction de l'historique : au-delà du budget, les anciens tours sont remplacés par un résumé
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 6000)) # Estimation (~4 caractères par token)
+CONTEXT_KEEP_EXCHANGES = int(os.getenv("CONTEXT_KEEP_EXCHANGES", 4)) # Derniers échanges gardés mot pour mot
+CONTEXT_SUMMARY_STEP = int(os.getenv("CONTEXT_SUMMARY_STEP", 2)) # Échanges minimum à intégrer par mise à jour du résumé
+CONTEXT_SUMMARY_THREADS = int(os.getenv("CONTEXT_SUMMARY_THREADS", 2)) # Mises à jour du résumé simultanées (arrière-plan)
 THEME_DATA = {}
 MIN_TURNS = 10
 MAX_TURNS = 20
-
-# --- Configuration Initiale et Vérifications Thèmes/API Key ---
+SESSIONS_PAGE_SIZE = 20 # Taille de page par défaut de /sessions
+SESSIONS_PAGE_MAX = 100
+EXPORT_CHUNK_BYTES = 64 * 1024 # Taille des blocs envoyés par /sessions/export
+# Pré-génération spéculative du tour suivant pour chaque choix proposé (coût en tokens multiplié)
+SPECULATIVE_TURNS = os.getenv("SPECULATIVE_TURNS", "false").lower() in ("true", "1", "t")
+SPECULATION_TTL_S = int(os.getenv("SPECULATION_TTL_S", 300)) # Durée de vie d'un tour pré-généré
+SPECULATION_MAX_CHOICES = int(os.getenv("SPECULATION_MAX_CHOICES", 3)) # Choix pré-générés par tour (A, puis B, puis C)
+SPECULATION_MAX_INFLIGHT = int(os.getenv("SPECULATION_MAX_INFLIGHT", 16)) # Générations spéculatives simultanées
+SPECULATION_TOKEN_BUDGET_PER_HOUR = int(os.getenv("SPECULATION_TOKEN_BUDGET_PER_HOUR", 500000)) # 0 : sans plafond
+# Regroupement des requêtes /chat identiques (renvois du client) et rejeu par clé d'idempotence
+IDEMPOTENCY_TTL_S = int(os.getenv("IDEMPOTENCY_TTL_S", 120)) # Durée pendant laquelle un tour terminé peut être rejoué
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 1024)) # Tours terminés conservés pour rejeu
+COALESCE_WAIT_S = int(os.getenv("COALESCE_WAIT_S", 180)) # Attente max d'un tour identique encore en cours
+# Contrôle d'admission devant le modèle (par processus ; 0 désactive la limite correspondante)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 64)) # Appels simultanés vers l'API amont
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", 1024)) # Appels en attente d'une place (au-delà : 429 ; une attente ASGI ne coûte qu'une future)
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("LLM_QUEUE_TIMEOUT_S", 15)) # Attente max d'une place (au-delà : 503)
+PLAYER_RATE_PER_MINUTE = float(os.getenv("PLAYER_RATE_PER_MINUTE", 20)) # Tours par minute et par partie/joueur
+PLAYER_BURST = int(os.getenv("PLAYER_BURST", 5)) # Tours enchaînés sans attendre
+LLM_QUOTA_COOLDOWN_S = int(os.getenv("LLM_QUOTA_COOLDOWN_S", 30)) # Refus immédiat des appels après une erreur de quota
+# Réserve de scènes d'ouverture pré-générées par (thème, âge, genre) ; coût : depth ouvertures par combinaison et par processus
+OPENING_POOL_DEPTH = int(os.getenv("OPENING_POOL_DEPTH", 0)) # Ouvertures prêtes par combinaison (0 : désactivée)
+OPENING_POOL_TTL_S = int(os.getenv("OPENING_POOL_TTL_S", 3600)) # Durée de vie d'une ouverture prête
+OPENING_POOL_MAX_INFLIGHT = int(os.getenv("OPENING_POOL_MAX_INFLIGHT", 2)) # Générations de remplissage simultanées
+OPENING_POOL_START_SPREAD_S = float(os.getenv("OPENING_POOL_START_SPREAD_S", 60)) # Étalement du remplissage initial
+OPENING_POOL_RETRY_MAX_S = float(os.getenv("OPENING_POOL_RETRY_MAX_S", 300)) # Attente maximale avant de retenter une combinaison en échec
+OPENING_KICKOFF = "Commence l'aventure." # Message déclencheur d'une nouvelle partie (envoyé par le client web)
+# Sortie structurée des tours : réponse JSON (narration, choix, inventaire, fin) analysée une fois et stockée par tour
+STRUCTURED_TURNS = os.getenv("STRUCTURED_TURNS", "false").lower() in ("true", "1", "t")
+# Compression gzip des réponses JSON (historique complet, liste des sessions) ; 0 désactive
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", 1024)) # Taille minimale compressée
+
+# --- Configuration Initiale et Vérifications Thèmes/Backend LLM ---
 try:
     THEME_DATA = {theme['name']: theme for theme in THEMES} # cite: 9
-    print(f"--- Thèmes chargés: {list(THEME_DATA.keys())} ---")
+    logger.info("Thèmes chargés: %s", list(THEME_DATA.keys()))
 except Exception as e:
-    print(f"ERREUR critique lors du chargement des thèmes: {e}")
-
-if not GEMINI_API_KEY_FROM_ENV:
-    print("ERREUR critique: Clé API Gemini non trouvée.")
-elif not THEME_DATA:
-    print("ERREUR critique: Aucun thème chargé.")
-else:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY_FROM_ENV)
-        print(f"--- SDK Google configuré (Modèle: {GEMINI_MODEL_NAME}) ---")
-    except Exception as e:
-        print(f"ERREUR critique config genai: {e}")
-        GEMINI_API_KEY_FROM_ENV = None
+    logger.critical("ERREUR critique lors du chargement des thèmes: %s", e)
+
+if not THEME_DATA:
+    logger.critical("ERREUR critique: Aucun thème chargé.")
+# Backend LLM (Gemini par défaut, voir llm.py pour LLM_PROVIDER / LLM_FALLBACK_PROVIDER)
+llm_provider = llm.build_provider_from_env()
+# Tours de jeu : réponses JSON conformes au schéma en mode structuré (les résumés restent en texte libre),
+# même disjoncteur, mêmes places d'appel et mêmes threads que llm_provider (un seul état par backend)
+turn_provider = llm.build_provider_from_env(structured.TURN_SCHEMA, shared=llm_provider) if STRUCTURED_TURNS else llm_provider
+
+def chat_backend_ready():
+    """Vrai si le backend LLM est configuré et les thèmes chargés."""
+    return llm_provider.ready and bool(THEME_DATA)
+
+speculator = speculation.Speculator(
+    ttl_s=SPECULATION_TTL_S, max_choices=SPECULATION_MAX_CHOICES,
+    max_inflight=SPECULATION_MAX_INFLIGHT, token_budget_per_hour=SPECULATION_TOKEN_BUDGET_PER_HOUR
+) if SPECULATIVE_TURNS else None
+
+coalescer = coalescing.TurnCoalescer(ttl_s=IDEMPOTENCY_TTL_S, max_entries=IDEMPOTENCY_CACHE_SIZE)
+
+admission_controller = admission.AdmissionController(
+    max_concurrency=LLM_MAX_CONCURRENCY, max_queue=LLM_QUEUE_SIZE, queue_timeout_s=LLM_QUEUE_TIMEOUT_S,
+    rate_per_minute=PLAYER_RATE_PER_MINUTE, burst=PLAYER_BURST,
+    quota_cooldown_s=LLM_QUOTA_COOLDOWN_S, quota_errors=(llm.QuotaExceededError,)
+)
 
-# Initialiser Flask
-app = Flask(__name__)
+# Initialiser Flask (INSTANCE_PATH : dossier d'instance absolu, ex: volume hors du code)
+app = Flask(__name__, instance_path=os.getenv("INSTANCE_PATH") or None)
 # Configuration pour utiliser instance_path si nécessaire pour la DB
 app.config.from_mapping(
     DATABASE=os.path.join(app.instance_path, database.DATABASE) # cite: 10
@@ -56,9 +125,9 @@ app.config.from_mapping(
 # S'assurer que le dossier d'instance existe (utile pour la DB SQLite)
 try:
     os.makedirs(app.instance_path, exist_ok=True)
-    print(f"--- Dossier d'instance assuré: {app.instance_path} ---")
+    logger.info("Dossier d'instance assuré: %s", app.instance_path)
 except OSError as e:
-    print(f"!!! Erreur création dossier instance {app.instance_path}: {e} !!!")
+    logger.error("Erreur création dossier instance %s: %s", app.instance_path, e)
 
 
 # --- Initialisation de la Base de Données via le module database ---
@@ -68,17 +137,115 @@ database.init_app(app) # cite: 10
 # DÉPLACÉES vers database.py
 
 
-# --- Fonction Utile pour Extraire le Choix ---
-def extract_choice_text(letter, history):
-    if not history: return None
-    for i in range(len(history) - 1, -1, -1):
-        if history[i].get("role") == "assistant":
-            pattern = re.compile(r"^\s*" + re.escape(letter) + r"\)\s*(.*?)\s*(?:\n|$)", re.M | re.I)
-            match = pattern.search(history[i].get("content", ""))
-            if match and match.group(1).strip():
-                return match.group(1).strip()
-            return None
-    return None
+# --- Instructions Système (partie statique du prompt) ---
+@functools.lru_cache(maxsize=None)
+def build_system_instruction(theme_name, age_group, gender):
+    """Partie statique du prompt pour une combinaison (thème, âge, genre), construite une seule fois.
+    Les éléments propres au joueur (nom, nombre de tours) restent dans le premier message."""
+    theme_info = THEME_DATA[theme_name] # cite: 9
+    age_instruction = AGE_INSTRUCTIONS.get(age_group, AGE_INSTRUCTIONS["Adulte"]) # cite: 9
+    gender_instruction = GENDER_INSTRUCTIONS.get(gender, GENDER_INSTRUCTIONS["Garçon"]) # cite: 9
+    return "\n\n".join([
+        theme_info['prompt'], "---", STRUCTURED_FORMAT_INSTRUCTION if STRUCTURED_TURNS else FORMAT_CHOIX_INSTRUCTION, TONE_TWIST_INSTRUCTION, # cite: 9
+        LANGUAGE_INSTRUCTION, IMMERSION_INSTRUCTION, INVENTORY_INSTRUCTION, NPC_INSTRUCTION,# cite: 9
+        age_instruction, gender_instruction
+    ])
+
+def is_legacy_history(history):
+    """Vrai si l'historique provient d'une partie où le prompt complet était le premier message utilisateur."""
+    return bool(history) and FORMAT_CHOIX_INSTRUCTION in (history[0].get("content") or "")
+
+# --- Compaction de l'Historique (résumé glissant) ---
+def estimate_tokens(history):
+    """Estimation grossière du nombre de tokens d'un historique (~4 caractères par token)."""
+    return sum(len(entry.get("content") or "") for entry in history) // 4
+
+def summarize_history(previous_summary, entries):
+    """Met à jour le résumé de l'aventure avec de nouveaux échanges (appel modèle dédié)."""
+    transcript = "\n\n".join(
+        f"{'JOUEUR' if entry.get('role') == 'user' else 'NARRATEUR'} : {entry.get('content')}" for entry in entries
+    )
+    prompt = "\n\n".join([
+        SUMMARY_INSTRUCTION,
+        f"RÉSUMÉ PRÉCÉDENT :\n{previous_summary or '(aucun)'}",
+        f"NOUVEAUX ÉCHANGES :\n{transcript}"
+    ])
+    with admission_controller.admit(queue=False): # Arrière-plan : jamais devant les joueurs dans la file
+        return llm_provider.complete(prompt).strip()
+
+def compact_history(session_details, history):
+    """Historique à rejouer au modèle, retourné avec la mise à jour du résumé à lancer (ou None).
+    Sous le budget : inchangé. Au-delà : premier message (ouverture), résumé des tours intermédiaires, puis
+    les derniers échanges mot pour mot. Le résumé n'est jamais calculé ici (chemin de la requête) : quand
+    il est dû (au moins CONTEXT_SUMMARY_STEP échanges à y ajouter), la mise à jour est lancée en arrière-plan
+    une fois le tour sauvegardé (schedule_summary_update), et le résumé précédent sert en attendant."""
+    summary = session_details.get('summary')
+    summary_upto = session_details.get('summary_upto') or 0
+    if estimate_tokens(history) <= CONTEXT_TOKEN_BUDGET and not summary:
+        return history, None
+
+    # Index du premier message gardé mot pour mot (début d'un échange, jamais l'ouverture)
+    keep_from = max(2, len(history) - 2 * CONTEXT_KEEP_EXCHANGES)
+    keep_from -= keep_from % 2
+    update = None
+    if summary_upto < keep_from and (not summary or keep_from - summary_upto >= 2 * CONTEXT_SUMMARY_STEP):
+        update = {"session_id": session_details['id'], "summary": summary,
+                  "entries": history[max(1, summary_upto):keep_from], "summary_upto": keep_from}
+
+    if not summary or summary_upto < 2:
+        return history, update
+    # Le résumé prend la place d'une réplique du narrateur pour garder l'alternance user/model
+    return [history[0], {"role": "assistant", "content": f"{SUMMARY_HEADER}\n{summary}"}] + history[summary_upto:], update
+
+_summary_executor = None
+_summaries_running = set() # Sessions dont le résumé est en cours de mise à jour
+_summaries_lock = threading.Lock()
+
+def schedule_summary_update(turn):
+    """Lance en arrière-plan la mise à jour du résumé préparée par compact_history (une à la fois par session)."""
+    global _summary_executor
+    update = turn.get("summary_update")
+    if not update: return
+    session_id = update["session_id"]
+    with _summaries_lock:
+        if session_id in _summaries_running: return
+        _summaries_running.add(session_id)
+        if _summary_executor is None:
+            _summary_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, CONTEXT_SUMMARY_THREADS), thread_name_prefix='summary')
+
+    def run():
+        try:
+            with metrics.span("summary"):
+                summary = summarize_history(update["summary"], update["entries"])
+            with app.app_context():
+                database.update_session_summary(session_id, summary, update["summary_upto"])
+            logger.info("Résumé mis à jour (session %s, messages 1-%s)", session_id, update["summary_upto"] - 1)
+        except Exception as e:
+            logger.warning("Échec mise à jour du résumé (session %s): %s", session_id, e) # Retenté au tour suivant
+        finally:
+            with _summaries_lock:
+                _summaries_running.discard(session_id)
+
+    _summary_executor.submit(run)
+
+# --- Rappel du Tour (conclusion forcée) ---
+def build_turn_reminder(current_turn, total_turns):
+    """Préfixe ajouté au message du joueur pour situer le narrateur dans la partie (vide si le total est inconnu)."""
+    # *** DÉBUT MODIFICATION POUR CONCLUSION FORCÉE ***
+    turn_reminder = ""
+    if total_turns > 0:
+         # Cas 1: Dépassement du nombre de tours
+         if current_turn > total_turns:
+              turn_reminder = f"[Rappel Narrateur : URGENT - Le nombre de tours prévu ({total_turns}) est dépassé (Tour {current_turn}). Conclus l'histoire à ce tour !]\n\n"
+         # Cas 2: Dans les 3 derniers tours
+         elif (total_turns - current_turn) <= 3:
+              turn_reminder = f"[Rappel Narrateur : Tour {current_turn}/{total_turns}. L'aventure doit bientôt se conclure.]\n\n"
+         # Cas 3: Tours normaux (avant les 3 derniers)
+         else:
+              turn_reminder = f"[Rappel Narrateur : Tour {current_turn}/{total_turns}]\n\n"
+         logger.debug("Ajout Rappel Tour: %s", turn_reminder.strip())
+    # *** FIN MODIFICATION POUR CONCLUSION FORCÉE ***
+    return turn_reminder
 
 # --- Routes ---
 
@@ -91,15 +258,77 @@ def index():
 
 @app.route('/sessions', methods=['GET'])
 def api_get_sessions():
-    """API pour obtenir la liste des sessions."""
+    """API pour obtenir la liste des sessions, paginée par curseur.
+    Paramètres : limit (1-100), cursor (next_cursor de la page précédente), player_name, theme."""
     try:
-        sessions = database.get_all_sessions() # cite: 10
-        return jsonify(sessions)
+        limit = request.args.get('limit', SESSIONS_PAGE_SIZE, type=int)
+        if not limit or not (1 <= limit <= SESSIONS_PAGE_MAX): return jsonify({"error": f"Paramètre limit invalide (1-{SESSIONS_PAGE_MAX})."}), 400
+        try:
+            sessions, next_cursor = database.get_sessions_page( # cite: 10
+                limit=limit,
+                cursor=request.args.get('cursor') or None,
+                player_name=request.args.get('player_name') or None,
+                theme=request.args.get('theme') or None
+            )
+        except ValueError:
+            return jsonify({"error": "Curseur de pagination invalide."}), 400
+        return jsonify({"sessions": sessions, "next_cursor": next_cursor})
     except Exception as e:
-        print(f"!!! Erreur inattendue dans api_get_sessions: {e}")
+        logger.error("Erreur inattendue dans api_get_sessions: %s", e)
         return jsonify({"error": "Erreur serveur lors de la récupération des sessions."}), 500
 
 
+@app.route('/sessions/search', methods=['GET'])
+def api_search_sessions():
+    """API de recherche plein texte dans les aventures (joueur, thème, messages), les plus pertinentes d'abord.
+    Paramètres : q (texte recherché), limit (1-100), offset (next_offset de la page précédente).
+    truncated : vrai si seules les correspondances les plus récentes (SEARCH_MAX_HITS) ont été classées."""
+    if not database.SEARCH_ENABLED:
+        return jsonify({"error": "Recherche plein texte indisponible avec ce stockage."}), 501
+    query = (request.args.get('q') or '').strip()
+    if not query: return jsonify({"error": "Paramètre q manquant."}), 400
+    limit = request.args.get('limit', SESSIONS_PAGE_SIZE, type=int)
+    if not limit or not (1 <= limit <= SESSIONS_PAGE_MAX): return jsonify({"error": f"Paramètre limit invalide (1-{SESSIONS_PAGE_MAX})."}), 400
+    offset = request.args.get('offset', 0, type=int)
+    if offset is None or offset < 0: return jsonify({"error": "Paramètre offset invalide."}), 400
+    try:
+        sessions, next_offset, truncated = database.search_sessions(query, limit=limit, offset=offset)
+        return jsonify({"sessions": sessions, "next_offset": next_offset, "truncated": truncated})
+    except Exception as e:
+        logger.error("Erreur inattendue dans api_search_sessions: %s", e)
+        return jsonify({"error": "Erreur serveur lors de la recherche."}), 500
+
+
+@app.route('/sessions/export', methods=['GET'])
+def api_export_sessions():
+    """Export NDJSON de toutes les sessions (une session complète par ligne), diffusé au fil de la lecture
+    par lots : mémoire constante quelle que soit la taille de la base. Compressé en gzip si le client l'accepte.
+    Paramètre : include_archived (true/false)."""
+    include_archived = request.args.get('include_archived', 'false').lower() in ('true', '1', 't')
+    archive = database.session_archive(app) if include_archived else None
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+    def generate():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None # wbits=31 : format gzip
+        chunk, size = [], 0
+        for record in database.iter_session_records(database.get_db(), archive=archive):
+            line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+            chunk.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_BYTES:
+                data = b''.join(chunk)
+                yield compressor.compress(data) if compressor else data
+                chunk, size = [], 0
+        data = b''.join(chunk)
+        yield (compressor.compress(data) + compressor.flush()) if compressor else data
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = 'attachment; filename="sessions.ndjson"'
+    response.vary.add('Accept-Encoding')
+    if use_gzip: response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
 @app.route('/sessions/<int:session_id>', methods=['GET', 'DELETE'])
 def api_manage_session(session_id):
     """API pour obtenir les détails ou supprimer une session."""
@@ -109,249 +338,562 @@ def api_manage_session(session_id):
             return jsonify(session_details)
         else: return jsonify({"error":"Session non trouvée"}), 404
     elif request.method == 'DELETE':
+        if speculator: speculator.discard(session_id)
         success = database.delete_session(session_id) # cite: 10
         if success: return jsonify({"message":"Supprimée"}), 200
+        elif success is None:
+             return jsonify({"error":"Erreur interne lors de la suppression"}), 500
+        else:
+             return jsonify({"error":"Non trouvée"}), 404
+
+# --- Pipeline du Chat (partagé entre /chat et /chat/stream) ---
+class ChatRequestError(Exception):
+    """Erreur de validation/traitement à renvoyer telle quelle au client."""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def prepare_chat_turn(data):
+    """Valide la requête /chat et prépare l'instruction système, l'historique et le message à envoyer.
+    Pour une continuation, l'historique de référence est relu en base : le client n'envoie
+    que session_id et le nouveau message. Retourne un dict décrivant le tour, ou lève ChatRequestError."""
+    if not data: raise ChatRequestError("Requête JSON vide ou invalide.")
+
+    user_message_input = data.get('message')
+    theme_name = data.get('theme')
+    age_group = data.get('ageGroup')
+    gender = data.get('gender')
+    player_name = data.get('playerName')
+    turn_count = data.get('turnCount')
+    session_id = data.get('session_id')
+
+    logger.debug("/chat Reçu (SessID: %s, Theme: %s, Turns_start: %s)", session_id, theme_name, turn_count)
+    if not user_message_input and session_id:
+         raise ChatRequestError("Message utilisateur manquant pour continuer la session.")
+
+    turn = {
+        "is_starting_message": False,
+        "session_id": session_id,
+        "theme": theme_name, "age_group": age_group, "gender": gender,
+        "player_name": None,
+        "total_turns": 0,
+        "history": [],          # Historique (format client) avant ce tour
+        "user_content": None,   # Message utilisateur tel que sauvegardé (sans rappel de tour)
+        "current_turn": 1,
+        "reminder": "",         # Rappel de tour placé devant le message du joueur
+        "message": user_message_input,
+        "system_instruction": None,
+        "model_history": [],    # Historique rejoué au modèle (éventuellement compacté)
+    }
+
+    # --- Logique de Démarrage (Nouvelle partie) ---
+    if not session_id and theme_name and age_group and gender and player_name and turn_count is not None:
+        turn["is_starting_message"] = True
+        logger.debug("Nouvelle Session Détectée: Thème=%s, Nom=%s, Tours=%s", theme_name, player_name, turn_count)
+
+        # Validations
+        if not player_name or len(player_name.strip()) == 0: raise ChatRequestError("Nom du joueur invalide.")
+        cleaned_player_name = player_name.strip()
+        theme_info = THEME_DATA.get(theme_name) # cite: 9
+        if not theme_info: raise ChatRequestError(f"Thème '{theme_name}' invalide.")
+        try:
+            selected_turn_count = int(turn_count)
+            if not (MIN_TURNS <= selected_turn_count <= MAX_TURNS): raise ValueError()
+        except (ValueError, TypeError): raise ChatRequestError(f"Nombre de tours invalide (doit être entre {MIN_TURNS}-{MAX_TURNS}).")
+        turn["player_name"] = cleaned_player_name
+        turn["total_turns"] = selected_turn_count
+
+        # Construction du Premier Message : seule la partie propre au joueur, le reste est dans l'instruction système
+        name_instruction = PLAYER_NAME_INSTRUCTION_TEMPLATE.format(player_name=cleaned_player_name) # cite: 9
+        turn_instruction = TURN_COUNT_INSTRUCTION_TEMPLATE.format(turn_count=selected_turn_count) # cite: 9
+        kickoff_message = (user_message_input or OPENING_KICKOFF).strip()
+        first_message = "\n\n".join([name_instruction.strip(), turn_instruction.strip(), kickoff_message])
+        logger.debug("Premier message construit (Tours: %s)", selected_turn_count)
+        turn["message"] = first_message
+        turn["user_content"] = first_message
+        turn["system_instruction"] = build_system_instruction(theme_name, age_group, gender)
+
+    # --- Logique de Continuation (Partie existante) ---
+    elif session_id:
+        logger.debug("Continuation Session ID: %s", session_id)
+        if not user_message_input: raise ChatRequestError("Message utilisateur manquant pour continuer la session.")
+        message_to_send_to_ai_raw = user_message_input.strip()
+        turn["user_content"] = message_to_send_to_ai_raw
+
+        # Historique de référence et nombre total de tours prévu : une seule lecture en base
+        with metrics.span("db_read"):
+            session_details = database.get_session_details(session_id, restore=True) # Partie archivée : remise en base pour ce tour
+        if not session_details: raise ChatRequestError("Session non trouvée.", 404)
+        turn["history"] = session_details['history']
+        if session_details.get('initial_turn_count'):
+            total_turns_for_reminder = session_details['initial_turn_count']
         else:
-            session_exists_check = database.get_session_details(session_id) # cite: 10
-            if session_exists_check is None:
-                 return jsonify({"error":"Non trouvée"}), 404
-            else:
-                 return jsonify({"error":"Erreur interne lors de la suppression"}), 500
+             total_turns_for_reminder = 0
+             logger.warning("Attention: Impossible de récupérer initial_turn_count pour session %s", session_id)
+        turn["total_turns"] = total_turns_for_reminder
+
+        # Historique rejoué au modèle (compacté si trop long ; inclut la mise à jour éventuelle du résumé)
+        with metrics.span("history_conversion"):
+            model_history, turn["summary_update"] = compact_history(session_details, turn["history"])
+            # Mode structuré : répliques passées réduites à leur narration, réponses par lettre au choix retenu
+            if STRUCTURED_TURNS: model_history = structured.replay_history(model_history)
+            for entry in model_history:
+                if entry.get("role") and entry.get("content") is not None:
+                    turn["model_history"].append({"role": "user" if entry["role"] == "user" else "assistant", "content": entry["content"]})
+                else: logger.warning("Attention: Entrée historique invalide ignorée: %s", entry)
+
+        # Calculer le tour actuel
+        current_turn = len([msg for msg in turn["history"] if msg.get('role') == 'assistant']) + 1
+        turn["current_turn"] = current_turn
+
+        # Rappel de tour (conclusion forcée en fin de partie) devant le message du joueur
+        turn["reminder"] = build_turn_reminder(current_turn, total_turns_for_reminder)
+        if STRUCTURED_TURNS:
+            # Inventaire tenu par le serveur (dernière sortie structurée) : le modèle n'a pas à le déduire du récit
+            turn["inventory"] = (structured.last_state(turn["history"]) or {}).get("inventory", [])
+            turn["reminder"] = INVENTORY_STATE_TEMPLATE.format(items=", ".join(turn["inventory"]) or "vide") + turn["reminder"]
+        turn["message"] = turn["reminder"] + message_to_send_to_ai_raw
+
+        # Les anciennes parties portent déjà le prompt complet dans leur premier message
+        if session_details.get('theme') in THEME_DATA and not is_legacy_history(turn["history"]):
+            turn["system_instruction"] = build_system_instruction(session_details['theme'], session_details['age_group'], session_details['gender'])
+        logger.debug("Démarrage chat avec %s messages historiques", len(turn['model_history']))
+
+    # --- Cas d'Erreur: Contexte Invalide ---
+    else:
+         logger.warning("Requête invalide: Manque Session ID ou infos Nouvelle Partie complètes")
+         raise ChatRequestError("Requête invalide: Contexte manquant (ni session existante, ni création complète).")
+
+    if not turn["message"]:
+         logger.error("Erreur: Message à envoyer à l'IA est vide avant l'envoi.")
+         raise ChatRequestError("Erreur interne: Message AI vide.", 500)
+    return turn
+
+
+def finish_reply(turn, raw_response):
+    """Réplique à afficher et sauvegarder. En mode structuré, analyse la réponse JSON une seule fois :
+    la réplique devient le texte habituel et l'état du tour (choix, inventaire complet, fin) est
+    conservé dans turn["reply_data"] ; une réponse illisible est gardée telle quelle."""
+    if not STRUCTURED_TURNS: return raw_response
+    inventory = turn.get("inventory", [])
+    with metrics.span("llm_response_parse"):
+        turn_output = structured.parse_turn(raw_response)
+    if turn_output is None:
+        logger.warning("Réponse structurée illisible (SessID: %s), gardée en texte libre", turn["session_id"])
+        turn["reply_data"] = {"choices": list(structured.parse_choices(raw_response).values()), "inventory": inventory, "story_end": False}
+        return raw_response
+    turn["reply_data"] = {
+        "choices": turn_output["choices"],
+        "inventory": structured.apply_inventory(inventory, turn_output),
+        "story_end": turn_output["story_end"],
+    }
+    return structured.render_reply(turn_output)
+
+
+def turn_entries(turn, ai_response):
+    """Les deux messages ajoutés à l'historique par un tour (avec l'état structuré de la réplique s'il y en a un)."""
+    return [
+        {"role": "user", "content": turn["user_content"]},
+        {"role": "assistant", "content": ai_response, "data": turn.get("reply_data")},
+    ]
+
+
+def persist_chat_turn(turn, ai_response):
+    """Sauvegarde le tour en base (création ou ajout des deux nouveaux messages) et retourne l'ID de session.
+    Lève ChatRequestError (409) si la session a avancé depuis sa lecture : le tour n'est pas enregistré."""
+    current_session_id = turn["session_id"]
+    new_entries = turn_entries(turn, ai_response)
+    if turn["is_starting_message"] and turn["player_name"]:
+        new_session_id = database.create_session( # cite: 10
+            turn["player_name"], turn["theme"], turn["age_group"], turn["gender"],
+            turn["total_turns"],
+            new_entries
+        )
+        if not new_session_id:
+            raise ChatRequestError("Erreur lors de la création de la session dans la base de données.", 500)
+        current_session_id = new_session_id
+    elif current_session_id:
+        update_success = database.append_session_turns(current_session_id, len(turn["history"]), new_entries) # cite: 10
+        if not update_success:
+            # Tour concurrent déjà enregistré (autre onglet, autre instance) : ce tour n'est pas sauvegardé
+            raise ChatRequestError("La partie a été modifiée entre-temps, rechargez-la et réessayez.", 409)
+        schedule_summary_update(turn)
+    return current_session_id
+
+
+# --- Tours Spéculatifs ---
+def speculate_next_turns(turn, ai_response, current_session_id):
+    """Après l'envoi d'une réplique, lance en arrière-plan la génération du tour suivant pour chacun
+    des choix A)/B)/C) qu'elle propose (mode SPECULATIVE_TURNS)."""
+    if not speculator or not current_session_id: return
+    if turn["total_turns"] and turn["current_turn"] >= turn["total_turns"]: return # Partie terminée
+    if (turn.get("reply_data") or {}).get("story_end"): return
+    letters = list(structured.entry_choices({"content": ai_response, "data": turn.get("reply_data")}))
+
+    def prepare(letter):
+        with app.app_context():
+            return prepare_chat_turn({"session_id": current_session_id, "message": letter})
+
+    def generate(prepared_turn, letter):
+        letter_turn = dict(prepared_turn, user_content=letter, message=prepared_turn["reminder"] + letter)
+        with admission_controller.admit(queue=False): # Jamais devant les joueurs dans la file
+            raw_response = turn_provider.generate(letter_turn["system_instruction"], letter_turn["model_history"], letter_turn["message"])
+        return letter_turn, finish_reply(letter_turn, raw_response)
+
+    speculator.schedule(current_session_id, letters, prepare, generate)
+
+
+def serve_speculative_turn(data):
+    """Si le message choisit un tour déjà pré-généré, le sauvegarde et retourne (turn, réponse), sinon None.
+    Toute autre requête sur la session abandonne ses tours pré-générés."""
+    if not speculator or not isinstance(data, dict): return None
+    hit = speculator.take(data.get('session_id'), data.get('message'))
+    if not hit: return None
+    turn, ai_response = hit
+    # L'historique a pu avancer ailleurs (autre processus) : l'index déjà occupé fait échouer l'ajout
+    with metrics.span("db_write"):
+        if not database.append_session_turns(turn["session_id"], len(turn["history"]), turn_entries(turn, ai_response)):
+            return None
+    schedule_summary_update(turn)
+    logger.debug("Tour spéculatif servi (SessID: %s, choix %s)", turn["session_id"], turn["user_content"])
+    return turn, ai_response
+
+
+# --- Réserve de Scènes d'Ouverture ---
+def generate_opening(key):
+    """Scène d'ouverture pour (thème, âge, genre), sans nom ni nombre de tours : ceux-ci figurent dans le
+    premier message sauvegardé et sont donc relus par le modèle dès le deuxième tour."""
+    theme_name, age_group, gender = key
+    with admission_controller.admit(queue=False): # Jamais devant les joueurs dans la file
+        return turn_provider.generate(build_system_instruction(theme_name, age_group, gender), [], OPENING_KICKOFF)
+
+opening_pool = openings.OpeningPool(
+    [(theme['name'], age_group, gender) for theme in THEMES for age_group in AGE_INSTRUCTIONS for gender in GENDER_INSTRUCTIONS],
+    generate_opening, depth=OPENING_POOL_DEPTH, ttl_s=OPENING_POOL_TTL_S, max_inflight=OPENING_POOL_MAX_INFLIGHT,
+    start_spread_s=OPENING_POOL_START_SPREAD_S, retry_max_s=OPENING_POOL_RETRY_MAX_S
+) if OPENING_POOL_DEPTH > 0 else None
+if opening_pool: app.before_request(opening_pool.ensure_started) # Remplissage dès la première requête du processus
+
+
+def serve_pooled_opening(data):
+    """Nouvelle partie avec le message déclencheur par défaut : si une ouverture est prête pour sa
+    combinaison, crée la session avec elle et retourne (turn, réponse), sinon None."""
+    if not opening_pool or not isinstance(data, dict) or data.get('session_id'): return None
+    if (data.get('message') or OPENING_KICKOFF).strip() != OPENING_KICKOFF: return None
+    turn = prepare_chat_turn(data)
+    if not turn["is_starting_message"]: return None
+    raw_response = opening_pool.take((turn["theme"], turn["age_group"], turn["gender"]))
+    if raw_response is None: return None
+    ai_response = finish_reply(turn, raw_response)
+    with metrics.span("db_write"):
+        turn["session_id"] = persist_chat_turn(turn, ai_response)
+    logger.debug("Ouverture pré-générée servie (SessID: %s)", turn["session_id"])
+    return turn, ai_response
+
+
+def serve_ready_turn(data):
+    """Tour déjà prêt (choix pré-généré ou scène d'ouverture de la réserve), sauvegardé : (turn, réponse) ou None."""
+    return serve_speculative_turn(data) or serve_pooled_opening(data)
+
+
+# --- Regroupement des Requêtes Identiques ---
+def coalescing_key(data, idempotency_key=None, client=None):
+    """Clé de regroupement d'une requête /chat, retournée avec son caractère rejouable (None : jamais regroupée).
+    Avec une clé d'idempotence (en-tête Idempotency-Key ou champ idempotency_key) : (session, clé), ou
+    (client, clé) pour une nouvelle partie, et le tour terminé reste rejouable. Sans clé, seule une continuation (session_id) est regroupée, sur
+    le client (adresse) et le corps de la requête, et seulement avec les requêtes simultanées (le même choix
+    peut légitimement revenir au tour suivant). Deux nouvelles parties identiques restent deux parties."""
+    if not isinstance(data, dict): return None, False
+    idempotency_key = idempotency_key or data.get('idempotency_key')
+    if idempotency_key:
+        # Nouvelle partie : sans session, la clé seule ne doit jamais rendre la partie d'un autre client
+        scope = str(data['session_id']) if data.get('session_id') else f"client:{client or ''}"
+        return ("key", scope, str(idempotency_key)[:200]), True
+    if not data.get('session_id'): return None, False
+    body = {name: value for name, value in data.items() if name != 'idempotency_key'}
+    return ("body", str(client or ''), json.dumps(body, sort_keys=True, ensure_ascii=False)), False
+
+
+def wait_for_coalesced(future):
+    """Résultat (charge de réponse) du tour identique en cours ou terminé ; relève son erreur éventuelle."""
+    try:
+        return future.result(timeout=COALESCE_WAIT_S)
+    except concurrent.futures.TimeoutError:
+        if future.done(): raise # Erreur du tour lui-même (délai du modèle...)
+        raise ChatRequestError("Un tour identique est toujours en cours, réessayez dans un instant.", 409)
+
+
+def admission_key(turn):
+    """Clé du débit par joueur : la partie en cours, ou le nom du joueur pour un démarrage."""
+    return f"session:{turn['session_id']}" if turn["session_id"] else f"player:{turn['player_name']}"
+
+
+def build_turn_payload(turn, ai_response, current_session_id):
+    """Réponse renvoyée au client : uniquement la nouvelle réplique et l'index du tour."""
+    payload = {
+        "reply": ai_response,
+        "turn": turn["current_turn"],
+        "session_id": current_session_id
+    }
+    if turn.get("reply_data"): payload["state"] = turn["reply_data"] # Mode structuré : choix, inventaire, fin
+    return payload
+
+
+def describe_chat_exception(e):
+    """Traduit une exception du pipeline /chat en (message d'erreur, code HTTP)."""
+    if isinstance(e, ChatRequestError):
+        return e.message, e.status
+    if isinstance(e, llm.BlockedPromptError):
+         logger.warning("Erreur LLM: Prompt Bloqué - %s", e)
+         return "Votre message a été bloqué par les filtres de sécurité.", 400
+    if isinstance(e, llm.GenerationStoppedError):
+         logger.warning("Erreur LLM: Génération Interrompue - %s", e)
+         return "La génération de la réponse IA a été interrompue.", 500
+    if isinstance(e, admission.AdmissionRejected):
+        logger.info("Tour refusé par le contrôle d'admission (%s, Retry-After %ss)", e.reason, e.retry_after)
+        return e.message, e.status
+    if isinstance(e, llm.QuotaExceededError):
+        logger.warning("Erreur LLM: Quota atteint - %s", e)
+        return "Le quota d'utilisation de l'API IA a été atteint, réessayez dans un instant.", 429
+    if isinstance(e, llm.CircuitOpenError):
+        logger.warning("Erreur LLM: Disjoncteur ouvert - %s", e)
+        return "Le service IA est momentanément indisponible, réessayez dans un instant.", 503
+    if isinstance(e, llm.UpstreamTimeoutError):
+        logger.warning("Erreur LLM: Délai dépassé - %s", e)
+        return "Le service IA n'a pas répondu dans les délais.", 504
+    if isinstance(e, database.DB_ERRORS): # cite: 10
+        logger.exception("ERREUR DB (%s) remontée dans /chat: %s", database.BACKEND.name, e)
+        return "Erreur lors de l'accès à la base de données.", 500
+    error_type_name = type(e).__name__
+    logger.exception("ERREUR Inattendue /chat (%s): %s", error_type_name, e)
+    error_message = f"Une erreur interne inattendue est survenue ({error_type_name})."
+    error_str = str(e).lower()
+    if "api key not valid" in error_str: error_message = "Erreur d'authentification avec l'API IA. Vérifiez la clé."
+    elif "model not found" in error_str: error_message = f"Le modèle IA spécifié ('{llm_provider.model_name}') n'a pas été trouvé ou n'est pas disponible."
+    elif "deadline exceeded" in error_str or "timeout" in error_str: error_message = "Le service IA n'a pas répondu dans les délais."
+    elif "resource exhausted" in error_str or "quota" in error_str: error_message = "Le quota d'utilisation de l'API IA a été atteint."
+    return error_message, 500
+
+
+def chat_error_payload(e, session_id):
+    """Charge JSON et code HTTP de l'erreur d'un tour, avec retry_after (secondes) si le client doit patienter."""
+    error_message, status = describe_chat_exception(e)
+    payload = {"error": error_message, "session_id": session_id}
+    if isinstance(e, admission.AdmissionRejected):
+        payload["retry_after"] = e.retry_after
+    elif isinstance(e, llm.QuotaExceededError):
+        payload["retry_after"] = admission_controller.quota_retry_after()
+    elif isinstance(e, llm.CircuitOpenError):
+        payload["retry_after"] = e.retry_after
+    return payload, status
+
+
+def retry_after_headers(payload):
+    """En-tête Retry-After correspondant à une charge d'erreur (vide si sans objet)."""
+    return {"Retry-After": str(payload["retry_after"])} if payload.get("retry_after") else {}
+
 
 # --- Route pour le Chat ---
+def run_chat_turn(data):
+    """Tour complet (tour pré-généré ou appel au modèle, puis sauvegarde) ; retourne la charge de réponse."""
+    speculative = serve_ready_turn(data)
+    if speculative:
+        turn, ai_response = speculative
+        current_session_id = turn["session_id"]
+    else:
+        turn = prepare_chat_turn(data)
+
+        # --- Envoyer à l'IA ---
+        logger.debug("Envoi LLM ('%s...')", turn['message'][:70])
+        with admission_controller.admit(admission_key(turn)), metrics.span("llm_total"):
+            raw_response = turn_provider.generate(turn["system_instruction"], turn["model_history"], turn["message"])
+        ai_response = finish_reply(turn, raw_response)
+
+        # --- Sauvegarde en Base de Données ---
+        with metrics.span("db_write"):
+            current_session_id = persist_chat_turn(turn, ai_response)
+    speculate_next_turns(turn, ai_response, current_session_id)
+    return build_turn_payload(turn, ai_response, current_session_id)
+
+
 @app.route('/chat', methods=['POST'])
 def chat_handler():
     """Gère les échanges de messages avec l'IA pour une session."""
-    if not GEMINI_API_KEY_FROM_ENV or not THEME_DATA:
+    if not chat_backend_ready():
         return jsonify({"error": "Configuration serveur incomplète (API Key ou Thèmes)."}), 500
 
+    started = time.perf_counter()
+    with metrics.span("request_parse"):
+        data = request.get_json(silent=True)
+    session_id = (data or {}).get('session_id')
+    # Une requête identique déjà en cours (ou rejouable) fournit le résultat : pas de seconde génération
+    key, replayable = coalescing_key(data, request.headers.get('Idempotency-Key'), request.remote_addr)
+    future, leader = coalescer.claim(key, replayable)
     try:
-        data = request.json
-        if not data: return jsonify({"error": "Requête JSON vide ou invalide."}), 400
-
-        user_message_input = data.get('message')
-        history_from_client = data.get('history', [])
-        theme_name = data.get('theme')
-        age_group = data.get('ageGroup')
-        gender = data.get('gender')
-        player_name = data.get('playerName')
-        turn_count = data.get('turnCount')
-        session_id = data.get('session_id')
-
-        print(f"--- /chat Reçu (SessID: {session_id}, Theme: {theme_name}, Turns_start: {turn_count}) ---")
-        if not user_message_input and session_id:
-             return jsonify({"error": "Message utilisateur manquant pour continuer la session."}), 400
-
-        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
-        message_to_send_to_ai = user_message_input
-        is_starting_message = False
-        converted_history = []
-        current_session_id = session_id
-        cleaned_player_name = None
-        selected_turn_count = None
-        total_turns_for_reminder = 0
-
-        # --- Logique de Démarrage (Nouvelle partie) ---
-        if not current_session_id and theme_name and age_group and gender and player_name and turn_count is not None:
-            is_starting_message = True
-            print(f"--- Nouvelle Session Détectée: Thème={theme_name}, Nom={player_name}, Tours={turn_count} ---")
-
-            # Validations
-            if not player_name or len(player_name.strip()) == 0: return jsonify({"error": "Nom du joueur invalide."}), 400
-            cleaned_player_name = player_name.strip()
-            theme_info = THEME_DATA.get(theme_name) # cite: 9
-            if not theme_info: return jsonify({"error": f"Thème '{theme_name}' invalide."}), 400
+        if leader:
             try:
-                selected_turn_count = int(turn_count)
-                if not (MIN_TURNS <= selected_turn_count <= MAX_TURNS): raise ValueError()
-                total_turns_for_reminder = selected_turn_count
-            except (ValueError, TypeError): return jsonify({"error": f"Nombre de tours invalide (doit être entre {MIN_TURNS}-{MAX_TURNS})."}), 400
-
-            # Construction du Prompt Initial
-            base_prompt = theme_info['prompt'] # cite: 9
-            age_instruction = AGE_INSTRUCTIONS.get(age_group, AGE_INSTRUCTIONS["Adulte"]) # cite: 9
-            gender_instruction = GENDER_INSTRUCTIONS.get(gender, GENDER_INSTRUCTIONS["Garçon"]) # cite: 9
-            name_instruction = PLAYER_NAME_INSTRUCTION_TEMPLATE.format(player_name=cleaned_player_name) # cite: 9
-            turn_instruction = TURN_COUNT_INSTRUCTION_TEMPLATE.format(turn_count=selected_turn_count) # cite: 9
-
-            final_prompt_parts = [
-                base_prompt, "---", FORMAT_CHOIX_INSTRUCTION, TONE_TWIST_INSTRUCTION, # cite: 9
-                LANGUAGE_INSTRUCTION, IMMERSION_INSTRUCTION, INVENTORY_INSTRUCTION, NPC_INSTRUCTION,# cite: 9
-                age_instruction, gender_instruction, name_instruction, turn_instruction
-            ]
-            final_prompt = "\n\n".join(final_prompt_parts)
-            print(f"--- Prompt initial construit (Tours: {selected_turn_count}) ---")
-            message_to_send_to_ai = final_prompt
-            chat_session = model.start_chat(history=[])
-
-        # --- Logique de Continuation (Partie existante) ---
-        elif current_session_id:
-            print(f"--- Continuation Session ID: {current_session_id} ---")
-            if history_from_client is None: return jsonify({"error": "Historique manquant pour continuer la session."}), 400
-            if not user_message_input: return jsonify({"error": "Message utilisateur manquant pour continuer la session."}), 400
-            message_to_send_to_ai_raw = user_message_input.strip()
-
-            # Convertir l'historique client en format SDK
-            for entry in history_from_client:
-                role = entry.get("role"); content = entry.get("content")
-                if role and content is not None:
-                    sdk_role = "user" if role == "user" else "model"
-                    converted_history.append({'role': sdk_role, 'parts': [content]})
-                else: print(f"!!! Attention: Entrée historique invalide ignorée: {entry}")
-
-            # Récupérer le nombre total de tours prévu
-            session_details = database.get_session_details(current_session_id) # cite: 10
-            if session_details and session_details.get('initial_turn_count'):
-                total_turns_for_reminder = session_details['initial_turn_count']
-            else:
-                 total_turns_for_reminder = 0
-                 print(f"!!! Attention: Impossible de récupérer initial_turn_count pour session {current_session_id}")
-
-            # Calculer le tour actuel
-            current_turn = len([msg for msg in converted_history if msg['role'] == 'model']) + 1
-
-            # *** DÉBUT MODIFICATION POUR CONCLUSION FORCÉE ***
-            # Construire le rappel de tour
-            turn_reminder = ""
-            if total_turns_for_reminder > 0:
-                 # Cas 1: Dépassement du nombre de tours
-                 if current_turn > total_turns_for_reminder:
-                      turn_reminder = f"[Rappel Narrateur : URGENT - Le nombre de tours prévu ({total_turns_for_reminder}) est dépassé (Tour {current_turn}). Conclus l'histoire à ce tour !]\n\n"
-                 # Cas 2: Dans les 3 derniers tours
-                 elif (total_turns_for_reminder - current_turn) <= 3:
-                      turn_reminder = f"[Rappel Narrateur : Tour {current_turn}/{total_turns_for_reminder}. L'aventure doit bientôt se conclure.]\n\n"
-                 # Cas 3: Tours normaux (avant les 3 derniers)
-                 else:
-                      turn_reminder = f"[Rappel Narrateur : Tour {current_turn}/{total_turns_for_reminder}]\n\n"
-
-                 print(f"--- Ajout Rappel Tour: {turn_reminder.strip()} ---")
-                 message_to_send_to_ai = turn_reminder + message_to_send_to_ai_raw
-            else:
-                 # Si pas de total_turns connu, on n'ajoute pas de rappel
-                 message_to_send_to_ai = message_to_send_to_ai_raw
-            # *** FIN MODIFICATION POUR CONCLUSION FORCÉE ***
-
-            print(f"--- Démarrage chat avec {len(converted_history)} messages historiques ---")
-            chat_session = model.start_chat(history=converted_history)
-
-        # --- Cas d'Erreur: Contexte Invalide ---
+                payload = run_chat_turn(data)
+            except Exception as e:
+                coalescer.resolve(key, future, error=e)
+                raise
+            coalescer.resolve(key, future, payload)
         else:
-             print(f"!!! Requête invalide: Manque Session ID ou infos Nouvelle Partie complètes")
-             return jsonify({"error": "Requête invalide: Contexte manquant (ni session existante, ni création complète)."}), 400
+            payload = wait_for_coalesced(future)
+            logger.debug("Tour partagé avec une requête identique (SessID: %s)", payload["session_id"])
 
-        # --- Envoyer à l'IA ---
-        if not message_to_send_to_ai:
-             print("!!! Erreur: Message à envoyer à l'IA est vide avant l'envoi.")
-             return jsonify({"error": "Erreur interne: Message AI vide."}), 500
+        # --- Préparer la réponse JSON ---
+        with metrics.span("response_build"):
+            response = jsonify(payload)
+        logger.debug("Réponse envoyée au client (SessID: %s)", payload["session_id"])
+        status = 200
+        return response
 
-        print(f"--- Envoi Gemini ('{message_to_send_to_ai[:70]}...') ---")
-        response = chat_session.send_message(message_to_send_to_ai)
+    # --- Gestion des Erreurs Spécifiques LLM et Générales ---
+    except Exception as e:
+        payload, status = chat_error_payload(e, session_id)
+        return jsonify(payload), status, retry_after_headers(payload)
+    finally:
+        metrics.observe_stage("turn_total", time.perf_counter() - started)
+        metrics.CHAT_REQUESTS.inc(endpoint="/chat", status=status)
 
-        # --- Traitement Réponse IA ---
-        ai_response = ""
-        try:
-             ai_response = response.text
-             print(f"--- Réponse Gemini reçue (via .text) ---")
-        except Exception as e:
-             print(f"!!! Erreur accès .text réponse Gemini: {e} - Vérification alternative via candidates...")
-             try:
-                 if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
-                     ai_response = " ".join([part.text for part in response.candidates[0].content.parts if hasattr(part, 'text')])
-                     print(f"--- Réponse Gemini reconstruite depuis parts ---")
-                 else:
-                     finish_reason_value = response.candidates[0].finish_reason if response.candidates else 0
-                     finish_reason_enum = None
-                     try: finish_reason_enum = genai.types.FinishReason(finish_reason_value)
-                     except ValueError: pass
-                     finish_reason_name = finish_reason_enum.name if finish_reason_enum else 'UNKNOWN'
-                     print(f"!!! Réponse Gemini non textuelle ou bloquée. Reason: {finish_reason_name} ({finish_reason_value})")
-                     if finish_reason_name == 'SAFETY': ai_response = "[Le contenu de la réponse a été bloqué pour des raisons de sécurité.]"
-                     elif finish_reason_name == 'RECITATION': ai_response = "[Le contenu de la réponse a été bloqué car il s'agissait de récitation.]"
-                     elif finish_reason_name == 'MAX_TOKENS': ai_response = "[La réponse a été coupée car elle était trop longue.]"
-                     else: ai_response = "[Erreur lors de la réception de la réponse de l'IA.]"
-             except Exception as inner_e:
-                 print(f"!!! Erreur interne traitement alternatif réponse Gemini: {inner_e}")
-                 ai_response = "[Erreur interne lors du traitement de la réponse de l'IA.]"
-
-        # --- Préparer l'historique mis à jour pour le client ---
-        updated_history_for_client = []
-        for entry in chat_session.history:
-            if not entry.parts or not hasattr(entry.parts[0], 'text'):
-                print(f"!!! Attention: Entrée historique SDK sans texte valide ignorée: {entry}")
-                continue
-            client_role = "user" if entry.role == "user" else "assistant"
-            client_content = entry.parts[0].text
-            if client_role == "user" and client_content.startswith("[Rappel Narrateur"):
-                 original_message_start = client_content.find("\n\n")
-                 if original_message_start != -1:
-                      client_content = client_content[original_message_start + 2:]
-            updated_history_for_client.append({"role": client_role, "content": client_content})
 
-        # --- Sauvegarde en Base de Données ---
-        if is_starting_message and cleaned_player_name and selected_turn_count is not None:
-            new_session_id = database.create_session( # cite: 10
-                cleaned_player_name, theme_name, age_group, gender,
-                total_turns_for_reminder,
-                updated_history_for_client
-            )
-            if new_session_id:
-                current_session_id = new_session_id
-            else:
-                return jsonify({"error": "Erreur lors de la création de la session dans la base de données."}), 500
-        elif current_session_id:
-            update_success = database.update_session_history(current_session_id, updated_history_for_client) # cite: 10
-            if not update_success:
-                print(f"!!! Échec mise à jour historique session {current_session_id} (erreur loggée dans module DB) !!!")
+def _sse_event(event, payload):
+    """Formate un événement Server-Sent Events avec une charge JSON."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
 
-        # --- Préparer la réponse JSON ---
-        response_payload = {
-            "reply": ai_response,
-            "history": updated_history_for_client,
-            "session_id": current_session_id
-        }
-        print(f"--- Réponse envoyée au client (SessID: {current_session_id}) ---")
-        return jsonify(response_payload)
-
-    # --- Gestion des Erreurs Spécifiques Gemini et Générales ---
-    except genai.types.generation_types.BlockedPromptException as e:
-         print(f"!!! Erreur Gemini: Prompt Bloqué - {e}")
-         return jsonify({"error": "Votre message a été bloqué par les filtres de sécurité.", "history": history_from_client, "session_id": session_id}), 400
-    except genai.types.generation_types.StopCandidateException as e:
-         print(f"!!! Erreur Gemini: Génération Interrompue (StopCandidateException) - {e}")
-         return jsonify({"error": "La génération de la réponse IA a été interrompue.", "history": history_from_client, "session_id": session_id}), 500
-    except sqlite3.Error as db_err: # cite: 10
-        print(f"!!! ERREUR SQLite remontée dans /chat: {db_err} !!!")
-        import traceback; traceback.print_exc()
-        return jsonify({"error": "Erreur lors de l'accès à la base de données.", "history": history_from_client, "session_id": session_id}), 500
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream_handler():
+    """Variante streaming de /chat : transmet les fragments de texte du modèle au fil de l'eau (SSE).
+    Événements émis : 'delta' ({text}), puis 'done' ({reply, turn, session_id}) ou 'error' ({error})."""
+    if not chat_backend_ready():
+        return jsonify({"error": "Configuration serveur incomplète (API Key ou Thèmes)."}), 500
+
+    started = time.perf_counter()
+    with metrics.span("request_parse"):
+        data = request.get_json(silent=True)
+    session_id = (data or {}).get('session_id')
+    key, replayable = coalescing_key(data, request.headers.get('Idempotency-Key'), request.remote_addr)
+    future, leader = coalescer.claim(key, replayable)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+    if not leader:
+        def replay():
+            # Requête identique en cours ou terminée : sa réponse complète est envoyée en un seul fragment
+            status = 200
+            try:
+                payload = wait_for_coalesced(future)
+                yield _sse_event("delta", {"text": payload["reply"]})
+                yield _sse_event("done", payload)
+            except Exception as e:
+                payload, status = chat_error_payload(e, session_id)
+                yield _sse_event("error", dict(payload, status=status))
+            finally:
+                metrics.observe_stage("turn_total", time.perf_counter() - started)
+                metrics.CHAT_REQUESTS.inc(endpoint="/chat/stream", status=status)
+        return Response(stream_with_context(replay()), mimetype="text/event-stream", headers=headers)
+
+    # La validation (et l'admission) se fait avant d'ouvrir le flux pour pouvoir renvoyer un code HTTP classique
+    try:
+        speculative = serve_ready_turn(data)
+        turn = speculative[0] if speculative else prepare_chat_turn(data)
+        slot = None if speculative else admission_controller.admit(admission_key(turn))
     except Exception as e:
-        error_type_name = type(e).__name__
-        print(f"!!! ERREUR Inattendue /chat ({error_type_name}): {e} !!!")
-        import traceback; traceback.print_exc()
-        error_message = f"Une erreur interne inattendue est survenue ({error_type_name})."
-        error_str = str(e).lower()
-        if "api key not valid" in error_str: error_message = "Erreur d'authentification avec l'API IA. Vérifiez la clé."
-        elif "model not found" in error_str: error_message = f"Le modèle IA spécifié ('{GEMINI_MODEL_NAME}') n'a pas été trouvé ou n'est pas disponible."
-        elif "deadline exceeded" in error_str or "timeout" in error_str: error_message = "Le service IA n'a pas répondu dans les délais."
-        elif "resource exhausted" in error_str or "quota" in error_str: error_message = "Le quota d'utilisation de l'API IA a été atteint."
-        return jsonify({"error": error_message, "history": history_from_client, "session_id": session_id}), 500
+        coalescer.resolve(key, future, error=e)
+        payload, status = chat_error_payload(e, session_id)
+        metrics.CHAT_REQUESTS.inc(endpoint="/chat/stream", status=status)
+        return jsonify(payload), status, retry_after_headers(payload)
+
+    def generate():
+        status = 200
+        if speculative:
+            # Tour pré-généré ou ouverture de la réserve (déjà sauvegardé) : envoyé en un seul fragment
+            ai_response = speculative[1]
+            payload = build_turn_payload(turn, ai_response, turn["session_id"])
+            coalescer.resolve(key, future, payload)
+            yield _sse_event("delta", {"text": ai_response})
+            yield _sse_event("done", payload)
+            speculate_next_turns(turn, ai_response, turn["session_id"])
+            metrics.observe_stage("turn_total", time.perf_counter() - started)
+            metrics.CHAT_REQUESTS.inc(endpoint="/chat/stream", status=status)
+            return
+        try:
+            logger.debug("Envoi LLM en streaming ('%s...')", turn['message'][:70])
+            fragments = []
+            narration = structured.NarrationStream() if STRUCTURED_TURNS else None # Seule la narration du JSON est affichée
+            llm_started = time.perf_counter()
+            for fragment in turn_provider.stream(turn["system_instruction"], turn["model_history"], turn["message"]):
+                if not fragments:
+                    metrics.observe_stage("llm_first_token", time.perf_counter() - llm_started)
+                fragments.append(fragment)
+                text = narration.feed(fragment) if narration else fragment
+                if text: yield _sse_event("delta", {"text": text})
+            metrics.observe_stage("llm_total", time.perf_counter() - llm_started)
+            slot.release()
+
+            # Le flux est terminé : la réponse complète est connue
+            ai_response = finish_reply(turn, "".join(fragments))
+            with metrics.span("db_write"):
+                current_session_id = persist_chat_turn(turn, ai_response)
+            logger.debug("Flux terminé et sauvegardé (SessID: %s)", current_session_id)
+            payload = build_turn_payload(turn, ai_response, current_session_id)
+            coalescer.resolve(key, future, payload)
+            yield _sse_event("done", payload)
+            speculate_next_turns(turn, ai_response, current_session_id)
+        except Exception as e:
+            slot.release(e)
+            coalescer.resolve(key, future, error=e)
+            payload, status = chat_error_payload(e, session_id)
+            yield _sse_event("error", dict(payload, status=status))
+        finally:
+            slot.release()
+            # Flux abandonné par le client : les requêtes identiques en attente ne doivent pas rester bloquées
+            coalescer.resolve(key, future, error=ChatRequestError("Le tour a été interrompu avant la fin, réessayez.", 503))
+            metrics.observe_stage("turn_total", time.perf_counter() - started)
+            metrics.CHAT_REQUESTS.inc(endpoint="/chat/stream", status=status)
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+    if slot: response.call_on_close(slot.release) # Flux jamais parcouru (client parti) : la place est rendue
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métriques du processus au format Prometheus (durées par étape du pipeline, requêtes de chat)."""
+    return Response(metrics.render_prometheus(), mimetype=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+@app.after_request
+def compress_json_response(response):
+    """Compresse en gzip les réponses JSON volumineuses si le client l'accepte (les flux SSE sont exclus)."""
+    if (not RESPONSE_COMPRESSION_MIN_BYTES or response.mimetype != 'application/json'
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.headers.get('Accept-Encoding', '').lower():
+        return response
+    data = response.get_data()
+    if len(data) < RESPONSE_COMPRESSION_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
 
 
 # --- Démarrage de l'application ---
 if __name__ == '__main__':
-    if not GEMINI_API_KEY_FROM_ENV or not THEME_DATA:
-        print("\n*****************************************************************")
-        print("*** ERREUR CRITIQUE: Configuration API Key ou Thèmes manquante. ***")
-        print("*** Le serveur ne peut pas démarrer correctement.             ***")
-        print("*****************************************************************\n")
+    if not chat_backend_ready():
+        logger.critical("ERREUR CRITIQUE: Configuration API Key ou Thèmes manquante. Le serveur ne peut pas démarrer correctement.")
     else:
         port_to_use = int(os.getenv('PORT', 5002))
         debug_mode = os.getenv('FLASK_DEBUG', 'false').lower() in ('true', '1', 't')
         use_reloader = os.getenv('FLASK_USE_RELOADER', str(debug_mode)).lower() in ('true', '1', 't')
 
-        print(f"--- Serveur Flask prêt ---")
-        print(f"    Mode Debug: {'Activé' if debug_mode else 'Désactivé'}")
-        print(f"    Reloader: {'Activé' if use_reloader else 'Désactivé'}")
-        print(f"    Accès via: http://127.0.0.1:{port_to_use} ou http://0.0.0.0:{port_to_use}")
+        logger.info("Serveur Flask prêt (Mode Debug: %s, Reloader: %s)",
+                    'Activé' if debug_mode else 'Désactivé', 'Activé' if use_reloader else 'Désactivé')
+        logger.info("Accès via: http://127.0.0.1:%s ou http://0.0.0.0:%s", port_to_use, port_to_use)
         app.run(host='0.0.0.0', port=port_to_use, debug=debug_mode, use_reloader=use_reloader)
 
 # --- FIN app.py ---
\ No newline at end of file
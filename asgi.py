@@ -0,0 +1,256 @@
+# asgi.py
+# Point d'entrée ASGI (mode asyncio) : une seule boucle par processus peut servir
+# des centaines d'appels Gemini en vol au lieu d'un par worker synchrone.
+#
+#   uvicorn asgi:application --host 0.0.0.0 --port 5002 --workers 2
+#
+# /chat et /chat/stream sont traités nativement en asyncio (appels async du backend LLM),
+# les accès SQLite passent par database.run_async (pool de threads dédié),
+# toutes les autres routes sont déléguées à l'application Flask (WSGI).
+import json
+import time
+import asyncio
+import logging
+
+from asgiref.wsgi import WsgiToAsgi
+
+import database
+import metrics
+import structured
+from app import (
+    app, turn_provider, chat_backend_ready, prepare_chat_turn, persist_chat_turn, finish_reply, STRUCTURED_TURNS,
+    serve_ready_turn, speculate_next_turns, build_turn_payload, _sse_event,
+    coalescer, coalescing_key, ChatRequestError, COALESCE_WAIT_S,
+    admission_controller, admission_key, chat_error_payload, retry_after_headers
+)
+
+_wsgi_application = WsgiToAsgi(app)
+logger = logging.getLogger(__name__)
+
+
+# --- Utilitaires ASGI ---
+async def _read_body(receive):
+    """Lit le corps complet de la requête HTTP."""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+async def _send_json(send, payload, status=200, headers=None):
+    """Envoie une réponse JSON complète (en-têtes supplémentaires éventuels : {nom: valeur})."""
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json; charset=utf-8"),
+            (b"content-length", str(len(body)).encode()),
+        ] + [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _start_event_stream(send):
+    """Ouvre une réponse Server-Sent Events."""
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ],
+    })
+
+
+async def _send_event(send, event, payload):
+    await send({"type": "http.response.body", "body": _sse_event(event, payload).encode("utf-8"), "more_body": True})
+
+
+# --- Gestionnaire asynchrone du Chat ---
+async def chat_handler_async(scope, receive, send, stream=False):
+    """Équivalent asyncio de /chat (et /chat/stream si stream=True)."""
+    if not chat_backend_ready():
+        await _send_json(send, {"error": "Configuration serveur incomplète (API Key ou Thèmes)."}, 500)
+        return
+
+    started = time.perf_counter()
+    status = await _chat_turn_async(scope, receive, send, stream)
+    metrics.observe_stage("turn_total", time.perf_counter() - started)
+    metrics.CHAT_REQUESTS.inc(endpoint="/chat/stream" if stream else "/chat", status=status)
+
+
+def _header(scope, name):
+    """Valeur d'un en-tête de la requête (nom en minuscules), ou None."""
+    for header_name, value in scope.get("headers", ()):
+        if header_name == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _wait_for_coalesced(future):
+    """Équivalent asyncio de app.wait_for_coalesced (la future partagée n'est jamais annulée)."""
+    try:
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), COALESCE_WAIT_S)
+    except asyncio.TimeoutError:
+        if future.done(): raise
+        raise ChatRequestError("Un tour identique est toujours en cours, réessayez dans un instant.", 409)
+
+
+async def _chat_turn_async(scope, receive, send, stream):
+    """Traite un tour et envoie la réponse ; retourne le code HTTP (celui de l'erreur éventuelle en streaming).
+    Une requête identique déjà en cours (ou rejouable) fournit le résultat sans nouvelle génération."""
+    with metrics.span("request_parse"):
+        try:
+            data = json.loads(await _read_body(receive) or b"null")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            data = None
+    if not isinstance(data, dict):
+        data = None
+    session_id = (data or {}).get('session_id')
+
+    key, replayable = coalescing_key(data, _header(scope, b"idempotency-key"), (scope.get("client") or ("",))[0])
+    future, leader = coalescer.claim(key, replayable)
+    if leader:
+        try:
+            return await _run_chat_turn_async(data, session_id, send, stream, key, future)
+        finally:
+            # Connexion coupée en cours de tour : les requêtes identiques en attente ne restent pas bloquées
+            coalescer.resolve(key, future, error=ChatRequestError("Le tour a été interrompu avant la fin, réessayez.", 503))
+
+    try:
+        payload = await _wait_for_coalesced(future)
+    except Exception as e:
+        payload, status = chat_error_payload(e, session_id)
+        if not stream:
+            await _send_json(send, payload, status, retry_after_headers(payload))
+        else:
+            await _start_event_stream(send)
+            await _send_event(send, "error", dict(payload, status=status))
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        return status
+    if not stream:
+        await _send_json(send, payload)
+    else:
+        await _start_event_stream(send)
+        await _send_event(send, "delta", {"text": payload["reply"]})
+        await _send_event(send, "done", payload)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+    return 200
+
+
+async def _run_chat_turn_async(data, session_id, send, stream, key, future):
+    """Tour exécuté par cette requête ; le résultat (ou l'erreur) est publié aux requêtes identiques."""
+    try:
+        # Tour pré-généré (attente éventuelle de sa fin) ou préparation : lectures en base, hors de la boucle
+        speculative = await database.run_async(app, serve_ready_turn, data)
+        turn = speculative[0] if speculative else await database.run_async(app, prepare_chat_turn, data)
+        # Place vers l'API amont (attente éventuelle dans la file, sans bloquer la boucle)
+        slot = None if speculative else await admission_controller.admit_async(admission_key(turn))
+    except Exception as e:
+        coalescer.resolve(key, future, error=e)
+        payload, status = chat_error_payload(e, session_id)
+        await _send_json(send, payload, status, retry_after_headers(payload))
+        return status
+
+    try:
+        return await _generate_and_send(turn, speculative, session_id, send, stream, key, future, slot)
+    finally:
+        if slot: slot.release()
+
+
+async def _generate_and_send(turn, speculative, session_id, send, stream, key, future, slot):
+    """Génère la réponse (ou envoie le tour pré-généré), la sauvegarde et l'envoie au client."""
+    if speculative:
+        ai_response = speculative[1]
+        speculate_next_turns(turn, ai_response, turn["session_id"])
+        payload = build_turn_payload(turn, ai_response, turn["session_id"])
+        coalescer.resolve(key, future, payload)
+        if not stream:
+            await _send_json(send, payload)
+        else:
+            await _start_event_stream(send)
+            await _send_event(send, "delta", {"text": ai_response})
+            await _send_event(send, "done", payload)
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        return 200
+
+    if not stream:
+        try:
+            logger.debug("Envoi LLM async ('%s...')", turn['message'][:70])
+            with slot, metrics.span("llm_total"):
+                raw_response = await turn_provider.generate_async(turn["system_instruction"], turn["model_history"], turn["message"])
+            ai_response = finish_reply(turn, raw_response)
+            with metrics.span("db_write"):
+                current_session_id = await database.run_async(app, persist_chat_turn, turn, ai_response)
+        except Exception as e:
+            coalescer.resolve(key, future, error=e)
+            payload, status = chat_error_payload(e, session_id)
+            await _send_json(send, payload, status, retry_after_headers(payload))
+            return status
+        speculate_next_turns(turn, ai_response, current_session_id)
+        with metrics.span("response_build"):
+            payload = build_turn_payload(turn, ai_response, current_session_id)
+        coalescer.resolve(key, future, payload)
+        await _send_json(send, payload)
+        return 200
+
+    await _start_event_stream(send)
+    try:
+        logger.debug("Envoi LLM async en streaming ('%s...')", turn['message'][:70])
+        fragments = []
+        narration = structured.NarrationStream() if STRUCTURED_TURNS else None # Seule la narration du JSON est affichée
+        llm_started = time.perf_counter()
+        async for fragment in turn_provider.stream_async(turn["system_instruction"], turn["model_history"], turn["message"]):
+            if not fragments:
+                metrics.observe_stage("llm_first_token", time.perf_counter() - llm_started)
+            fragments.append(fragment)
+            text = narration.feed(fragment) if narration else fragment
+            if text: await _send_event(send, "delta", {"text": text})
+        metrics.observe_stage("llm_total", time.perf_counter() - llm_started)
+        slot.release()
+
+        ai_response = finish_reply(turn, "".join(fragments))
+        with metrics.span("db_write"):
+            current_session_id = await database.run_async(app, persist_chat_turn, turn, ai_response)
+        payload = build_turn_payload(turn, ai_response, current_session_id)
+        coalescer.resolve(key, future, payload)
+        await _send_event(send, "done", payload)
+        speculate_next_turns(turn, ai_response, current_session_id)
+        status = 200
+    except Exception as e:
+        slot.release(e)
+        coalescer.resolve(key, future, error=e)
+        payload, status = chat_error_payload(e, session_id)
+        await _send_event(send, "error", dict(payload, status=status))
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+    return status
+
+
+async def _lifespan(receive, send):
+    """Protocole lifespan minimal : l'app Flask est initialisée à l'import, l'arrêt écrit les tours en attente."""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            database.flush_pending_writes() # Tours en file d'écriture différée
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    """Application ASGI : routes de chat en asyncio, le reste via l'app Flask."""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in ("/chat", "/chat/stream"):
+        await chat_handler_async(scope, receive, send, stream=scope["path"] == "/chat/stream")
+        return
+    await _wsgi_application(scope, receive, send)
+
+# --- FIN asgi.py ---
@@ -0,0 +1,80 @@
+# bench/loadtest.py
+# Test de charge : lance N aventures concurrentes (démarrage + continuations) contre un
+# serveur en cours d'exécution et mesure débit et latences par tour.
+#
+#   LLM_PROVIDER=mock MOCK_LLM_LATENCY_MS=1500 uvicorn asgi:application --port 5002 &
+#   python bench/loadtest.py --url http://127.0.0.1:5002 --concurrency 200 --turns 3
+#
+# Attention : contre un vrai backend (Gemini...), chaque tour consomme du quota.
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import aiohttp
+
+
+def percentile(values, pct):
+    """Percentile simple (plus proche rang) d'une liste de valeurs."""
+    if not values: return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def play_adventure(http, base_url, turns, latencies, errors):
+    """Joue une aventure complète : un démarrage puis `turns` continuations.
+    Chaque tour porte sa propre clé d'idempotence, comme le client web : des joueurs distincts ne sont jamais regroupés."""
+    payload = {
+        "theme": "Fantasy Médiévale", "ageGroup": "Adulte", "gender": "Fille",
+        "playerName": "Charge", "turnCount": 10, "message": "Commence l'aventure."
+    }
+    session_id = None
+    for turn_index in range(turns + 1):
+        if turn_index > 0:
+            payload = {"session_id": session_id, "message": "A"}
+        started = time.perf_counter()
+        try:
+            async with http.post(f"{base_url}/chat", json=payload, headers={"Idempotency-Key": uuid.uuid4().hex}) as response:
+                data = await response.json()
+                if response.status != 200:
+                    errors.append(f"{response.status}: {data.get('error')}")
+                    return
+        except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+            errors.append(type(e).__name__)
+            return
+        latencies.append(time.perf_counter() - started)
+        session_id = data.get("session_id")
+
+
+async def run(args):
+    latencies, errors = [], []
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as http:
+        await asyncio.gather(*[
+            play_adventure(http, args.url.rstrip('/'), args.turns, latencies, errors)
+            for _ in range(args.concurrency)
+        ])
+    elapsed = time.perf_counter() - started
+
+    print(f"Aventures concurrentes : {args.concurrency} ({args.turns} continuations chacune)")
+    print(f"Tours réussis         : {len(latencies)} en {elapsed:.2f}s ({len(latencies) / elapsed:.1f} tours/s)")
+    if latencies:
+        print(f"Latence par tour      : moy {statistics.mean(latencies) * 1000:.0f}ms | "
+              f"p50 {percentile(latencies, 50) * 1000:.0f}ms | p95 {percentile(latencies, 95) * 1000:.0f}ms | "
+              f"p99 {percentile(latencies, 99) * 1000:.0f}ms")
+    if errors:
+        print(f"Erreurs               : {len(errors)} (ex: {errors[:3]})")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Test de charge du endpoint /chat.")
+    parser.add_argument('--url', default='http://127.0.0.1:5002', help="URL de base du serveur")
+    parser.add_argument('--concurrency', type=int, default=100, help="Nombre d'aventures simultanées")
+    parser.add_argument('--turns', type=int, default=3, help="Continuations par aventure (après le démarrage)")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Timeout total par requête (s)")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,258 @@
+# bench/pipeline_bench.py
+# Benchmark reproductible du pipeline /chat côté serveur : parties complètes simulées
+# (démarrage + N continuations) via le client de test Flask, backend LLM remplacé par le
+# fournisseur "mock" (latence nulle par défaut). Mesure le surcoût serveur par tour et par étape
+# (lecture JSON, lecture DB, préparation/conversion de l'historique, écriture DB, réponse)
+# en p50/p95/p99, pour plusieurs longueurs de partie et niveaux de concurrence.
+#
+#   python bench/pipeline_bench.py                                  # 10/20/100 tours x 1/4/16 sessions
+#   python bench/pipeline_bench.py --turns 20 --concurrency 8 --games 3
+#   python bench/pipeline_bench.py --compare bench/results/<fichier>.json --fail-threshold 0.25
+#
+# Les résultats sont enregistrés en JSON dans bench/results/ (nommés d'après le commit courant)
+# pour comparer les régressions d'un commit à l'autre.
+import argparse
+import datetime
+import functools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, 'bench', 'results')
+STAGES = ["total", "request_parse", "db_read", "summary", "prepare", "llm", "db_write", "response", "overhead"]
+
+
+def percentile(values, pct):
+    """Percentile simple (plus proche rang) d'une liste de valeurs."""
+    if not values: return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def describe(values):
+    """Statistiques (en ms) d'une liste de durées en secondes."""
+    return {
+        "count": len(values),
+        "mean": statistics.mean(values) * 1000 if values else 0.0,
+        "p50": percentile(values, 50) * 1000,
+        "p95": percentile(values, 95) * 1000,
+        "p99": percentile(values, 99) * 1000,
+    }
+
+
+def git_revision():
+    """Commit courant (court) et état du répertoire de travail, pour nommer les résultats."""
+    try:
+        sha = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT_DIR, text=True).strip())
+        return sha + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'inconnu'
+
+
+# --- Chargement de l'application avec le backend mock ---
+def load_app(mock_latency_ms, db_dir):
+    """Importe app.py avec le fournisseur LLM mock et une base SQLite vierge dans db_dir.
+    Tout est configuré avant l'import : app.py crée son dossier d'instance en se chargeant."""
+    os.environ['INSTANCE_PATH'] = db_dir # Jamais de instance/ (ni d'archive) dans le dépôt
+    os.environ['LLM_PROVIDER'] = 'mock'
+    os.environ.pop('LLM_FALLBACK_PROVIDER', None)
+    os.environ['MOCK_LLM_LATENCY_MS'] = str(mock_latency_ms)
+    os.environ['MOCK_LLM_FIRST_CHUNK_MS'] = '0'
+    os.environ.setdefault('LOG_LEVEL', 'ERROR') # Les journaux par tour fausseraient les mesures
+    os.environ.setdefault('PLAYER_RATE_PER_MINUTE', '0') # Les parties simulées enchaînent les tours sans pause
+    sys.path.insert(0, ROOT_DIR)
+    import app as app_module
+    app_module.database.init_db(app_module.app)
+    return app_module
+
+
+class StageTimer:
+    """Chronométrage par étape : chaque thread accumule les durées du tour en cours."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def start_turn(self):
+        self._local.spans = dict.fromkeys(STAGES, 0.0)
+
+    def spans(self):
+        return self._local.spans
+
+    def wrap(self, stage, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                spans = getattr(self._local, 'spans', None)
+                if spans is not None:
+                    spans[stage] += time.perf_counter() - started
+        return timed
+
+
+def instrument(app_module, timer):
+    """Enveloppe les étapes du pipeline /chat (les routes les appellent par leur nom de module)."""
+    database = app_module.database
+    request_class = app_module.app.request_class
+    request_class.get_json = timer.wrap("request_parse", request_class.get_json)
+    database.get_session_details = timer.wrap("db_read", database.get_session_details)
+    app_module.summarize_history = timer.wrap("summary", app_module.summarize_history)
+    app_module.prepare_chat_turn = timer.wrap("prepare", app_module.prepare_chat_turn)
+    provider = app_module.llm_provider
+    provider.generate = timer.wrap("llm", provider.generate)
+    app_module.persist_chat_turn = timer.wrap("db_write", app_module.persist_chat_turn)
+
+
+# --- Parties simulées ---
+def play_game(client, timer, continuations, samples, errors):
+    """Une partie : démarrage puis `continuations` tours, en choisissant toujours A.
+    Chaque tour porte sa propre clé d'idempotence, comme le client web : les parties simultanées ne sont jamais regroupées."""
+    payload = {
+        "theme": "Fantasy Médiévale", "ageGroup": "Adulte", "gender": "Fille",
+        "playerName": "Bench", "turnCount": 10, "message": "Commence l'aventure."
+    }
+    session_id = None
+    for turn_index in range(continuations + 1):
+        if turn_index > 0:
+            payload = {"session_id": session_id, "message": "A"}
+        timer.start_turn()
+        started = time.perf_counter()
+        response = client.post('/chat', json=payload, headers={'Idempotency-Key': uuid.uuid4().hex})
+        total = time.perf_counter() - started
+        if response.status_code != 200:
+            errors.append(f"{response.status_code}: {response.get_json().get('error')}")
+            return
+        session_id = response.get_json()["session_id"]
+        if turn_index == 0:
+            continue # Le démarrage n'a pas d'historique : seules les continuations sont mesurées
+        spans = timer.spans()
+        spans["total"] = total
+        # "prepare" inclut la lecture DB et le résumé : on ne garde que la part propre à la préparation
+        spans["prepare"] = max(0.0, spans["prepare"] - spans["db_read"] - spans["summary"])
+        measured = spans["request_parse"] + spans["db_read"] + spans["summary"] + spans["prepare"] + spans["llm"] + spans["db_write"]
+        spans["response"] = max(0.0, total - measured) # Routage Flask, jsonify, contexte applicatif
+        spans["overhead"] = max(0.0, total - spans["llm"])
+        samples.append(dict(spans))
+
+
+def run_scenario(app_module, timer, continuations, concurrency, games):
+    """Lance `concurrency` threads jouant chacun `games` parties ; retourne les stats par étape."""
+    samples, errors = [], []
+
+    def worker():
+        client = app_module.app.test_client()
+        for _ in range(games):
+            play_game(client, timer, continuations, samples, errors)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "continuations": continuations,
+        "concurrency": concurrency,
+        "games": games * concurrency,
+        "turns": len(samples),
+        "elapsed_s": elapsed,
+        "turns_per_s": len(samples) / elapsed if elapsed else 0.0,
+        "errors": errors[:5],
+        "error_count": len(errors),
+        "stages": {stage: describe([sample[stage] for sample in samples]) for stage in STAGES},
+    }
+
+
+# --- Rapport et comparaison ---
+def scenario_key(scenario):
+    return f"{scenario['continuations']} tours x {scenario['concurrency']} sessions"
+
+
+def print_scenario(scenario):
+    print(f"\n--- {scenario_key(scenario)} : {scenario['turns']} tours mesurés, "
+          f"{scenario['turns_per_s']:.1f} tours/s, {scenario['error_count']} erreurs ---")
+    print(f"    {'étape':<14}{'moy':>9}{'p50':>9}{'p95':>9}{'p99':>9}   (ms)")
+    for stage in STAGES:
+        stats = scenario["stages"][stage]
+        print(f"    {stage:<14}{stats['mean']:>9.2f}{stats['p50']:>9.2f}{stats['p95']:>9.2f}{stats['p99']:>9.2f}")
+    if scenario["errors"]:
+        print(f"    !!! Erreurs (ex: {scenario['errors']}) !!!")
+
+
+def compare(results, baseline, threshold):
+    """Compare le p95 du surcoût serveur et des étapes DB à une référence ; retourne le nombre de régressions."""
+    baseline_by_key = {scenario_key(s): s for s in baseline["scenarios"]}
+    regressions = 0
+    print(f"\n--- Comparaison avec {baseline['revision']} ({baseline['date']}), seuil +{threshold:.0%} sur le p95 ---")
+    for scenario in results["scenarios"]:
+        reference = baseline_by_key.get(scenario_key(scenario))
+        if not reference:
+            print(f"    {scenario_key(scenario)} : absent de la référence")
+            continue
+        for stage in ("overhead", "db_read", "prepare", "db_write"):
+            before = reference["stages"][stage]["p95"]
+            after = scenario["stages"][stage]["p95"]
+            delta = (after - before) / before if before else 0.0
+            flag = ""
+            if delta > threshold and after - before > 0.05: # Ignore le bruit sous 50 µs
+                flag = "  <-- RÉGRESSION"
+                regressions += 1
+            print(f"    {scenario_key(scenario):<24}{stage:<10}{before:>8.2f} -> {after:>8.2f} ms ({delta:+.0%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du surcoût serveur du pipeline /chat (backend LLM mock).")
+    parser.add_argument('--turns', type=int, nargs='+', default=[10, 20, 100], help="Continuations par partie (longueurs d'historique)")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help="Sessions jouées simultanément")
+    parser.add_argument('--games', type=int, default=2, help="Parties par session simultanée et par scénario")
+    parser.add_argument('--mock-latency-ms', type=int, default=0, help="Latence simulée du modèle")
+    parser.add_argument('--output', help="Fichier de résultats (défaut : bench/results/<date>-<commit>.json)")
+    parser.add_argument('--compare', help="Fichier de résultats de référence à comparer")
+    parser.add_argument('--fail-threshold', type=float, default=0.25, help="Hausse relative du p95 considérée comme régression")
+    args = parser.parse_args()
+
+    revision = git_revision()
+    with tempfile.TemporaryDirectory(prefix='chat-bench-') as db_dir:
+        app_module = load_app(args.mock_latency_ms, db_dir)
+        timer = StageTimer()
+        instrument(app_module, timer)
+        scenarios = []
+        for continuations in args.turns:
+            for concurrency in args.concurrency:
+                scenario = run_scenario(app_module, timer, continuations, concurrency, args.games)
+                print_scenario(scenario)
+                scenarios.append(scenario)
+
+    now = datetime.datetime.now()
+    results = {
+        "revision": revision,
+        "date": now.isoformat(timespec='seconds'),
+        "python": sys.version.split()[0],
+        "mock_latency_ms": args.mock_latency_ms,
+        "scenarios": scenarios,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{now:%Y%m%d-%H%M%S}-{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\n--- Résultats enregistrés : {output} ---")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.fail_threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
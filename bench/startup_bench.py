@@ -0,0 +1,121 @@
+# bench/startup_bench.py
+# Benchmark du démarrage à froid d'un worker : chaque mesure lance un nouvel interpréteur qui
+# importe app.py puis sert une première requête (GET /sessions), comme un worker gunicorn
+# fraîchement créé. Compare deux modes de démarrage :
+#   - eager : SDK du modèle importé et migration du schéma à l'import (LLM_PRELOAD_SDK=true, DB_AUTO_MIGRATE=true) ;
+#   - lazy  : SDK importé au premier appel, migration par `flask migrate-db` (réglages de gunicorn.conf.py).
+#
+#   python bench/startup_bench.py                       # 10 démarrages par mode, backend gemini si le SDK est installé
+#   python bench/startup_bench.py --runs 20 --provider litellm
+#
+# Sans clé d'API, une clé factice est utilisée : aucun appel réseau n'a lieu au démarrage.
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SDK_MODULES = {"gemini": "google.generativeai", "litellm": "litellm"}
+MODES = {
+    "eager": {"LLM_PRELOAD_SDK": "true", "DB_AUTO_MIGRATE": "true"},
+    "lazy": {"LLM_PRELOAD_SDK": "false", "DB_AUTO_MIGRATE": "false"},
+}
+
+# Exécuté dans chaque interpréteur mesuré
+CHILD_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/sessions')
+served = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - started, "first_request_s": served - imported, "status": response.status_code,
+    "sdk_loaded": any(name in sys.modules for name in %r),
+}))
+"""
+
+
+def percentile(values, pct):
+    """Percentile simple (plus proche rang) d'une liste de valeurs."""
+    if not values: return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def sdk_available(provider):
+    module = SDK_MODULES.get(provider)
+    try:
+        return module is not None and importlib.util.find_spec(module) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def start_worker(env):
+    """Lance un interpréteur qui importe l'application et sert une requête ; retourne ses mesures."""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT % (tuple(SDK_MODULES.values()),)],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"Démarrage en échec : {completed.stderr.strip()[-500:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_s"] = elapsed
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du démarrage à froid d'un worker (import de app.py + première requête).")
+    parser.add_argument('--runs', type=int, default=10, help="Démarrages mesurés par mode")
+    parser.add_argument('--provider', default='gemini', choices=['gemini', 'litellm', 'mock'], help="Backend LLM chargé")
+    parser.add_argument('--output', help="Fichier JSON où enregistrer les résultats")
+    args = parser.parse_args()
+
+    provider = args.provider
+    if provider != 'mock' and not sdk_available(provider):
+        print(f"SDK du backend '{provider}' non installé : mesure avec le backend mock (seule la migration est comparée).")
+        provider = 'mock'
+
+    results = {"provider": provider, "runs": args.runs, "python": sys.version.split()[0], "modes": {}}
+    with tempfile.TemporaryDirectory(prefix='chat-startup-') as instance_dir:
+        base_env = dict(os.environ, INSTANCE_PATH=instance_dir, LLM_PROVIDER=provider, LOG_LEVEL='ERROR')
+        base_env.pop('LLM_FALLBACK_PROVIDER', None)
+        base_env.setdefault('GEMINI_API_KEY', 'cle-factice-benchmark')
+        base_env.setdefault('LITELLM_MODEL', 'gpt-4o-mini')
+        start_worker(dict(base_env, **MODES["eager"])) # Crée la base (et chauffe le cache disque) avant les mesures
+
+        for mode, overrides in MODES.items():
+            samples = [start_worker(dict(base_env, **overrides)) for _ in range(args.runs)]
+            stats = {
+                metric: {"p50": statistics.median(s[metric] for s in samples) * 1000,
+                         "p95": percentile([s[metric] for s in samples], 95) * 1000}
+                for metric in ("import_s", "first_request_s", "process_s")
+            }
+            stats["sdk_loaded"] = samples[0]["sdk_loaded"]
+            results["modes"][mode] = stats
+
+    print(f"\n--- Démarrage à froid ({provider}, {args.runs} démarrages par mode) ---")
+    print(f"    {'mode':<8}{'import p50':>12}{'p95':>9}{'1re req p50':>13}{'processus p50':>15}{'p95':>9}   (ms)   SDK chargé")
+    for mode, stats in results["modes"].items():
+        print(f"    {mode:<8}{stats['import_s']['p50']:>12.1f}{stats['import_s']['p95']:>9.1f}"
+              f"{stats['first_request_s']['p50']:>13.1f}{stats['process_s']['p50']:>15.1f}{stats['process_s']['p95']:>9.1f}"
+              f"   {'oui' if stats['sdk_loaded'] else 'non'}")
+    eager, lazy = results["modes"]["eager"]["process_s"]["p50"], results["modes"]["lazy"]["process_s"]["p50"]
+    print(f"    Gain du mode lazy : {eager - lazy:.1f} ms ({(eager - lazy) / eager:.0%}) par démarrage de worker")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n--- Résultats enregistrés : {args.output} ---")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# coalescing.py
+# Regroupement des requêtes /chat identiques : quand le client (ou le joueur) renvoie un tour
+# pendant que le premier est encore en cours, une seule génération a lieu et toutes les requêtes
+# en attente reçoivent le même résultat. Avec une clé d'idempotence (en-tête Idempotency-Key),
+# le résultat d'un tour terminé est aussi conservé quelques minutes pour être rejoué à l'identique.
+# L'état est propre au processus.
+import time
+import logging
+import threading
+import collections
+import concurrent.futures
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+COALESCING_EVENTS = metrics.Counter(
+    "chat_coalescing_total", "Tours de chat : executed (génération), joined (attente d'un tour identique), replayed (rejeu).",
+    labelnames=("outcome",)
+)
+
+
+class TurnCoalescer:
+    """Tours en cours par clé (partagés entre requêtes identiques) et résultats récents rejouables."""
+
+    def __init__(self, ttl_s=120, max_entries=1024):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._inflight = {} # clé -> (Future, rejouable)
+        self._done = collections.OrderedDict() # clé -> (expiration, résultat), du plus ancien au plus récent
+        self._lock = threading.Lock()
+
+    def claim(self, key, replayable=False):
+        """Retourne (future, leader). Le leader calcule le tour puis appelle resolve() ; les autres
+        attendent la future (déjà résolue pour un rejeu). Sans clé, chaque requête est son propre leader."""
+        if key is None:
+            return concurrent.futures.Future(), True
+        with self._lock:
+            done = self._done.get(key)
+            if done is not None and done[0] > time.monotonic():
+                COALESCING_EVENTS.inc(outcome="replayed")
+                future = concurrent.futures.Future()
+                future.set_result(done[1])
+                return future, False
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                COALESCING_EVENTS.inc(outcome="joined")
+                return inflight[0], False
+            future = concurrent.futures.Future()
+            self._inflight[key] = (future, replayable)
+        COALESCING_EVENTS.inc(outcome="executed")
+        return future, True
+
+    def resolve(self, key, future, result=None, error=None):
+        """Publie le résultat (ou l'erreur) du leader ; seuls les succès rejouables sont conservés."""
+        if key is not None:
+            with self._lock:
+                inflight = self._inflight.get(key)
+                if inflight is not None and inflight[0] is future:
+                    del self._inflight[key]
+                    if error is None and inflight[1] and self.max_entries > 0:
+                        self._done[key] = (time.monotonic() + self.ttl_s, result)
+                        self._done.move_to_end(key)
+                        self._evict()
+        if future.done(): return
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def _evict(self):
+        """Retire les résultats expirés et les plus anciens au-delà de max_entries (appelé sous verrou ;
+        même TTL pour tous, donc les expirés sont en tête)."""
+        now = time.monotonic()
+        while self._done and (len(self._done) > self.max_entries or next(iter(self._done.values()))[0] <= now):
+            self._done.popitem(last=False)
+
+# --- FIN coalescing.py ---
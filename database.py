@@ -1,80 +1,304 @@
 # database.py
-import sqlite3
 import os
 import json
+import time
+import atexit
+import datetime
+import collections
+import logging
+import asyncio
+import base64
+import binascii
+import zlib
+import gzip
+import html
+import re
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import click
 from flask import g, current_app, Flask # Import Flask pour type hinting et init_app
 
-DATABASE = 'sessions.db' # Définit le chemin ici
+import metrics
+import db_backends
+import lifecycle
+from db_backends import DATABASE, SEARCH_TABLE # Nom du fichier SQLite (dossier d'instance), table de l'index plein texte
+
+logger = logging.getLogger(__name__)
+
+DB_THREADS = int(os.getenv('DB_THREADS', 8)) # Threads dédiés aux accès DB en mode asyncio (asgi.py)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8)) # Connexions longues conservées par processus
+# Écriture différée des tours : ajoutés à une file et écrits par lots par un thread dédié
+DB_WRITE_BEHIND = os.getenv('DB_WRITE_BEHIND', 'false').lower() in ('true', '1', 't')
+DB_WRITE_BEHIND_INTERVAL_MS = int(os.getenv('DB_WRITE_BEHIND_INTERVAL_MS', 50)) # Attente max avant écriture d'un lot
+DB_WRITE_BEHIND_BATCH = int(os.getenv('DB_WRITE_BEHIND_BATCH', 200)) # Tours max par transaction
+# Cache mémoire des sessions actives (métadonnées + historique), mis à jour à chaque écriture
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', 1024)) # Sessions gardées par processus (0 : désactivé)
+SESSION_CACHE_TTL_S = int(os.getenv('SESSION_CACHE_TTL_S', 300)) # Borne la durée d'une donnée périmée (autre processus)
+
+# Backend de stockage (SQLite par défaut, PostgreSQL si DATABASE_URL le désigne)
+BACKEND = db_backends.backend_from_env()
+DB_ERRORS = BACKEND.errors # Exceptions DB à intercepter (sqlite3.Error ou psycopg.Error)
+# Compression des messages stockés (turns.content) : zlib, précédé d'un marqueur de format
+DB_COMPRESSION = os.getenv('DB_COMPRESSION', 'true').lower() in ('true', '1', 't') and BACKEND.blob_content
+DB_COMPRESSION_MIN_BYTES = int(os.getenv('DB_COMPRESSION_MIN_BYTES', 200)) # Messages plus courts stockés tels quels
+CONTENT_ZLIB_MARKER = b'\x00z1' # Un texte ne commence jamais par NUL : les anciennes lignes restent lisibles
+# Migration du schéma à l'import de l'application ; false : étape explicite `flask migrate-db` (démarrage plus rapide des workers)
+DB_AUTO_MIGRATE = os.getenv('DB_AUTO_MIGRATE', 'true').lower() in ('true', '1', 't')
+# Recherche plein texte dans les aventures (index FTS5 tenu à jour à chaque écriture, SQLite uniquement)
+SEARCH_ENABLED = BACKEND.full_text_search
+SEARCH_MAX_HITS = int(os.getenv('SEARCH_MAX_HITS', 1000)) # Correspondances classées par recherche, messages et sessions (joueur, thème) séparément (les plus récentes)
+SEARCH_SNIPPET_TOKENS = int(os.getenv('SEARCH_SNIPPET_TOKENS', 16)) # Longueur (en mots) de l'extrait surligné
+# Cycle de vie : archivage des sessions inactives (restaurées à la demande) et entretien périodique de la base
+SESSION_ARCHIVE_AFTER_DAYS = int(os.getenv('SESSION_ARCHIVE_AFTER_DAYS', 0)) # Inactivité avant archivage (0 : jamais)
+SESSION_ARCHIVE_PATH = os.getenv('SESSION_ARCHIVE_PATH', '') # Dossier des archives (défaut : <instance>/archive)
+SESSION_ARCHIVE_BATCH = int(os.getenv('SESSION_ARCHIVE_BATCH', 200)) # Sessions archivées par transaction
+DB_MAINTENANCE_INTERVAL_S = int(os.getenv('DB_MAINTENANCE_INTERVAL_S', 3600)) # Période de l'entretien en arrière-plan (0 : désactivé)
+DB_VACUUM_PAGES = int(os.getenv('DB_VACUUM_PAGES', 2000)) # Pages libres rendues au système par passage (VACUUM incrémental)
+
+_db_executor = None
+
+# --- Pool de connexions (par processus et par base : fichier SQLite ou URL PostgreSQL) ---
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+def _open_connection(db_path):
+    """Ouvre une connexion longue via le backend (PRAGMA WAL etc. pour SQLite)."""
+    conn = BACKEND.connect(db_path)
+    logger.debug("Connexion DB établie (pool, %s)", BACKEND.name)
+    return conn
+
+def _get_pool(db_path):
+    """Retourne le pool associé au fichier DB, en repartant de zéro après un fork (gunicorn)."""
+    global _pools, _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # Processus enfant : les connexions héritées du parent ne doivent pas être réutilisées
+            _pools = {}
+            _pools_pid = os.getpid()
+        if db_path not in _pools:
+            _pools[db_path] = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+        return _pools[db_path]
+
+def _acquire_connection(db_path):
+    """Prend une connexion du pool, ou en ouvre une nouvelle si le pool est vide."""
+    try:
+        return _get_pool(db_path).get_nowait()
+    except queue.Empty:
+        return _open_connection(db_path)
+
+def _release_connection(db_path, conn):
+    """Rend une connexion au pool (transaction en cours annulée), ou la ferme si le pool est plein."""
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        _get_pool(db_path).put_nowait(conn)
+    except (queue.Full,) + DB_ERRORS:
+        conn.close()
 
 def get_db():
-    """Ouvre une nouvelle connexion à la base de données si aucune n'existe pour le contexte actuel."""
+    """Fournit une connexion (issue du pool) pour le contexte actuel si aucune n'y est encore attachée."""
     if 'db' not in g:
-        db_path = os.path.join(current_app.instance_path, DATABASE) if hasattr(current_app, 'instance_path') else DATABASE
-        # Assurer que le répertoire existe (si instance_path est utilisé)
-        db_dir = os.path.dirname(db_path)
-        if db_dir and not os.path.exists(db_dir):
-            try:
-                os.makedirs(db_dir)
-                print(f"--- Répertoire DB créé: {db_dir} ---")
-            except OSError as e:
-                 print(f"!!! Erreur création répertoire DB {db_dir}: {e} !!!")
-                 # Lever l'erreur ou retourner None pour indiquer un problème ? Levons pour l'instant.
-                 raise e
-
-        # Connecter à la base de données
+        # Fichier SQLite du dossier d'instance (créé au besoin) ou URL PostgreSQL
+        db_path = BACKEND.target(current_app)
+
+        # Emprunter une connexion au pool
         try:
-            g.db = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
-            g.db.row_factory = sqlite3.Row
-            print(f"--- Connexion DB établie: {db_path} ---")
-        except sqlite3.Error as e:
-            print(f"!!! Erreur connexion DB {db_path}: {e} !!!")
+            g.db = _acquire_connection(db_path)
+            g.db_path = db_path
+        except DB_ERRORS as e:
+            logger.error("Erreur connexion DB (%s): %s", BACKEND.name, e)
             raise e # Rendre l'erreur visible à l'appelant
 
     return g.db
 
 def close_connection(exception=None):
-    """Ferme la connexion à la base de données à la fin de la requête."""
+    """Rend la connexion au pool à la fin de la requête."""
     db = g.pop('db', None)
+    db_path = g.pop('db_path', None)
     if db is not None:
-        db.close()
-        print("--- Connexion DB fermée ---")
+        _release_connection(db_path, db)
 
 def init_db(app: Flask):
-    """Initialise la base de données en créant la table sessions et la colonne si elles n'existent pas."""
+    """Initialise la base de données : tables sessions/turns, colonnes manquantes et, sous SQLite,
+    migration de l'ancien historique JSON (sessions.history) vers la table turns. Retourne vrai si réussi."""
     with app.app_context(): # Utilise le contexte de l'application passée
         db = get_db()
         try:
-            print("--- Vérification/Création table 'sessions' (si inexistante)... ---")
-            db.execute('''
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    player_name TEXT NOT NULL,
-                    theme TEXT NOT NULL,
-                    age_group TEXT NOT NULL,
-                    gender TEXT NOT NULL,
-                    initial_turn_count INTEGER,
-                    last_played TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                    history TEXT
-                )
-            ''')
-            # Vérifier si la colonne existe et l'ajouter si besoin (migration simple)
-            cursor = db.execute("PRAGMA table_info(sessions)")
-            columns = [column['name'] for column in cursor.fetchall()]
-            if 'initial_turn_count' not in columns:
-                print("--- Ajout de la colonne 'initial_turn_count' à la table 'sessions'... ---")
-                db.execute('ALTER TABLE sessions ADD COLUMN initial_turn_count INTEGER')
+            # Index absent ou à l'ancien format : à remplir (reconstruire) après la mise à jour du schéma
+            search_missing = SEARCH_ENABLED and (not _search_table_exists(db) or _search_index_outdated(db))
+            BACKEND.ensure_schema(db)
+            if BACKEND.name == 'sqlite':
+                migrate_history_to_turns(db)
             db.commit()
-            print("--- Table 'sessions' vérifiée/mise à jour. ---")
-        except sqlite3.Error as e:
-            print(f"!!! Erreur lors de l'initialisation/migration simple de la DB: {e} !!!")
+            logger.info("Tables 'sessions' et 'turns' vérifiées/mises à jour.")
+            if search_missing: # Index plein texte nouvellement créé ou périmé : le remplir avec les parties existantes
+                rebuild_search_index(db)
+            return True
+        except DB_ERRORS as e:
+            logger.error("Erreur lors de l'initialisation/migration simple de la DB: %s", e)
+            db.rollback()
+            return False
+
+def migrate_history_to_turns(db):
+    """Déplace l'historique JSON hérité (sessions.history) vers la table turns, session par session.
+    La colonne est vidée après migration ; ne commit pas (laisse la main à l'appelant)."""
+    legacy_ids = [row['id'] for row in db.execute(
+        "SELECT id FROM sessions WHERE history IS NOT NULL AND history != ''"
+    ).fetchall()]
+    if not legacy_ids:
+        return 0
+    logger.info("Migration de %s historiques JSON vers la table 'turns'...", len(legacy_ids))
+    for session_id in legacy_ids:
+        row = db.execute('SELECT history FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        try:
+            history = json.loads(row['history'] or '[]')
+        except (json.JSONDecodeError, TypeError) as json_e:
+            logger.warning("Attention: Historique JSON illisible pour session %s, ignoré: %s", session_id, json_e)
+            history = []
+        rows = _turn_rows(session_id, 0, history)
+        db.executemany('INSERT OR IGNORE INTO turns (session_id, turn_index, role, content, data) VALUES (?, ?, ?, ?, ?)', rows)
+        db.execute('UPDATE sessions SET history = NULL, version = ? WHERE id = ?', (len(rows), session_id))
+    return len(legacy_ids)
+
+def encode_content(text):
+    """Forme stockée d'un message : BLOB zlib marqué si la compression est active et utile, sinon le texte."""
+    if not DB_COMPRESSION: return text
+    raw = text.encode('utf-8')
+    if len(raw) < DB_COMPRESSION_MIN_BYTES: return text
+    compressed = CONTENT_ZLIB_MARKER + zlib.compress(raw, 6)
+    return compressed if len(compressed) < len(raw) else text
+
+def decode_content(value):
+    """Texte d'un message stocké (BLOB compressé marqué, ou texte des lignes non compressées)."""
+    if isinstance(value, str) or value is None: return value
+    value = bytes(value)
+    if value.startswith(CONTENT_ZLIB_MARKER):
+        return zlib.decompress(value[len(CONTENT_ZLIB_MARKER):]).decode('utf-8')
+    return value.decode('utf-8')
+
+_INSERT_TURN_SQL = 'INSERT INTO turns (session_id, turn_index, role, content, data) VALUES (?, ?, ?, ?, ?)'
+HISTORY_ROLES = ('user', 'assistant') # Rôles d'un message de l'historique (joueur, narrateur)
+
+def _stored_entries(entries):
+    """Messages effectivement enregistrés (rôle connu, contenu présent) : leur position dans cette liste
+    est leur turn_index, sans trou, et leur nombre la version de la session."""
+    return [entry for entry in entries if entry.get('role') in HISTORY_ROLES and entry.get('content') is not None]
+
+def _turn_rows(session_id, start_index, entries):
+    """Lignes (session_id, turn_index, role, content, data) pour insertion dans turns (contenu compressé si actif,
+    sortie structurée éventuelle du tour en JSON), numérotées après filtrage des messages invalides."""
+    return [
+        (session_id, start_index + offset, entry['role'], encode_content(entry['content']),
+         json.dumps(entry['data'], ensure_ascii=False) if entry.get('data') else None)
+        for offset, entry in enumerate(_stored_entries(entries))
+    ]
+
+def _history_entry(role, content, data=None):
+    """Message de l'historique : {role, content}, plus 'data' (sortie structurée) s'il y en a une."""
+    entry = {'role': role, 'content': content}
+    if data: entry['data'] = data
+    return entry
+
+# --- Index plein texte (FTS5) ---
+# Les messages y sont en clair (turns.content peut être compressé, ce qui exclut une table FTS à contenu externe,
+# et les extraits surlignés ont besoin du texte) ; chaque ligne a le rowid de son message dans turns, ce qui permet
+# de retirer une session par la clé primaire de turns. Le joueur et le thème n'y figurent qu'une fois par session,
+# sur une ligne de rowid -sessions.id (pas de copie par message, ni de messages évincés par un nom de joueur fréquent).
+_INDEX_TURN_SQL = f'INSERT INTO {SEARCH_TABLE} (rowid, content, session_id, turn_index) VALUES (?, ?, ?, ?)'
+_INDEX_SESSIONS_SQL = f'''INSERT INTO {SEARCH_TABLE} (rowid, player_name, theme, session_id)
+                          SELECT -id, player_name, theme, id FROM sessions'''
+
+def _search_table_exists(db):
+    return db.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (SEARCH_TABLE,)).fetchone() is not None
+
+def _search_index_outdated(db):
+    """Vrai si l'index date de l'ancien format (joueur et thème recopiés sur chaque message)."""
+    row = db.execute(f'SELECT player_name FROM {SEARCH_TABLE} WHERE rowid > 0 ORDER BY rowid LIMIT 1').fetchone()
+    return row is not None and row['player_name'] is not None
+
+def _index_turns(db, session_id, start_index, entries):
+    """Ajoute à l'index plein texte les messages qui viennent d'être insérés dans turns, et la ligne joueur/thème
+    d'une session qui vient d'être insérée (start_index 0 : création, restauration, import) ; ne commit pas."""
+    if not SEARCH_ENABLED: return
+    if start_index == 0:
+        db.execute(f'{_INDEX_SESSIONS_SQL} WHERE id = ?', (session_id,))
+    # Une seule lecture pour les rowid des nouveaux messages (un INSERT ... SELECT par message
+    # coûte plusieurs fois l'indexation elle-même sur une table virtuelle)
+    rows = db.execute('SELECT rowid AS turn_rowid, turn_index FROM turns WHERE session_id = ? AND turn_index >= ?',
+                      (session_id, start_index)).fetchall()
+    texts = {start_index + offset: entry['content'] for offset, entry in enumerate(_stored_entries(entries))}
+    db.executemany(_INDEX_TURN_SQL, [
+        (row['turn_rowid'], texts[row['turn_index']], session_id, row['turn_index'])
+        for row in rows if row['turn_index'] in texts
+    ])
+
+def _unindex_session(db, session_id):
+    """Retire de l'index plein texte une session et ses messages (avant leur suppression de turns) ; ne commit pas."""
+    if not SEARCH_ENABLED: return
+    db.execute(f'''DELETE FROM {SEARCH_TABLE}
+                   WHERE rowid = ? OR rowid IN (SELECT rowid FROM turns WHERE session_id = ?)''', (-session_id, session_id))
+
+def rebuild_search_index(db, batch_size=2000):
+    """Reconstruit l'index plein texte depuis la table turns, par lots commités. Retourne le nombre de messages indexés."""
+    if not SEARCH_ENABLED:
+        logger.warning("Recherche plein texte indisponible (backend %s ou SQLite sans FTS5) : rien à faire", BACKEND.name)
+        return 0
+    sql = 'SELECT rowid AS turn_rowid, session_id, turn_index, content FROM turns WHERE rowid > ? ORDER BY rowid LIMIT ?'
+    db.execute(f'DELETE FROM {SEARCH_TABLE}')
+    db.execute(_INDEX_SESSIONS_SQL) # Joueur et thème : une ligne par session
+    db.commit()
+    last_rowid, count = 0, 0
+    while True:
+        rows = db.execute(sql, (last_rowid, batch_size)).fetchall()
+        if not rows: break
+        db.executemany(_INDEX_TURN_SQL, [
+            (row['turn_rowid'], decode_content(row['content']), row['session_id'], row['turn_index'])
+            for row in rows
+        ])
+        db.commit()
+        count += len(rows)
+        last_rowid = rows[-1]['turn_rowid']
+        logger.info("Index plein texte: %s messages indexés", count)
+    db.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')") # Fusionne les segments de l'index
+    db.commit()
+    return count
+
+def recompress_turns(db, batch_size=500):
+    """Compresse les messages encore stockés en texte (lignes antérieures à la compression), par lots commités.
+    Retourne (messages compressés, octets avant, octets après)."""
+    if not DB_COMPRESSION:
+        logger.warning("Compression inactive (DB_COMPRESSION=false ou backend %s) : rien à faire", BACKEND.name)
+        return 0, 0, 0
+    sql = '''SELECT rowid, content FROM turns
+             WHERE typeof(content) = 'text' AND length(CAST(content AS BLOB)) >= ? AND rowid > ?
+             ORDER BY rowid LIMIT ?'''
+    last_rowid, count, before, after = 0, 0, 0, 0
+    while True:
+        rows = db.execute(sql, (DB_COMPRESSION_MIN_BYTES, last_rowid, batch_size)).fetchall()
+        if not rows: break
+        updates = []
+        for row in rows:
+            encoded = encode_content(row['content'])
+            if isinstance(encoded, bytes):
+                updates.append((encoded, row['rowid']))
+                before += len(row['content'].encode('utf-8'))
+                after += len(encoded)
+        db.executemany('UPDATE turns SET content = ? WHERE rowid = ?', updates)
+        db.commit()
+        count += len(updates)
+        last_rowid = rows[-1]['rowid']
+        logger.info("Recompression: %s messages compressés", count)
+    return count, before, after
 
 def init_db_command_func():
     """Fonction pour la commande CLI qui réinitialise la DB via schema.sql."""
     # On a besoin du contexte de l'application ici aussi
     # Cette commande est enregistrée via init_app
     db = get_db()
-    schema_path = os.path.join(os.path.dirname(__file__), 'schema.sql') # Chemin relatif à ce fichier
-    print(f"--- Réinitialisation DB via {schema_path} (EFFACEMENT DONNÉES)... ---")
+    schema_path = os.path.join(os.path.dirname(__file__), BACKEND.schema_file) # Chemin relatif à ce fichier
+    logger.info("Réinitialisation DB via %s (EFFACEMENT DONNÉES)...", schema_path)
     try:
         # Utiliser open() standard car open_resource est lié au contexte de l'app Flask
         with open(schema_path, mode='r') as f:
@@ -83,121 +307,869 @@ def init_db_command_func():
             if db:
                 db.cursor().executescript(script)
                 db.commit()
-                print("--- Base de données réinitialisée. ---")
+                logger.info("Base de données réinitialisée.")
             else:
-                print("!!! Erreur: Impossible d'obtenir une connexion DB pour exécuter le script. !!!")
-    except sqlite3.Error as e:
-        print(f"!!! Erreur lors de l'exécution de {schema_path}: {e} !!!")
+                logger.error("Erreur: Impossible d'obtenir une connexion DB pour exécuter le script.")
+    except DB_ERRORS as e:
+        logger.error("Erreur lors de l'exécution de %s: %s", schema_path, e)
         db.rollback() # Essayer de rollback en cas d'erreur
     except FileNotFoundError:
-        print(f"!!! Erreur: {schema_path} non trouvé. Impossible de réinitialiser. !!!")
+        logger.error("Erreur: %s non trouvé. Impossible de réinitialiser.", schema_path)
     except Exception as e:
-        print(f"!!! Erreur inattendue pendant init-db: {e}")
+        logger.error("Erreur inattendue pendant init-db: %s", e)
         if db: db.rollback()
 
 
+# --- Cache des sessions actives (LRU + TTL) ---
+SESSION_CACHE_EVENTS = metrics.Counter(
+    "session_cache_total", "Lectures de session : hit, miss ou stale (périmée) du cache mémoire.", labelnames=("outcome",)
+)
+
+class SessionCache:
+    """Cache LRU borné (nombre de sessions) avec expiration, clé (fichier DB, session_id).
+    Les écritures passent par le cache (write-through) : il reflète toujours ce que ce processus a écrit ;
+    current_version permet en plus de rejeter une entrée dépassée par un autre processus."""
+
+    def __init__(self, max_size, ttl_s):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._entries = collections.OrderedDict() # clé -> (expiration, session)
+        self._lock = threading.Lock()
+
+    def get(self, db_path, session_id, current_version=None):
+        """Session en cache, ou None. current_version() (appelée hors verrou) : version actuelle de la session ;
+        si elle diffère de celle en cache, l'entrée est invalidée."""
+        if self.max_size <= 0: return None
+        key = (db_path, session_id)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None: del self._entries[key]
+                SESSION_CACHE_EVENTS.inc(outcome="miss")
+                return None
+            self._entries.move_to_end(key)
+            session = item[1]
+        if current_version is not None and current_version() != session['version']:
+            self.invalidate(db_path, session_id)
+            SESSION_CACHE_EVENTS.inc(outcome="stale")
+            return None
+        SESSION_CACHE_EVENTS.inc(outcome="hit")
+        return dict(session, history=list(session['history']))
+
+    def put(self, db_path, session_id, session):
+        if self.max_size <= 0: return
+        key = (db_path, session_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_s, dict(session, history=list(session['history'])))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def update(self, db_path, session_id, apply):
+        """Applique `apply(session)` à l'entrée en cache ; si elle retourne False, l'entrée est invalidée."""
+        key = (db_path, session_id)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None: return
+            if apply(item[1]) is False:
+                del self._entries[key]
+
+    def invalidate(self, db_path, session_id):
+        with self._lock:
+            self._entries.pop((db_path, session_id), None)
+
+
+_session_cache = SessionCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL_S)
+
 def create_session(player_name, theme, age_group, gender, initial_turn_count, history):
-    """Crée une nouvelle session dans la base de données."""
+    """Crée une nouvelle session et ses premiers tours dans la base de données."""
     db = get_db()
-    sql = '''INSERT INTO sessions (player_name, theme, age_group, gender, initial_turn_count, history)
-             VALUES (?, ?, ?, ?, ?, ?)'''
+    sql = '''INSERT INTO sessions (player_name, theme, age_group, gender, initial_turn_count, version)
+             VALUES (?, ?, ?, ?, ?, ?) RETURNING id'''
+    rows = _turn_rows(None, 0, history)
     try:
         cursor = db.execute(
             sql,
-            (player_name, theme, age_group, gender, initial_turn_count, json.dumps(history))
+            (player_name, theme, age_group, gender, initial_turn_count, len(rows))
+        )
+        session_id = cursor.fetchone()['id']
+        db.executemany(
+            _INSERT_TURN_SQL,
+            [(session_id,) + row[1:] for row in rows]
         )
+        _index_turns(db, session_id, 0, history)
         db.commit()
-        session_id = cursor.lastrowid
-        print(f"--- DB: Nouvelle session créée (ID: {session_id}) ---")
+        logger.debug("DB: Nouvelle session créée (ID: %s)", session_id)
         return session_id
-    except sqlite3.Error as e:
-        print(f"!!! Erreur DB (create_session): {e} !!!")
+    except DB_ERRORS as e:
+        logger.error("Erreur DB (create_session): %s", e)
         db.rollback()
         return None
 
-def get_all_sessions():
-    """Récupère les informations de base de toutes les sessions."""
+def encode_sessions_cursor(last_played, session_id):
+    """Curseur opaque (position dans le tri last_played DESC, id DESC)."""
+    raw = f"{last_played}|{session_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_sessions_cursor(cursor):
+    """Décode un curseur de pagination ; lève ValueError s'il est invalide."""
+    try:
+        last_played, session_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return last_played, int(session_id)
+    except (binascii.Error, UnicodeError, ValueError) as e:
+        raise ValueError(f"Curseur de pagination invalide: {cursor}") from e
+
+def get_sessions_page(limit=20, cursor=None, player_name=None, theme=None):
+    """Récupère une page de sessions (les plus récentes d'abord) par pagination par curseur (keyset),
+    sessions archivées comprises (archived vrai : lue depuis l'archive, remise en base au prochain tour).
+    Retourne (sessions, next_cursor) ; next_cursor vaut None sur la dernière page.
+    Lève ValueError si le curseur est invalide."""
     db = get_db()
-    sql = 'SELECT id, player_name, theme, last_played FROM sessions ORDER BY last_played DESC'
+    cursor_values = decode_sessions_cursor(cursor) if cursor else None
+
+    def page_query(table, id_column, archived):
+        conditions, params = [], []
+        if player_name:
+            conditions.append('player_name = ?'); params.append(player_name)
+        if theme:
+            conditions.append('theme = ?'); params.append(theme)
+        if cursor_values:
+            conditions.append(f'(last_played, {id_column}) < (?, ?)'); params.extend(cursor_values)
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        # CAST : valeur texte brute du timestamp (sans conversion PARSE_DECLTYPES) pour le curseur
+        sql = f'''SELECT {id_column} AS id, player_name, theme, last_played, CAST(last_played AS TEXT) AS sort_key, {archived} AS archived
+                  FROM {table} {where_clause}
+                  ORDER BY last_played DESC, {id_column} DESC LIMIT ?'''
+        return sql, params + [limit + 1]
+
+    # Chaque partie parcourt son propre index dans l'ordre et s'arrête à limit + 1 lignes ; une session
+    # n'est jamais dans les deux tables à la fois (même ID), le curseur vaut donc pour les deux
+    live_sql, live_params = page_query('sessions', 'id', 0)
+    archived_sql, archived_params = page_query('archived_sessions', 'session_id', 1)
+    sql = f'''SELECT * FROM ({live_sql}) AS live_page
+              UNION ALL
+              SELECT * FROM ({archived_sql}) AS archived_page
+              ORDER BY last_played DESC, id DESC LIMIT ?'''
     try:
-        sessions = db.execute(sql).fetchall()
-        print(f"--- DB: Récupéré {len(sessions)} sessions ---")
-        return [dict(session) for session in sessions]
-    except sqlite3.Error as e:
-        print(f"!!! Erreur DB (get_all_sessions): {e} !!!")
-        return []
+        rows = db.execute(sql, live_params + archived_params + [limit + 1]).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_sessions_cursor(rows[-1]['sort_key'], rows[-1]['id'])
+        sessions = []
+        for row in rows:
+            session = dict(row)
+            session.pop('sort_key')
+            session['archived'] = bool(session['archived'])
+            sessions.append(session)
+        logger.debug("DB: Récupéré %s sessions (page)", len(sessions))
+        return sessions, next_cursor
+    except DB_ERRORS as e:
+        logger.error("Erreur DB (get_sessions_page): %s", e)
+        return [], None
+
+def build_search_query(text):
+    """Requête FTS5 depuis la saisie libre : chaque mot entre guillemets (tous requis, pas d'opérateurs
+    ni de préfixes, dont l'expansion coûte cher sur un gros index). Retourne None si la saisie ne contient aucun mot."""
+    words = re.findall(r'\w+', text or '')
+    if not words: return None
+    return ' '.join(f'"{word}"' for word in words)
+
+def _highlight(snippet):
+    """Extrait HTML sûr : texte échappé, correspondances entre <mark>."""
+    return html.escape(snippet or '').replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+def search_sessions(text, limit=20, offset=0):
+    """Sessions dont le joueur et le thème (ligne de la session) ou un message correspondent à la saisie, les plus
+    pertinentes d'abord (meilleure ligne de chaque session selon BM25). Seules les SEARCH_MAX_HITS correspondances
+    les plus récentes de chaque sorte sont classées. Retourne (sessions, next_offset, truncated) ; next_offset vaut
+    None sur la dernière page, truncated est vrai si des correspondances plus anciennes ont été laissées de côté."""
+    match = build_search_query(text)
+    if match is None: return [], None, False
+    db = get_db()
+    # MATERIALIZED : bm25() n'est utilisable que dans la requête sur la table FTS elle-même (pas d'aplatissement).
+    # ORDER BY rowid LIMIT : FTS5 s'arrête après SEARCH_MAX_HITS correspondances (BM25 n'est calculé que pour elles) ;
+    # messages (rowid > 0) et sessions (rowid = -id) sont bornés séparément, les plus récents d'abord.
+    sql = f'''WITH message_hits AS MATERIALIZED (
+                  SELECT session_id, rowid AS hit_rowid, bm25({SEARCH_TABLE}, 4.0, 2.0, 1.0) AS score
+                  FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH ? AND rowid > 0 ORDER BY rowid DESC LIMIT ?
+              ), session_hits AS MATERIALIZED (
+                  SELECT session_id, rowid AS hit_rowid, bm25({SEARCH_TABLE}, 4.0, 2.0, 1.0) AS score
+                  FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH ? AND rowid < 0 ORDER BY rowid LIMIT ?
+              ), ranked AS (
+                  SELECT session_id, MIN(score) AS score, hit_rowid, COUNT(*) AS matches
+                  FROM (SELECT * FROM message_hits UNION ALL SELECT * FROM session_hits) GROUP BY session_id
+              )
+              SELECT sessions.id, sessions.player_name, sessions.theme, sessions.last_played,
+                     ranked.score, ranked.matches, ranked.hit_rowid,
+                     MAX((SELECT COUNT(*) FROM message_hits), (SELECT COUNT(*) FROM session_hits)) AS most_hits
+              FROM ranked JOIN sessions ON sessions.id = ranked.session_id
+              ORDER BY ranked.score, sessions.id LIMIT ? OFFSET ?'''
+    try:
+        rows = db.execute(sql, (match, SEARCH_MAX_HITS, match, SEARCH_MAX_HITS, limit + 1, offset)).fetchall()
+        next_offset = offset + limit if len(rows) > limit else None
+        truncated = bool(rows) and rows[0]['most_hits'] >= SEARCH_MAX_HITS
+        rows = rows[:limit]
+        snippets = {}
+        if rows:
+            placeholders = ', '.join('?' * len(rows))
+            snippets = dict(db.execute(
+                f'''SELECT rowid, snippet({SEARCH_TABLE}, -1, char(2), char(3), '…', ?) FROM {SEARCH_TABLE}
+                    WHERE {SEARCH_TABLE} MATCH ? AND rowid IN ({placeholders})''',
+                [SEARCH_SNIPPET_TOKENS, match] + [row['hit_rowid'] for row in rows]
+            ).fetchall())
+        sessions = []
+        for row in rows:
+            session = dict(row)
+            del session['most_hits']
+            session['score'] = round(-session['score'], 4) # BM25 de FTS5 : plus négatif = plus pertinent
+            session['snippet'] = _highlight(snippets.get(session.pop('hit_rowid')))
+            sessions.append(session)
+        if truncated: logger.info("DB: Recherche %r limitée aux %s correspondances les plus récentes", match, SEARCH_MAX_HITS)
+        logger.debug("DB: Recherche %r : %s sessions", match, len(sessions))
+        return sessions, next_offset, truncated
+    except DB_ERRORS as e:
+        logger.error("Erreur DB (search_sessions): %s", e)
+        return [], None, False
 
-def get_session_details(session_id):
-    """Récupère toutes les données d'une session spécifique."""
+def get_session_metadata(session_id):
+    """Récupère les métadonnées d'une session (sans l'historique)."""
     db = get_db()
-    sql = '''SELECT id, player_name, theme, age_group, gender, initial_turn_count, last_played, history
+    sql = '''SELECT id, player_name, theme, age_group, gender, initial_turn_count, last_played, summary, summary_upto, version
              FROM sessions WHERE id = ?'''
     try:
         session = db.execute(sql, (session_id,)).fetchone()
         if session:
-            print(f"--- DB: Détails session {session_id} trouvés ---")
             session_dict = dict(session)
-            try:
-                 session_dict['history'] = json.loads(session_dict['history'] or '[]')
-            except (json.JSONDecodeError, TypeError) as json_e:
-                 print(f"!!! Attention: Erreur décodage JSON hist. session {session_id}: {json_e} !!!")
-                 session_dict['history'] = []
-            if 'initial_turn_count' not in session_dict or session_dict['initial_turn_count'] is None:
+            if session_dict['initial_turn_count'] is None:
                  session_dict['initial_turn_count'] = 0 # Fournir une valeur par défaut
             return session_dict
         else:
-            print(f"--- DB: Session {session_id} non trouvée ---")
+            logger.debug("DB: Session %s non trouvée", session_id)
             return None
-    except sqlite3.Error as e:
-        print(f"!!! Erreur DB (get_session_details ID {session_id}): {e} !!!")
+    except DB_ERRORS as e:
+        logger.error("Erreur DB (get_session_metadata ID %s): %s", session_id, e)
         return None
 
-def update_session_history(session_id, history):
-    """Met à jour l'historique et le timestamp d'une session."""
+def get_session_history(session_id):
+    """Récupère l'historique (liste de {role, content}) d'une session, dans l'ordre des tours,
+    y compris les tours encore en attente d'écriture (écriture différée)."""
     db = get_db()
-    sql = 'UPDATE sessions SET history = ?, last_played = CURRENT_TIMESTAMP WHERE id = ?'
+    sql = 'SELECT role, content, data FROM turns WHERE session_id = ? ORDER BY turn_index'
     try:
-        cursor = db.execute(sql, (json.dumps(history), session_id))
-        db.commit()
-        if cursor.rowcount > 0:
-             # print(f"--- DB: Session {session_id} mise à jour ---") # Optionnel
-             return True
-        else:
-             print(f"!!! DB: Session {session_id} non trouvée pour mise à jour !!!")
+        pending = _write_behind.pending_for(g.db_path, session_id) # Lu avant la base : rien ne peut manquer
+        history = [
+            _history_entry(row['role'], decode_content(row['content']), json.loads(row['data']) if row['data'] else None)
+            for row in db.execute(sql, (session_id,)).fetchall()
+        ]
+        for start_index, entries in pending:
+            if start_index == len(history): # Déjà écrit entre-temps sinon
+                history.extend(_history_entry(entry['role'], entry['content'], entry.get('data')) for entry in entries)
+        return history
+    except DB_ERRORS as e:
+        logger.error("Erreur DB (get_session_history ID %s): %s", session_id, e)
+        return []
+
+def get_session_details(session_id, restore=False):
+    """Récupère toutes les données d'une session spécifique (métadonnées + historique),
+    depuis le cache mémoire si la session y est encore et n'a pas avancé ailleurs (une lecture indexée de la version).
+    Session archivée : relue depuis l'archive sans la modifier (archived vrai), ou remise en base si restore
+    (un tour va y être joué)."""
+    db = get_db()
+    cached = _session_cache.get(g.db_path, session_id, lambda: _current_version(db, g.db_path, session_id))
+    if cached is not None:
+        return cached
+    session_dict = get_session_metadata(session_id)
+    if session_dict is None:
+        if not restore: return get_archived_session(session_id)
+        if restore_archived_session(session_id):
+            session_dict = get_session_metadata(session_id)
+    if session_dict:
+        logger.debug("DB: Détails session %s trouvés", session_id)
+        session_dict['history'] = get_session_history(session_id)
+        _session_cache.put(g.db_path, session_id, session_dict)
+    return session_dict
+
+def _cache_append_turns(db_path, session_id, start_index, entries):
+    """Répercute un ajout de tours sur la session en cache (invalidée si son historique n'est pas à jour)."""
+    def apply(session):
+        if len(session['history']) != start_index: return False
+        session['history'].extend(_history_entry(entry['role'], entry['content'], entry.get('data')) for entry in entries)
+        session['last_played'] = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0) # Comme CURRENT_TIMESTAMP (UTC)
+        session['version'] = start_index + len(entries)
+    _session_cache.update(db_path, session_id, apply)
+
+# Concurrence optimiste : la version d'une session est son nombre de messages. Un tour n'est écrit
+# que si la session en est toujours à start_index (sinon un autre tour, éventuellement servi par
+# une autre instance, est passé entre-temps).
+_BUMP_VERSION_SQL = 'UPDATE sessions SET last_played = CURRENT_TIMESTAMP, version = ? WHERE id = ? AND version = ?'
+
+def append_session_turns(session_id, start_index, entries):
+    """Ajoute les nouveaux messages d'un tour (à partir de turn_index=start_index) et met à jour le timestamp.
+    Coût constant quelle que soit la longueur de l'aventure. Un tour concurrent (version différente) fait échouer l'ajout.
+    En écriture différée (DB_WRITE_BEHIND), la version est vérifiée avant la mise en file (base et tours déjà
+    en file de ce processus) ; seul un tour concurrent écrit par une autre instance n'est détecté qu'à l'écriture."""
+    db = get_db()
+    if DB_WRITE_BEHIND:
+        if not _write_behind.enqueue(g.db_path, session_id, start_index, entries, lambda: _session_version(db, session_id)):
+            logger.warning("DB: Session %s non trouvée ou modifiée par un tour concurrent (version attendue %s)", session_id, start_index)
+            _session_cache.invalidate(g.db_path, session_id)
+            return False
+        _cache_append_turns(g.db_path, session_id, start_index, entries)
+        return True
+    try:
+        cursor = db.execute(_BUMP_VERSION_SQL, (start_index + len(entries), session_id, start_index))
+        if cursor.rowcount == 0:
+             logger.warning("DB: Session %s non trouvée ou modifiée par un tour concurrent (version attendue %s)", session_id, start_index)
+             db.rollback()
+             _session_cache.invalidate(g.db_path, session_id)
              return False # Indique que la mise à jour n'a pas eu lieu
-    except sqlite3.Error as e:
-        print(f"!!! Erreur DB (update ID {session_id}): {e} !!!")
+        db.executemany(
+            _INSERT_TURN_SQL,
+            _turn_rows(session_id, start_index, entries)
+        )
+        _index_turns(db, session_id, start_index, entries)
+        db.commit()
+        _cache_append_turns(g.db_path, session_id, start_index, entries)
+        return True
+    except DB_ERRORS as e:
+        logger.error("Erreur DB (append turns ID %s): %s", session_id, e)
+        db.rollback()
+        _session_cache.invalidate(g.db_path, session_id) # Historique concurrent probable : relire la base
+        return False
+
+def _session_version(db, session_id):
+    """Version (nombre de messages) enregistrée d'une session, None si elle n'existe pas."""
+    row = db.execute('SELECT version FROM sessions WHERE id = ?', (session_id,)).fetchone()
+    return row[0] if row else None
+
+def _current_version(db, db_path, session_id):
+    """Version à jour d'une session : fin du dernier tour en file d'écriture différée, sinon version en base."""
+    pending = _write_behind.pending_for(db_path, session_id)
+    if pending:
+        start_index, entries = pending[-1]
+        return start_index + len(entries)
+    return _session_version(db, session_id)
+
+def update_session_summary(session_id, summary, summary_upto):
+    """Enregistre le résumé glissant : il couvre les messages d'historique d'index 1 à summary_upto - 1.
+    Calculé en arrière-plan : un résumé déjà plus avancé (autre worker) n'est jamais remplacé."""
+    db = get_db()
+    sql = 'UPDATE sessions SET summary = ?, summary_upto = ? WHERE id = ? AND COALESCE(summary_upto, 0) < ?'
+    try:
+        cursor = db.execute(sql, (summary, summary_upto, session_id, summary_upto))
+        db.commit()
+        if cursor.rowcount <= 0:
+            _session_cache.invalidate(g.db_path, session_id) # Résumé plus avancé écrit ailleurs : relire la base
+            return False
+        _session_cache.update(g.db_path, session_id, lambda session: session.update(summary=summary, summary_upto=summary_upto))
+        return True
+    except DB_ERRORS as e:
+        logger.error("Erreur DB (update summary ID %s): %s", session_id, e)
         db.rollback()
         return False
 
 def delete_session(session_id):
-    """Supprime une session de la base de données."""
+    """Supprime une session de la base de données.
+    Retourne True si supprimée, False si introuvable, None en cas d'erreur DB."""
     db = get_db()
-    sql = 'DELETE FROM sessions WHERE id = ?'
+    _write_behind.discard(g.db_path, session_id)
+    _session_cache.invalidate(g.db_path, session_id)
     try:
-        cursor = db.execute(sql, (session_id,))
+        deleted_count = _remove_session_rows(db, session_id)
         db.commit()
-        deleted_count = cursor.rowcount
         if deleted_count > 0:
-            print(f"--- DB: Session {session_id} supprimée ---")
+            logger.debug("DB: Session %s supprimée", session_id)
             return True
         else:
-            print(f"--- DB: Session {session_id} non trouvée pour suppression ---")
+            logger.debug("DB: Session %s non trouvée pour suppression", session_id)
             return False
-    except sqlite3.Error as e:
-        print(f"!!! Erreur DB (delete ID {session_id}): {e} !!!")
+    except DB_ERRORS as e:
+        logger.error("Erreur DB (delete ID %s): %s", session_id, e)
         db.rollback()
-        return False
+        return None
+
+# --- Sessions complètes (archive, export/import NDJSON) ---
+# Enregistrement d'une session : ses métadonnées et tout son historique ({role, content, data?}), en JSON
+_SESSION_RECORD_SQL = '''SELECT id, player_name, theme, age_group, gender, initial_turn_count, CAST(last_played AS TEXT) AS last_played,
+                                summary, summary_upto, version
+                         FROM sessions'''
+
+def _with_histories(db, sessions):
+    """Ajoute à chaque session (dict) son historique complet, lu en une seule requête pour tout le lot."""
+    if not sessions: return sessions
+    histories = collections.defaultdict(list)
+    sql = f"SELECT session_id, role, content, data FROM turns WHERE session_id IN ({', '.join('?' * len(sessions))}) ORDER BY session_id, turn_index"
+    for row in db.execute(sql, [session['id'] for session in sessions]).fetchall():
+        histories[row['session_id']].append(
+            _history_entry(row['role'], decode_content(row['content']), json.loads(row['data']) if row['data'] else None)
+        )
+    for session in sessions:
+        session['history'] = histories[session['id']]
+    return sessions
+
+def _remove_session_rows(db, session_id):
+    """Supprime une session (index de recherche, tours, session, position d'archive) ; ne commit pas.
+    Retourne le nombre de lignes de session supprimées (en base ou archivée)."""
+    _unindex_session(db, session_id)
+    db.execute('DELETE FROM turns WHERE session_id = ?', (session_id,))
+    cursor = db.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+    # Session archivée : seule sa position est oubliée (l'archive est en ajout seul)
+    archived = db.execute('DELETE FROM archived_sessions WHERE session_id = ?', (session_id,))
+    return cursor.rowcount + archived.rowcount
+
+# --- Cycle de vie : archivage des sessions inactives et entretien de la base ---
+def session_archive(app: Flask):
+    """Archive des sessions de l'application (dossier SESSION_ARCHIVE_PATH ou <instance>/archive)."""
+    return lifecycle.SessionArchive(SESSION_ARCHIVE_PATH or os.path.join(app.instance_path, 'archive'))
+
+_ARCHIVE_SESSION_SQL = '''INSERT INTO archived_sessions (session_id, player_name, theme, last_played, archive_file, archive_offset, archive_length)
+                          VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+def archive_stale_sessions(db, archive, older_than_days, batch_size=200):
+    """Déplace vers l'archive les sessions sans activité depuis `older_than_days` jours, par lots commités
+    (les plus anciennes d'abord). Chaque lot est écrit et synchronisé dans l'archive avant d'être supprimé
+    de la base ; une session rejouée entre-temps (version changée) reste en base. Retourne le nombre archivé."""
+    cutoff = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+    select_sql = _SESSION_RECORD_SQL + ' WHERE last_played < ? ORDER BY last_played, id LIMIT ?'
+    count, skipped = 0, set()
+    while True:
+        sessions = [dict(row) for row in db.execute(select_sql, (cutoff, batch_size + len(skipped))).fetchall()]
+        sessions = _with_histories(db, [session for session in sessions if session['id'] not in skipped][:batch_size])
+        if not sessions: break
+        positions = archive.append(sessions)
+        db.rollback() # Termine la lecture : la suppression part d'une transaction neuve
+        archived = []
+        try:
+            BACKEND.begin(db)
+            for session, (file_name, offset, length) in zip(sessions, positions):
+                db.execute('SAVEPOINT archive')
+                _unindex_session(db, session['id'])
+                db.execute('DELETE FROM turns WHERE session_id = ?', (session['id'],))
+                cursor = db.execute('DELETE FROM sessions WHERE id = ? AND version = ?', (session['id'], session['version']))
+                if cursor.rowcount == 0: # Rejouée (ou supprimée) depuis la lecture : on la laisse
+                    db.execute('ROLLBACK TO SAVEPOINT archive')
+                    skipped.add(session['id'])
+                else:
+                    db.execute(_ARCHIVE_SESSION_SQL, (session['id'], session['player_name'], session['theme'],
+                                                      session['last_played'], file_name, offset, length))
+                    archived.append(session['id'])
+                db.execute('RELEASE SAVEPOINT archive')
+            db.commit()
+        except DB_ERRORS as e:
+            logger.error("Erreur DB (archivage d'un lot de %s sessions): %s", len(sessions), e)
+            db.rollback()
+            break
+        for session_id in archived:
+            _session_cache.invalidate(g.db_path, session_id)
+        count += len(archived)
+        lifecycle.LIFECYCLE_EVENTS.inc(len(archived), event="archived")
+        logger.info("Archivage: %s sessions archivées", count)
+    return count
+
+def _read_archived_session(db, session_id):
+    """(position d'archive, enregistrement JSON) d'une session archivée, ou (None, None) si elle ne l'est pas
+    ou reste illisible."""
+    try:
+        row = db.execute('''SELECT archive_file, archive_offset, archive_length, last_played
+                             FROM archived_sessions WHERE session_id = ?''', (session_id,)).fetchone()
+    except DB_ERRORS as e:
+        logger.error("Erreur DB (lecture archive session %s): %s", session_id, e)
+        return None, None
+    if row is None: return None, None
+    try:
+        return row, session_archive(current_app).read(row['archive_file'], row['archive_offset'], row['archive_length'])
+    except (OSError, ValueError) as e:
+        logger.error("Archive illisible pour la session %s: %s", session_id, e)
+        return None, None
+
+def get_archived_session(session_id):
+    """Session archivée relue depuis l'archive, sans la remettre en base (consultation) :
+    mêmes champs que get_session_details, plus archived vrai. None si elle n'est pas archivée."""
+    row, record = _read_archived_session(get_db(), session_id)
+    if record is None: return None
+    history = [_history_entry(entry['role'], entry['content'], entry.get('data')) for entry in _stored_entries(record.get('history') or [])]
+    return {'id': session_id, 'player_name': record['player_name'], 'theme': record['theme'],
+            'age_group': record['age_group'], 'gender': record['gender'],
+            'initial_turn_count': record.get('initial_turn_count') or 0, 'last_played': row['last_played'],
+            'summary': record.get('summary'), 'summary_upto': record.get('summary_upto') or 0,
+            'version': len(history), 'history': history, 'archived': True}
+
+def restore_archived_session(session_id):
+    """Remet en base une session archivée (même ID, historique, index de recherche et date de dernière partie),
+    au moment d'y jouer un tour. Retourne True si la session a été restaurée (ou l'a été entre-temps)."""
+    db = get_db()
+    row, record = _read_archived_session(db, session_id)
+    if record is None: return False
+    history = record.get('history') or []
+    rows = _turn_rows(session_id, 0, history)
+    sql = '''INSERT INTO sessions (id, player_name, theme, age_group, gender, initial_turn_count, last_played, summary, summary_upto, version)
+             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+    try:
+        db.execute(sql, (session_id, record['player_name'], record['theme'], record['age_group'], record['gender'],
+                         record.get('initial_turn_count'), row['last_played'], record.get('summary'),
+                         record.get('summary_upto') or 0, len(rows)))
+        db.executemany(_INSERT_TURN_SQL, rows)
+        _index_turns(db, session_id, 0, history)
+        db.execute('DELETE FROM archived_sessions WHERE session_id = ?', (session_id,))
+        db.commit()
+    except DB_ERRORS as e:
+        # Restauration concurrente (clé primaire déjà présente) ou erreur : la base fait foi
+        db.rollback()
+        logger.warning("DB: Restauration de la session %s non appliquée: %s", session_id, e)
+        return get_session_metadata(session_id) is not None
+    lifecycle.LIFECYCLE_EVENTS.inc(event="restored")
+    logger.info("Session %s restaurée depuis l'archive (%s)", session_id, row['archive_file'])
+    return True
+
+def run_db_maintenance(db):
+    """Entretien SQLite : rend au système une partie des pages libres (VACUUM incrémental), fusionne les
+    segments de l'index plein texte et met à jour les statistiques du planificateur (PRAGMA optimize)."""
+    if BACKEND.name != 'sqlite': return # PostgreSQL : autovacuum s'en charge
+    if db.in_transaction: db.commit()
+    db.execute(f'PRAGMA incremental_vacuum({int(DB_VACUUM_PAGES)})').fetchall() # Sans effet si auto_vacuum n'est pas INCREMENTAL
+    if SEARCH_ENABLED:
+        db.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rank) VALUES ('merge', 500)")
+        db.commit()
+    db.execute('PRAGMA optimize').fetchall()
+    lifecycle.LIFECYCLE_EVENTS.inc(event="maintenance")
+
+def run_lifecycle_pass(app: Flask, older_than_days=None, batch_size=None):
+    """Un passage complet (archivage si activé, puis entretien), dans un seul processus à la fois.
+    Retourne le nombre de sessions archivées, ou None si un autre processus est déjà en train de le faire."""
+    older_than_days = SESSION_ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    archive = session_archive(app)
+    with archive.exclusive() as acquired:
+        if not acquired: return None
+        with app.app_context():
+            db = get_db()
+            count = archive_stale_sessions(db, archive, older_than_days, batch_size or SESSION_ARCHIVE_BATCH) if older_than_days > 0 else 0
+            run_db_maintenance(db)
+            return count
+
+# --- Export / import des sessions (NDJSON : une session complète par ligne) ---
+IMPORT_CONFLICT_MODES = ('skip', 'replace', 'new-id') # Session déjà présente : garder, remplacer, ou importer sous un nouvel ID
+_REQUIRED_RECORD_FIELDS = ('player_name', 'theme', 'age_group', 'gender')
+
+def _end_read(db):
+    """Termine la transaction de lecture éventuelle (PostgreSQL) entre deux lots d'un export."""
+    if db.in_transaction: db.rollback()
+
+def iter_session_records(db, batch_size=500, archive=None):
+    """Parcourt toutes les sessions (par ID croissant), historiques complets compris, lot par lot :
+    la mémoire utilisée ne dépend que de `batch_size`, pas de la taille de la base. Avec `archive`,
+    les sessions archivées suivent, relues une à une depuis les fichiers d'archive."""
+    select_sql = _SESSION_RECORD_SQL + ' WHERE id > ? ORDER BY id LIMIT ?'
+    last_id = 0
+    while True:
+        sessions = _with_histories(db, [dict(row) for row in db.execute(select_sql, (last_id, batch_size)).fetchall()])
+        _end_read(db)
+        if not sessions: break
+        yield from sessions
+        last_id = sessions[-1]['id']
+    if archive is None: return
+    archived_sql = '''SELECT session_id, archive_file, archive_offset, archive_length FROM archived_sessions
+                      WHERE session_id > ? ORDER BY session_id LIMIT ?'''
+    last_id = 0
+    while True:
+        rows = [dict(row) for row in db.execute(archived_sql, (last_id, batch_size)).fetchall()]
+        _end_read(db)
+        if not rows: break
+        for row in rows:
+            try:
+                yield archive.read(row['archive_file'], row['archive_offset'], row['archive_length'])
+            except (OSError, ValueError) as e:
+                logger.error("Export: archive illisible pour la session %s, ignorée: %s", row['session_id'], e)
+        last_id = rows[-1]['session_id']
+
+def parse_session_record(line):
+    """Session d'une ligne NDJSON ; lève ValueError si la ligne n'est pas une session valide."""
+    record = json.loads(line)
+    if not isinstance(record, dict): raise ValueError("objet JSON attendu")
+    missing = [field for field in _REQUIRED_RECORD_FIELDS if not isinstance(record.get(field), str)]
+    if missing: raise ValueError(f"champs manquants: {', '.join(missing)}")
+    if record.get('id') is not None and (not isinstance(record['id'], int) or isinstance(record['id'], bool) or record['id'] <= 0):
+        raise ValueError(f"id invalide: {record['id']!r}")
+    history = record.get('history') or []
+    if not isinstance(history, list) or not all(isinstance(entry, dict) and isinstance(entry.get('content'), str) for entry in history):
+        raise ValueError("historique invalide")
+    invalid = [entry.get('role') for entry in history if entry.get('role') not in HISTORY_ROLES]
+    if invalid: raise ValueError(f"rôle invalide dans l'historique: {invalid[0]!r} ({'/'.join(HISTORY_ROLES)} attendus)")
+    record['history'] = history
+    if record.get('last_played') is not None: # Normalisé au format de CURRENT_TIMESTAMP (lu par PARSE_DECLTYPES)
+        record['last_played'] = datetime.datetime.fromisoformat(str(record['last_played'])).strftime('%Y-%m-%d %H:%M:%S')
+    return record
+
+_IMPORT_SESSION_COLUMNS = 'player_name, theme, age_group, gender, initial_turn_count, last_played, summary, summary_upto, version'
+_IMPORT_SESSION_VALUES = '?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?, ?'
+
+def _import_batch(db, records, on_conflict, stats):
+    """Importe un lot de sessions dans une transaction (une ligne par session + executemany des tours)."""
+    ids = [record['id'] for record in records if record.get('id') is not None]
+    existing = set()
+    if ids:
+        placeholders = ', '.join('?' * len(ids))
+        existing = {row['id'] for row in db.execute(
+            f'''SELECT id FROM sessions WHERE id IN ({placeholders})
+                UNION SELECT session_id FROM archived_sessions WHERE session_id IN ({placeholders})''', ids + ids
+        ).fetchall()}
+    _end_read(db)
+    outcome = collections.Counter()
+    replaced = []
+    try:
+        BACKEND.begin(db)
+        for record in records:
+            session_id = record.get('id')
+            if session_id in existing:
+                if on_conflict == 'skip':
+                    outcome['skipped'] += 1
+                    continue
+                if on_conflict == 'replace':
+                    _remove_session_rows(db, session_id)
+                    replaced.append(session_id)
+                    outcome['replaced'] += 1
+                else:
+                    session_id = None
+            rows = _turn_rows(None, 0, record['history'])
+            values = (record['player_name'], record['theme'], record['age_group'], record['gender'], record.get('initial_turn_count'),
+                      record.get('last_played'), record.get('summary'), record.get('summary_upto') or 0, len(rows))
+            if session_id is None:
+                cursor = db.execute(f'INSERT INTO sessions ({_IMPORT_SESSION_COLUMNS}) VALUES ({_IMPORT_SESSION_VALUES}) RETURNING id', values)
+                session_id = cursor.fetchone()['id']
+            else:
+                db.execute(f'INSERT INTO sessions (id, {_IMPORT_SESSION_COLUMNS}) VALUES (?, {_IMPORT_SESSION_VALUES})', (session_id,) + values)
+            existing.add(session_id) # Même ID plus loin dans le fichier : conflit
+            db.executemany(_INSERT_TURN_SQL, [(session_id,) + row[1:] for row in rows])
+            _index_turns(db, session_id, 0, record['history'])
+            outcome['imported'] += 1
+        db.commit()
+    except DB_ERRORS as e:
+        logger.error("Erreur DB (import d'un lot de %s sessions): %s", len(records), e)
+        db.rollback()
+        stats['failed'] += len(records)
+        return
+    stats.update(outcome)
+    for session_id in replaced:
+        _session_cache.invalidate(g.db_path, session_id)
+
+def import_sessions(db, lines, batch_size=500, on_conflict='skip'):
+    """Importe des sessions NDJSON (itérable de lignes, lu au fil de l'eau) par transactions de `batch_size` sessions.
+    Les sessions gardent leur ID ; en cas de conflit, `on_conflict` (IMPORT_CONFLICT_MODES) décide.
+    Retourne les compteurs : imported, replaced, skipped, invalid (ligne illisible), failed (lot en erreur)."""
+    if on_conflict not in IMPORT_CONFLICT_MODES: raise ValueError(f"Mode de conflit inconnu: {on_conflict}")
+    stats = collections.Counter()
+    batch = []
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip(): continue
+        try:
+            batch.append(parse_session_record(line))
+        except ValueError as e:
+            stats['invalid'] += 1
+            logger.warning("Import: ligne %s ignorée (%s)", line_number, e)
+            continue
+        if len(batch) >= batch_size:
+            _import_batch(db, batch, on_conflict, stats)
+            batch = []
+            logger.info("Import: %s sessions importées", stats['imported'])
+    if batch:
+        _import_batch(db, batch, on_conflict, stats)
+    if BACKEND.name == 'postgres': # IDs explicites : la séquence doit repartir après le plus grand
+        db.execute("SELECT setval(pg_get_serial_sequence('sessions', 'id'), (SELECT COALESCE(MAX(id), 1) FROM sessions))")
+        db.commit()
+    return stats
+
+def _open_ndjson(path, mode):
+    """Fichier NDJSON texte ('-' : entrée/sortie standard), compressé gzip si son nom finit par .gz."""
+    if path == '-': return click.get_text_stream('stdout' if mode == 'w' else 'stdin')
+    if path.endswith('.gz'): return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+# --- Écriture différée des tours (write-behind) ---
+class WriteBehindQueue:
+    """File des tours à écrire, vidée par un thread dédié en transactions groupées (un seul commit,
+    donc une seule synchronisation disque, pour tout un lot). Les tours en attente restent visibles
+    en lecture (get_session_history) jusqu'à leur écriture effective."""
+
+    def __init__(self, interval_s, batch_size):
+        self.interval_s = interval_s
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._pending = {} # (db_path, session_id) -> [(start_index, entries), ...]
+        self._flushed = 0 # Tours sortis de la file (écrits ou en échec), pour revérifier une version lue hors verrou
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='db-write-behind', daemon=True)
+                self._thread.start()
+
+    def enqueue(self, db_path, session_id, start_index, entries, read_version):
+        """Met le tour en file s'il suit la dernière version connue de la session : fin du dernier tour encore
+        en file, sinon read_version() (version en base). Retourne False sinon (tour concurrent).
+        La base est lue hors du verrou, puis l'état de la file revérifié : si un lot a été écrit entre-temps
+        (compteur _flushed), la version lue peut être dépassée et elle est relue."""
+        entries = [dict(entry) for entry in entries]
+        key = (db_path, session_id)
+        version, read_at = None, None # Version lue en base et valeur de _flushed au moment de la lecture
+        while True:
+            with self._lock:
+                items = self._pending.get(key)
+                if items or (read_at is not None and read_at == self._flushed):
+                    expected = items[-1][0] + len(items[-1][1]) if items else version
+                    if expected != start_index:
+                        return False
+                    self._pending.setdefault(key, []).append((start_index, entries))
+                    break
+                read_at = self._flushed
+            version = read_version()
+        self._ensure_worker()
+        self._queue.put((db_path, session_id, start_index, entries))
+        return True
+
+    def pending_for(self, db_path, session_id):
+        with self._lock:
+            return list(self._pending.get((db_path, session_id), ()))
+
+    def discard(self, db_path, session_id):
+        """Oublie les tours en attente d'une session supprimée (ceux déjà en cours d'écriture échoueront sur la clé étrangère)."""
+        with self._lock:
+            self._pending.pop((db_path, session_id), None)
+
+    def _forget(self, db_path, session_id, start_index):
+        with self._lock:
+            items = self._pending.get((db_path, session_id))
+            if items is None: return False # Session supprimée entre-temps
+            self._flushed += 1
+            self._pending[(db_path, session_id)] = [item for item in items if item[0] != start_index]
+            if not self._pending[(db_path, session_id)]:
+                del self._pending[(db_path, session_id)]
+            return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None: # Demande d'arrêt (flush)
+                self._queue.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.interval_s
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch: self._queue.task_done()
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _write_batch(self, batch):
+        by_path = {}
+        for item in batch:
+            by_path.setdefault(item[0], []).append(item)
+        for db_path, items in by_path.items():
+            conn = _acquire_connection(db_path)
+            written = []
+            try:
+                BACKEND.begin(conn) # Transaction explicite : les points de sauvegarde y sont imbriqués
+                for _, session_id, start_index, entries in items:
+                    with self._lock:
+                        if (db_path, session_id) not in self._pending: continue # Supprimée entre-temps
+                    # Un point de sauvegarde par tour : un conflit n'annule pas le reste du lot
+                    conn.execute('SAVEPOINT turn')
+                    try:
+                        cursor = conn.execute(_BUMP_VERSION_SQL, (start_index + len(entries), session_id, start_index))
+                        if cursor.rowcount == 0:
+                            conn.execute('ROLLBACK TO SAVEPOINT turn')
+                            logger.error("Écriture différée: session %s introuvable ou modifiée (version attendue %s)", session_id, start_index)
+                            _session_cache.invalidate(db_path, session_id)
+                        else:
+                            conn.executemany(
+                                _INSERT_TURN_SQL,
+                                _turn_rows(session_id, start_index, entries)
+                            )
+                            _index_turns(conn, session_id, start_index, entries)
+                        conn.execute('RELEASE SAVEPOINT turn')
+                    except DB_ERRORS as e:
+                        conn.execute('ROLLBACK TO SAVEPOINT turn')
+                        conn.execute('RELEASE SAVEPOINT turn')
+                        logger.error("Erreur DB (écriture différée session %s, tour %s): %s", session_id, start_index, e)
+                        _session_cache.invalidate(db_path, session_id)
+                    written.append((session_id, start_index))
+                conn.commit()
+                logger.debug("Écriture différée: %s tours écrits (%s)", len(written), db_path)
+            except DB_ERRORS as e:
+                logger.error("Erreur DB (écriture différée, lot de %s tours): %s", len(items), e)
+                conn.rollback()
+                for _, session_id, _, _ in items:
+                    _session_cache.invalidate(db_path, session_id)
+            finally:
+                # Écrits ou définitivement en échec : ils ne sont plus en attente
+                for _, session_id, start_index, _ in items:
+                    self._forget(db_path, session_id, start_index)
+                _release_connection(db_path, conn)
+
+    def flush(self, timeout=None):
+        """Écrit tous les tours en attente et arrête le thread (relancé au prochain ajout)."""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.error("Écriture différée: arrêt incomplet, %s tours encore en file", self._queue.qsize())
+
+
+_write_behind = WriteBehindQueue(DB_WRITE_BEHIND_INTERVAL_MS / 1000, DB_WRITE_BEHIND_BATCH)
+
+def flush_pending_writes(timeout=30):
+    """Garantit l'écriture des tours en file (arrêt du serveur, fin de processus)."""
+    _write_behind.flush(timeout)
+
+atexit.register(flush_pending_writes)
+
+async def run_async(app: Flask, func, *args, **kwargs):
+    """Exécute une fonction de ce module dans un thread dédié (hors de la boucle asyncio),
+    à l'intérieur d'un contexte d'application pour que get_db/close_connection fonctionnent."""
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='db')
+
+    def call_in_app_context():
+        with app.app_context():
+            return func(*args, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, call_in_app_context)
 
 # Fonction pour enregistrer les gestionnaires DB avec l'app Flask
 def init_app(app: Flask):
     """Enregistre les fonctions de gestion de la base de données avec l'instance Flask."""
-    # Assurer que la DB est initialisée au démarrage de l'application
-    init_db(app)
+    # Assurer que la DB est initialisée au démarrage de l'application (sauf migration explicite)
+    if DB_AUTO_MIGRATE:
+        init_db(app)
 
     # Fermer la connexion DB après chaque requête
     app.teardown_appcontext(close_connection)
 
+    # Archivage et entretien en arrière-plan, démarrés à la première requête de chaque processus
+    maintenance = lifecycle.LifecycleManager(DB_MAINTENANCE_INTERVAL_S, lambda: run_lifecycle_pass(app))
+    app.before_request(maintenance.ensure_started)
+
     # Ajouter la commande CLI `flask init-db`
     # Utiliser une fonction wrapper pour s'assurer qu'on a le contexte de l'app
     @app.cli.command('init-db')
@@ -206,4 +1178,85 @@ def init_app(app: Flask):
         with app.app_context(): # Assurer le contexte pour get_db
              init_db_command_func()
 
-    print("--- Gestionnaire DB enregistré avec l'application Flask ---")
\ No newline at end of file
+    @app.cli.command('migrate-db')
+    def migrate_db_command():
+        """Crée les tables et applique les migrations, sans effacer les données."""
+        if not init_db(app):
+            raise click.ClickException("Échec de la migration (voir le journal).")
+        click.echo("Schéma de la base vérifié/mis à jour.")
+
+    @app.cli.command('recompress-history')
+    @click.option('--batch-size', default=500, show_default=True, help="Messages compressés par transaction.")
+    @click.option('--vacuum', is_flag=True, help="Reconstruit ensuite le fichier pour rendre la place libérée.")
+    def recompress_history_command(batch_size, vacuum):
+        """Compresse les messages stockés avant l'activation de la compression."""
+        with app.app_context():
+            db = get_db()
+            count, before, after = recompress_turns(db, batch_size)
+            click.echo(f"{count} messages compressés : {before} -> {after} octets.")
+            if vacuum and BACKEND.name == 'sqlite':
+                db.execute('VACUUM')
+                click.echo("Fichier de base reconstruit (VACUUM).")
+
+    @app.cli.command('archive-sessions')
+    @click.option('--older-than-days', type=int, default=None, help="Inactivité avant archivage (défaut : SESSION_ARCHIVE_AFTER_DAYS).")
+    @click.option('--batch-size', default=SESSION_ARCHIVE_BATCH, show_default=True, help="Sessions archivées par transaction.")
+    @click.option('--vacuum', is_flag=True, help="Reconstruit ensuite le fichier (active aussi le VACUUM incrémental d'une ancienne base).")
+    def archive_sessions_command(older_than_days, batch_size, vacuum):
+        """Archive les sessions inactives puis entretient la base (VACUUM incrémental, PRAGMA optimize)."""
+        count = run_lifecycle_pass(app, older_than_days, batch_size)
+        if count is None:
+            raise click.ClickException("Un archivage est déjà en cours dans un autre processus.")
+        click.echo(f"{count} sessions archivées dans {session_archive(app).directory}.")
+        if vacuum and BACKEND.name == 'sqlite':
+            with app.app_context():
+                get_db().execute('VACUUM') # Applique aussi auto_vacuum = INCREMENTAL (voir db_backends)
+            click.echo("Fichier de base reconstruit (VACUUM).")
+
+    @app.cli.command('export-sessions')
+    @click.argument('path', default='-')
+    @click.option('--batch-size', default=500, show_default=True, help="Sessions lues par requête.")
+    @click.option('--include-archived', is_flag=True, help="Exporte aussi les sessions archivées.")
+    def export_sessions_command(path, batch_size, include_archived):
+        """Exporte toutes les sessions en NDJSON (PATH, .gz pour compresser ; '-' : sortie standard)."""
+        archive = session_archive(app) if include_archived else None
+        count = 0
+        with app.app_context():
+            db = get_db()
+            out = _open_ndjson(path, 'w')
+            try:
+                for record in iter_session_records(db, batch_size, archive):
+                    out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    count += 1
+            finally:
+                if path != '-': out.close()
+        click.echo(f"{count} sessions exportées.", err=path == '-')
+
+    @app.cli.command('import-sessions')
+    @click.argument('path')
+    @click.option('--batch-size', default=500, show_default=True, help="Sessions importées par transaction.")
+    @click.option('--on-conflict', type=click.Choice(IMPORT_CONFLICT_MODES), default='skip', show_default=True,
+                  help="Session déjà présente (même ID) : la garder, la remplacer, ou importer sous un nouvel ID.")
+    def import_sessions_command(path, batch_size, on_conflict):
+        """Importe des sessions NDJSON (PATH, .gz accepté ; '-' : entrée standard)."""
+        with app.app_context():
+            source = _open_ndjson(path, 'r')
+            try:
+                stats = import_sessions(get_db(), source, batch_size, on_conflict)
+            finally:
+                if path != '-': source.close()
+        click.echo(", ".join(f"{name}: {stats[name]}" for name in ('imported', 'replaced', 'skipped', 'invalid', 'failed')))
+        if stats['failed']:
+            raise click.ClickException("Des lots n'ont pas pu être importés (voir le journal).")
+
+    @app.cli.command('rebuild-search-index')
+    @click.option('--batch-size', default=2000, show_default=True, help="Messages indexés par transaction.")
+    def rebuild_search_index_command(batch_size):
+        """Reconstruit l'index de recherche plein texte depuis les tours enregistrés."""
+        if not SEARCH_ENABLED:
+            raise click.ClickException(f"Recherche plein texte indisponible (backend {BACKEND.name} ou SQLite sans FTS5).")
+        with app.app_context():
+            count = rebuild_search_index(get_db(), batch_size)
+            click.echo(f"Index de recherche reconstruit : {count} messages indexés.")
+
+    logger.info("Gestionnaire DB enregistré avec l'application Flask")
\ No newline at end of file
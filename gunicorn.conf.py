@@ -0,0 +1,41 @@
+# gunicorn.conf.py
+# Configuration gunicorn (mode WSGI) pour la production :
+#
+#   flask migrate-db                          # Migration du schéma : étape explicite, une fois par déploiement
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# preload_app : app.py (thèmes, prompts, application Flask, configuration) est importé une seule fois
+# dans le processus maître ; les workers en héritent par fork et démarrent sans refaire ce travail.
+# Le SDK du modèle (grpc) n'est jamais importé dans le maître, grpc ne supportant pas le fork :
+# chaque worker le charge en arrière-plan juste après son démarrage (LLM_WARM_UP).
+import os
+import threading
+
+os.environ.setdefault('DB_AUTO_MIGRATE', 'false') # Avant l'import de app.py : pas de migration au démarrage
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5002)}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+worker_class = 'gthread' # Un thread par requête : les flux SSE de /chat/stream n'immobilisent pas tout le worker
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120)) # Supérieur au délai d'un appel au modèle (LLM_TIMEOUT_S)
+graceful_timeout = 30 # Laisse finir les tours en cours et vider l'écriture différée
+preload_app = True
+
+LLM_WARM_UP = os.getenv('LLM_WARM_UP', 'true').lower() in ('true', '1', 't') # Charger le SDK dès le fork
+
+
+def post_fork(server, worker):
+    """Charge le SDK du modèle dans le worker, hors du chemin de la première requête."""
+    if not LLM_WARM_UP: return
+    from app import llm_provider, turn_provider # Déjà importé par le maître (preload_app)
+
+    def warm_up():
+        try:
+            llm_provider.warm_up()
+            if turn_provider is not llm_provider: turn_provider.warm_up()
+        except Exception as e:
+            server.log.warning("Préchargement du SDK du modèle impossible (worker %s): %s", worker.pid, e)
+
+    threading.Thread(target=warm_up, name='llm-warm-up', daemon=True).start()
+
+# --- FIN gunicorn.conf.py ---
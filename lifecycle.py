@@ -0,0 +1,113 @@
+# lifecycle.py
+# Cycle de vie des sessions : les parties abandonnées quittent la base active pour une archive
+# compressée en ajout seul, et la base est entretenue en arrière-plan (VACUUM incrémental, PRAGMA optimize).
+#
+# Archive : un fichier par mois (sessions-AAAA-MM.jsonl.gz), un membre gzip par session archivée.
+# Les membres gzip se concatènent : chaque fichier reste lisible tel quel (zcat, gzip.open) et une
+# session se relit directement à sa position (fichier, offset, longueur), gardée en base.
+# Le SQL (sélection, suppression, restauration) reste dans database.py.
+import os
+import gzip
+import json
+import fcntl
+import logging
+import datetime
+import threading
+import contextlib
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LIFECYCLE_EVENTS = metrics.Counter(
+    "session_lifecycle_total", "Cycle de vie des sessions : archived, restored, maintenance.", labelnames=("event",)
+)
+
+
+class SessionArchive:
+    """Fichiers d'archive des sessions (ajout seul) dans un dossier."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _current_file(self):
+        return f"sessions-{datetime.datetime.now(datetime.timezone.utc):%Y-%m}.jsonl.gz"
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        """Verrou (non bloquant) d'un passage d'archivage, partagé entre processus ; cède False s'il est déjà pris."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def append(self, records):
+        """Ajoute les sessions (dicts JSON) en fin d'archive, synchronisées sur disque avant de rendre la main.
+        Retourne leur position [(fichier, offset, longueur)] dans le même ordre."""
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = self._current_file()
+        positions = []
+        with open(os.path.join(self.directory, file_name), 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX) # Un seul écrivain à la fois (plusieurs workers)
+            try:
+                offset = f.seek(0, os.SEEK_END)
+                for record in records:
+                    member = gzip.compress((json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8'))
+                    f.write(member)
+                    positions.append((file_name, offset, len(member)))
+                    offset += len(member)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return positions
+
+    def read(self, file_name, offset, length):
+        """Relit une session archivée ; lève OSError ou ValueError si l'enregistrement est introuvable ou illisible."""
+        if os.path.basename(file_name) != file_name: raise ValueError(f"Nom de fichier d'archive invalide: {file_name}")
+        with open(os.path.join(self.directory, file_name), 'rb') as f:
+            f.seek(offset)
+            member = f.read(length)
+        if len(member) != length: raise ValueError(f"Enregistrement tronqué ({file_name}@{offset})")
+        return json.loads(gzip.decompress(member).decode('utf-8'))
+
+
+class LifecycleManager:
+    """Thread d'entretien par processus : exécute run() toutes les `interval_s` secondes.
+    Démarré au premier usage (donc après le fork des workers), comme l'écriture différée."""
+
+    def __init__(self, interval_s, run):
+        self.interval_s = interval_s
+        self.run = run
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def ensure_started(self):
+        if self.interval_s <= 0 or self._pid == os.getpid(): return
+        with self._lock:
+            if self._pid == os.getpid(): return
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._loop, name='db-lifecycle', daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.run()
+            except Exception as e:
+                logger.error("Entretien de la base en échec: %s", e)
+
+    def stop(self):
+        self._stop.set()
+
+# --- FIN lifecycle.py ---
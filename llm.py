@@ -0,0 +1,928 @@
+# llm.py
+# Couche d'abstraction des backends LLM utilisée par le pipeline /chat.
+# L'historique est toujours échangé au format client : [{"role": "user"|"assistant", "content": str}].
+#
+#   LLM_PROVIDER=gemini|litellm|mock     Backend principal (défaut: gemini)
+#   LLM_FALLBACK_PROVIDER=...            Backend de secours optionnel (bascule si erreur ou lenteur)
+#
+# Chaque backend est enveloppé d'un ResilientProvider : délai par tentative, nouvelles tentatives
+# avec attente exponentielle aléatoire, requête de couverture (hedging) optionnelle et disjoncteur.
+import os
+import re
+import json
+import time
+import logging
+import random
+import asyncio
+import datetime
+import threading
+import contextlib
+import importlib.util
+import collections
+import concurrent.futures
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gemini-1.5-flash-latest" # Modèle par défaut mis à jour
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()
+LLM_FALLBACK_PROVIDER = os.getenv("LLM_FALLBACK_PROVIDER", "").lower() or None
+LLM_FAILOVER_TIMEOUT_S = float(os.getenv("LLM_FAILOVER_TIMEOUT_S", 30)) # Au-delà, on bascule sur le secours
+# Appels résilients (voir ResilientProvider)
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", 60)) # Délai max d'une tentative (premier fragment en streaming)
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", 3)) # Tentatives par appel (erreurs transitoires et délais dépassés)
+LLM_BACKOFF_BASE_MS = float(os.getenv("LLM_BACKOFF_BASE_MS", 500)) # Attente de base entre tentatives (doublée à chaque essai)
+LLM_BACKOFF_MAX_MS = float(os.getenv("LLM_BACKOFF_MAX_MS", 8000)) # Plafond de cette attente
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() in ("true", "1", "t") # Seconde requête si la première tarde (coût doublé sur ces appels)
+LLM_HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", 2000)) # Délai minimal avant la requête de couverture (sinon p95 observé)
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5)) # Échecs consécutifs ouvrant le disjoncteur (0 : désactivé)
+LLM_BREAKER_RESET_S = float(os.getenv("LLM_BREAKER_RESET_S", 30)) # Durée d'ouverture avant un appel d'essai
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", 64)) # Appels (threads) en cours vers le backend, tentatives abandonnées comprises
+# SDK des backends (google.generativeai, litellm) importé au premier appel, sauf LLM_PRELOAD_SDK=true (import au démarrage)
+LLM_PRELOAD_SDK = os.getenv("LLM_PRELOAD_SDK", "false").lower() in ("true", "1", "t")
+
+LLM_CALL_EVENTS = metrics.Counter(
+    "llm_calls_total", "Tentatives d'appel au modèle : success, retry, timeout, failed, hedged, hedge_won, circuit_open.",
+    labelnames=("outcome",)
+)
+
+
+# --- Erreurs communes aux backends ---
+class LLMError(Exception):
+    """Erreur générique d'un backend LLM."""
+
+class BlockedPromptError(LLMError):
+    """Le message a été refusé par les filtres du backend."""
+
+class GenerationStoppedError(LLMError):
+    """La génération a été interrompue par le backend."""
+
+class QuotaExceededError(LLMError):
+    """Le fournisseur refuse l'appel : quota ou limite de débit atteint."""
+
+class TransientError(LLMError):
+    """Erreur passagère du fournisseur (indisponibilité, erreur interne) : l'appel peut être retenté."""
+
+class UpstreamTimeoutError(LLMError):
+    """Le backend n'a pas répondu dans le délai d'une tentative."""
+
+class CircuitOpenError(LLMError):
+    """Appel refusé sans essai : le backend est considéré indisponible (disjoncteur ouvert)."""
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after # Secondes avant le prochain appel d'essai
+
+class UpstreamBusyError(CircuitOpenError):
+    """Appel refusé sans essai : toutes les places vers le backend sont prises, y compris par des
+    tentatives abandonnées (délai dépassé) dont le thread attend encore la réponse du backend."""
+
+
+def _sdk_installed(module_name):
+    """Vrai si le module du SDK est installé (vérifié sans l'importer)."""
+    try:
+        return importlib.util.find_spec(module_name) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+class ChatProvider:
+    """Interface d'un backend : un tour de chat (complet, streamé, sync ou async) et une complétion simple."""
+    name = "base"
+    model_name = None
+
+    @property
+    def ready(self):
+        """Vrai si le backend est configuré et utilisable."""
+        return True
+
+    def generate(self, system_instruction, history, message):
+        """Retourne la réponse complète au message, dans le contexte de l'historique."""
+        raise NotImplementedError
+
+    def stream(self, system_instruction, history, message):
+        """Itère sur les fragments de texte de la réponse. Par défaut : un seul fragment."""
+        yield self.generate(system_instruction, history, message)
+
+    async def generate_async(self, system_instruction, history, message):
+        return await asyncio.to_thread(self.generate, system_instruction, history, message)
+
+    async def stream_async(self, system_instruction, history, message):
+        yield await self.generate_async(system_instruction, history, message)
+
+    def complete(self, prompt):
+        """Complétion simple, hors conversation (ex: résumés)."""
+        return self.generate(None, [], prompt)
+
+    def warm_up(self):
+        """Charge le SDK du backend hors du chemin d'une requête (sinon au premier appel)."""
+
+
+# --- Backend Gemini (google.generativeai) ---
+class GeminiProvider(ChatProvider):
+    """Backend Gemini. Un GenerativeModel est mémorisé par instruction système ; avec context_cache,
+    l'instruction est placée dans un cache de contexte Gemini (renouvelé à expiration)."""
+    name = "gemini"
+
+    def __init__(self, api_key, model_name, context_cache=False, context_cache_ttl_minutes=60, preload_sdk=False,
+                 response_schema=None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.response_schema = response_schema # Schéma JSON imposé aux réponses (sortie structurée), ou None
+        self.context_cache = context_cache
+        self.context_cache_ttl = datetime.timedelta(minutes=context_cache_ttl_minutes)
+        self._models = {} # instruction système -> (GenerativeModel, expiration du cache de contexte ou None)
+        self._models_lock = threading.Lock()
+        self._genai = None # SDK importé et configuré au premier appel (voir _load_sdk)
+        self._sdk_lock = threading.Lock()
+        self._configured = bool(api_key) and _sdk_installed("google.generativeai")
+        if not api_key:
+            logger.critical("ERREUR critique: Clé API Gemini non trouvée.")
+        elif not self._configured:
+            logger.critical("ERREUR critique: SDK google-generativeai non installé.")
+        elif preload_sdk:
+            self.warm_up()
+
+    @property
+    def ready(self):
+        return self._configured
+
+    def _load_sdk(self):
+        """Importe et configure google.generativeai (import coûteux : grpc, protobuf) une seule fois par processus."""
+        with self._sdk_lock:
+            if self._genai is None:
+                import google.generativeai as genai
+                from google.api_core import exceptions as google_exceptions
+                try:
+                    genai.configure(api_key=self.api_key)
+                except Exception as e:
+                    self._configured = False
+                    logger.critical("ERREUR critique config genai: %s", e)
+                    raise
+                self.google_exceptions = google_exceptions
+                self._genai = genai
+                logger.info("SDK Google configuré (Modèle: %s)", self.model_name)
+        return self._genai
+
+    @property
+    def genai(self):
+        return self._genai or self._load_sdk()
+
+    def warm_up(self):
+        if self._configured: self._load_sdk()
+
+    def _get_model(self, system_instruction):
+        """Modèle configuré avec l'instruction système, mémorisé par processus.
+        En cas d'échec du cache de contexte (ex: prompt sous le minimum de tokens), instruction système simple."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        with self._models_lock:
+            cached = self._models.get(system_instruction)
+            if cached and (cached[1] is None or cached[1] > now):
+                return cached[0]
+
+            model, expires_at = None, None
+            if system_instruction and self.context_cache:
+                try:
+                    cached_content = self.genai.caching.CachedContent.create(
+                        model=f"models/{self.model_name}",
+                        display_name=f"spitfall-{len(self._models)}",
+                        system_instruction=system_instruction,
+                        ttl=self.context_cache_ttl
+                    )
+                    model = self.genai.GenerativeModel.from_cached_content(cached_content=cached_content, generation_config=self._generation_config())
+                    expires_at = now + self.context_cache_ttl - datetime.timedelta(minutes=1) # Marge avant expiration côté Gemini
+                    logger.info("Cache de contexte Gemini créé (%s caractères)", len(system_instruction))
+                except Exception as e:
+                    logger.warning("Cache de contexte Gemini indisponible, instruction système simple utilisée: %s", e)
+            if model is None:
+                if system_instruction:
+                    model = self.genai.GenerativeModel(self.model_name, system_instruction=system_instruction, generation_config=self._generation_config())
+                else:
+                    model = self.genai.GenerativeModel(self.model_name, generation_config=self._generation_config())
+            self._models[system_instruction] = (model, expires_at)
+            return model
+
+    def _generation_config(self):
+        """Réponse JSON conforme au schéma en mode structuré (Gemini ne connaît pas additionalProperties)."""
+        if not self.response_schema: return None
+        def strip(schema):
+            if isinstance(schema, dict):
+                return {key: strip(value) for key, value in schema.items() if key != "additionalProperties"}
+            return schema
+        return {"response_mime_type": "application/json", "response_schema": strip(self.response_schema)}
+
+    def _start_chat(self, system_instruction, history):
+        converted_history = [
+            {'role': "user" if entry["role"] == "user" else "model", 'parts': [entry["content"]]}
+            for entry in history
+        ]
+        return self._get_model(system_instruction).start_chat(history=converted_history)
+
+    def _translate_error(self, e):
+        """Convertit les exceptions du SDK en erreurs communes (les autres sont relancées telles quelles)."""
+        if self._genai is None: return e # Échec de l'import ou de la configuration du SDK lui-même
+        generation_types = self._genai.types.generation_types
+        if isinstance(e, generation_types.BlockedPromptException):
+            return BlockedPromptError(str(e))
+        if isinstance(e, generation_types.StopCandidateException):
+            return GenerationStoppedError(str(e))
+        if isinstance(e, self.google_exceptions.ResourceExhausted):
+            return QuotaExceededError(str(e))
+        if isinstance(e, (self.google_exceptions.ServiceUnavailable, self.google_exceptions.InternalServerError,
+                          self.google_exceptions.DeadlineExceeded, self.google_exceptions.Aborted)):
+            return TransientError(f"{type(e).__name__}: {e}")
+        return e
+
+    def extract_text(self, response):
+        """Extrait le texte d'une réponse Gemini (complète ou stream résolu), avec repli sur les candidates."""
+        ai_response = ""
+        try:
+             ai_response = response.text
+             logger.debug("Réponse Gemini reçue (via .text)")
+        except Exception as e:
+             logger.warning("Erreur accès .text réponse Gemini: %s - Vérification alternative via candidates...", e)
+             try:
+                 if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
+                     ai_response = " ".join([part.text for part in response.candidates[0].content.parts if hasattr(part, 'text')])
+                     logger.debug("Réponse Gemini reconstruite depuis parts")
+                 else:
+                     finish_reason_value = response.candidates[0].finish_reason if response.candidates else 0
+                     finish_reason_enum = None
+                     try: finish_reason_enum = self.genai.types.FinishReason(finish_reason_value)
+                     except ValueError: pass
+                     finish_reason_name = finish_reason_enum.name if finish_reason_enum else 'UNKNOWN'
+                     logger.warning("Réponse Gemini non textuelle ou bloquée. Reason: %s (%s)", finish_reason_name, finish_reason_value)
+                     if finish_reason_name == 'SAFETY': ai_response = "[Le contenu de la réponse a été bloqué pour des raisons de sécurité.]"
+                     elif finish_reason_name == 'RECITATION': ai_response = "[Le contenu de la réponse a été bloqué car il s'agissait de récitation.]"
+                     elif finish_reason_name == 'MAX_TOKENS': ai_response = "[La réponse a été coupée car elle était trop longue.]"
+                     else: ai_response = "[Erreur lors de la réception de la réponse de l'IA.]"
+             except Exception as inner_e:
+                 logger.error("Erreur interne traitement alternatif réponse Gemini: %s", inner_e)
+                 ai_response = "[Erreur interne lors du traitement de la réponse de l'IA.]"
+        return ai_response
+
+    @staticmethod
+    def _chunk_text(chunk):
+        try:
+            return chunk.text
+        except Exception:
+            return "" # Fragment sans texte (ex: bloqué), le texte final est résolu après le flux
+
+    def generate(self, system_instruction, history, message):
+        try:
+            response = self._start_chat(system_instruction, history).send_message(message)
+        except Exception as e:
+            raise self._translate_error(e)
+        with metrics.span("llm_response_parse"):
+            return self.extract_text(response)
+
+    def stream(self, system_instruction, history, message):
+        try:
+            response = self._start_chat(system_instruction, history).send_message(message, stream=True)
+            streamed_any = False
+            for chunk in response:
+                chunk_text = self._chunk_text(chunk)
+                if chunk_text:
+                    streamed_any = True
+                    yield chunk_text
+        except Exception as e:
+            raise self._translate_error(e)
+        if not streamed_any:
+            yield self.extract_text(response) # Réponse bloquée ou vide : message de repli
+
+    async def generate_async(self, system_instruction, history, message):
+        try:
+            response = await self._start_chat(system_instruction, history).send_message_async(message)
+        except Exception as e:
+            raise self._translate_error(e)
+        with metrics.span("llm_response_parse"):
+            return self.extract_text(response)
+
+    async def stream_async(self, system_instruction, history, message):
+        try:
+            response = await self._start_chat(system_instruction, history).send_message_async(message, stream=True)
+            streamed_any = False
+            async for chunk in response:
+                chunk_text = self._chunk_text(chunk)
+                if chunk_text:
+                    streamed_any = True
+                    yield chunk_text
+        except Exception as e:
+            raise self._translate_error(e)
+        if not streamed_any:
+            yield self.extract_text(response)
+
+    def complete(self, prompt):
+        try:
+            response = self._get_model(None).generate_content(prompt)
+        except Exception as e:
+            raise self._translate_error(e)
+        return self.extract_text(response)
+
+
+# --- Backend LiteLLM (OpenAI, Anthropic, Mistral... via une API commune) ---
+class LiteLLMProvider(ChatProvider):
+    """Backend générique via litellm (LITELLM_MODEL, clés API lues par litellm dans l'environnement)."""
+    name = "litellm"
+
+    def __init__(self, model_name, preload_sdk=False, response_schema=None):
+        self.model_name = model_name
+        # Sortie structurée : réponse JSON conforme au schéma (format OpenAI, traduit par litellm)
+        self._options = {"response_format": {"type": "json_schema", "json_schema": {"name": "turn", "schema": response_schema, "strict": True}}} if response_schema else {}
+        self._litellm = None # Importé au premier appel (import coûteux)
+        self._sdk_lock = threading.Lock()
+        self._installed = _sdk_installed("litellm")
+        if not self._installed:
+            logger.critical("ERREUR critique: SDK litellm non installé.")
+        elif preload_sdk:
+            self.warm_up()
+
+    @property
+    def ready(self):
+        return bool(self.model_name) and self._installed
+
+    @property
+    def litellm(self):
+        if self._litellm is None:
+            with self._sdk_lock:
+                if self._litellm is None:
+                    import litellm
+                    self._litellm = litellm
+        return self._litellm
+
+    def warm_up(self):
+        self.litellm
+
+    @staticmethod
+    def _messages(system_instruction, history, message):
+        messages = [{"role": "system", "content": system_instruction}] if system_instruction else []
+        messages += [{"role": entry["role"], "content": entry["content"]} for entry in history]
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    def _translate_error(self, e):
+        """Convertit les exceptions litellm en erreurs communes (les autres sont relancées telles quelles)."""
+        if self._litellm is None: return e
+        if isinstance(e, self.litellm.RateLimitError):
+            return QuotaExceededError(str(e))
+        if isinstance(e, (self.litellm.ServiceUnavailableError, self.litellm.InternalServerError,
+                          self.litellm.Timeout, self.litellm.APIConnectionError)):
+            return TransientError(f"{type(e).__name__}: {e}")
+        return e
+
+    def generate(self, system_instruction, history, message):
+        try:
+            response = self.litellm.completion(model=self.model_name, messages=self._messages(system_instruction, history, message), **self._options)
+        except Exception as e:
+            raise self._translate_error(e)
+        return response.choices[0].message.content or ""
+
+    def stream(self, system_instruction, history, message):
+        try:
+            response = self.litellm.completion(model=self.model_name, messages=self._messages(system_instruction, history, message), stream=True, **self._options)
+            for chunk in response:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+        except Exception as e:
+            raise self._translate_error(e)
+
+    async def generate_async(self, system_instruction, history, message):
+        try:
+            response = await self.litellm.acompletion(model=self.model_name, messages=self._messages(system_instruction, history, message), **self._options)
+        except Exception as e:
+            raise self._translate_error(e)
+        return response.choices[0].message.content or ""
+
+    async def stream_async(self, system_instruction, history, message):
+        try:
+            response = await self.litellm.acompletion(model=self.model_name, messages=self._messages(system_instruction, history, message), stream=True, **self._options)
+            async for chunk in response:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+        except Exception as e:
+            raise self._translate_error(e)
+
+
+# --- Backend factice local (benchmarks et tests de charge hors quota) ---
+class MockProvider(ChatProvider):
+    """Narrateur déterministe : répond avec une courte narration et des choix A)/B)/C),
+    après une latence configurable (premier fragment puis fragments suivants).
+    Pour éprouver les nouvelles tentatives et le hedging : une part des appels peut échouer
+    (TransientError, failure_rate) ou être 10 fois plus lente (slow_rate)."""
+    name = "mock"
+    model_name = "mock"
+
+    SCENES = ["une crypte humide", "un pont suspendu", "une taverne enfumée", "un laboratoire abandonné", "une clairière silencieuse"]
+    ITEMS = ["une lanterne", "une clé rouillée", "une corde", "une carte déchirée"]
+    ACTIONS = ["Examiner les lieux", "Suivre l'inconnu", "Fouiller ton sac", "Forcer la porte", "Appeler à l'aide", "Attendre en silence"]
+
+    def __init__(self, latency_ms=800, first_chunk_ms=150, chunks=8, failure_rate=0.0, slow_rate=0.0, response_schema=None):
+        self.response_schema = response_schema # Réponses JSON (narration, choix, inventaire) en mode structuré
+        self.latency = latency_ms / 1000
+        self.first_chunk_latency = min(first_chunk_ms / 1000, self.latency)
+        self.chunks = max(1, chunks)
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+
+    def _fault(self):
+        """Tirage des pannes simulées : lève TransientError ou retourne le facteur de latence (1 ou 10)."""
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise TransientError("panne simulée du backend mock")
+        return 10 if self.slow_rate and random.random() < self.slow_rate else 1
+
+    def _reply(self, history, message):
+        # Graine dérivée du contexte : même historique + même message => même réponse
+        rng = random.Random(f"{len(history)}|{message}")
+        turn = len([entry for entry in history if entry.get("role") == "assistant"]) + 1
+        scene = rng.choice(self.SCENES)
+        choices = rng.sample(self.ACTIONS, 3)
+        narration = f"Tour {turn} : tu avances vers {scene}. Le silence est lourd, quelque chose t'observe."
+        if self.response_schema:
+            found = [rng.choice(self.ITEMS)] if rng.random() < 0.3 else []
+            return json.dumps({"narration": narration, "choices": choices, "inventory_add": found,
+                               "inventory_remove": [], "story_end": False}, ensure_ascii=False)
+        return "\n".join([narration, f"A) {choices[0]}", f"B) {choices[1]}", f"C) {choices[2]}"])
+
+    def _fragments(self, text):
+        words = re.split(r"(?<= )", text)
+        size = max(1, len(words) // self.chunks + 1)
+        return ["".join(words[i:i + size]) for i in range(0, len(words), size)]
+
+    def _chunk_delays(self, count):
+        remaining = max(0.0, self.latency - self.first_chunk_latency)
+        return [self.first_chunk_latency] + [remaining / max(1, count - 1)] * (count - 1)
+
+    def generate(self, system_instruction, history, message):
+        time.sleep(self.latency * self._fault())
+        return self._reply(history, message)
+
+    def stream(self, system_instruction, history, message):
+        slowdown = self._fault()
+        fragments = self._fragments(self._reply(history, message))
+        for fragment, delay in zip(fragments, self._chunk_delays(len(fragments))):
+            time.sleep(delay * slowdown)
+            yield fragment
+
+    async def generate_async(self, system_instruction, history, message):
+        await asyncio.sleep(self.latency * self._fault())
+        return self._reply(history, message)
+
+    async def stream_async(self, system_instruction, history, message):
+        slowdown = self._fault()
+        fragments = self._fragments(self._reply(history, message))
+        for fragment, delay in zip(fragments, self._chunk_delays(len(fragments))):
+            await asyncio.sleep(delay * slowdown)
+            yield fragment
+
+    def complete(self, prompt):
+        time.sleep(self.latency)
+        return "Résumé : le joueur progresse. Inventaire : (inchangé). PNJ : (inchangés)."
+
+
+# --- Bascule entre backends ---
+class FailoverProvider(ChatProvider):
+    """Essaie le backend principal ; en cas d'erreur (hors refus de contenu) ou de dépassement de
+    timeout, bascule sur le backend de secours. En streaming, la bascule n'a lieu qu'avant le premier fragment."""
+    name = "failover"
+
+    def __init__(self, primary, fallback, timeout_s, shared=None):
+        self.primary = primary
+        self.fallback = fallback
+        self.timeout_s = timeout_s
+        self.model_name = primary.model_name
+        # shared : bascule des mêmes backends (autre schéma de réponse) dont les threads sont repris
+        self._executor = shared._executor if shared else concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix='llm-failover')
+
+    @property
+    def ready(self):
+        return self.primary.ready or self.fallback.ready
+
+    def warm_up(self):
+        self.primary.warm_up()
+        self.fallback.warm_up()
+
+    def _log_failover(self, reason):
+        logger.warning("Backend LLM '%s' en échec (%s), bascule sur '%s'", self.primary.name, reason, self.fallback.name)
+
+    def generate(self, system_instruction, history, message):
+        if not self.primary.ready:
+            return self.fallback.generate(system_instruction, history, message)
+        future = self._executor.submit(self.primary.generate, system_instruction, history, message)
+        try:
+            return future.result(timeout=self.timeout_s)
+        except BlockedPromptError:
+            raise
+        except concurrent.futures.TimeoutError:
+            self._log_failover(f"timeout {self.timeout_s}s")
+        except Exception as e:
+            self._log_failover(type(e).__name__)
+        return self.fallback.generate(system_instruction, history, message)
+
+    def stream(self, system_instruction, history, message):
+        started = False
+        try:
+            if not self.primary.ready: raise LLMError("backend principal non configuré")
+            for fragment in self.primary.stream(system_instruction, history, message):
+                started = True
+                yield fragment
+            return
+        except BlockedPromptError:
+            raise
+        except Exception as e:
+            if started: raise
+            self._log_failover(type(e).__name__)
+        yield from self.fallback.stream(system_instruction, history, message)
+
+    async def generate_async(self, system_instruction, history, message):
+        if not self.primary.ready:
+            return await self.fallback.generate_async(system_instruction, history, message)
+        try:
+            return await asyncio.wait_for(self.primary.generate_async(system_instruction, history, message), self.timeout_s)
+        except BlockedPromptError:
+            raise
+        except asyncio.TimeoutError:
+            self._log_failover(f"timeout {self.timeout_s}s")
+        except Exception as e:
+            self._log_failover(type(e).__name__)
+        return await self.fallback.generate_async(system_instruction, history, message)
+
+    async def stream_async(self, system_instruction, history, message):
+        started = False
+        try:
+            if not self.primary.ready: raise LLMError("backend principal non configuré")
+            async for fragment in self.primary.stream_async(system_instruction, history, message):
+                started = True
+                yield fragment
+            return
+        except BlockedPromptError:
+            raise
+        except Exception as e:
+            if started: raise
+            self._log_failover(type(e).__name__)
+        async for fragment in self.fallback.stream_async(system_instruction, history, message):
+            yield fragment
+
+    def complete(self, prompt):
+        try:
+            if not self.primary.ready: raise LLMError("backend principal non configuré")
+            return self.primary.complete(prompt)
+        except Exception as e:
+            self._log_failover(type(e).__name__)
+            return self.fallback.complete(prompt)
+
+
+# --- Appels résilients : délais, nouvelles tentatives, hedging, disjoncteur ---
+class CircuitBreaker:
+    """Disjoncteur : ouvert après `failure_threshold` échecs consécutifs, il refuse les appels pendant
+    `reset_s`, puis laisse passer un seul appel d'essai (succès : refermé, échec : rouvert).
+    Chaque appel passe par call() : un appel d'essai se conclut toujours, même sans réponse exploitable."""
+
+    def __init__(self, failure_threshold=5, reset_s=30):
+        self.failure_threshold = failure_threshold
+        self.reset_s = reset_s
+        self._failures = 0
+        self._opened_at = None # None : fermé
+        self._probing = False
+        self._probe_id = 0 # Identifie l'appel d'essai en cours
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Lève CircuitOpenError si l'appel doit être refusé sans essai ; retourne l'identifiant de
+        l'appel d'essai si cet appel en est un (demi-ouvert), sinon None."""
+        if not self.failure_threshold: return None
+        with self._lock:
+            if self._opened_at is None: return None
+            remaining = self._opened_at + self.reset_s - time.monotonic()
+            if remaining > 0 or self._probing:
+                LLM_CALL_EVENTS.inc(outcome="circuit_open")
+                raise CircuitOpenError("backend LLM indisponible (disjoncteur ouvert)", max(1, int(remaining + 0.999)))
+            self._probing = True # Demi-ouvert : cet appel sert d'essai
+            self._probe_id += 1
+            return self._probe_id
+
+    @contextlib.contextmanager
+    def call(self, failures=()):
+        """Encadre une tentative (le succès est compté par record_success) : une erreur de `failures` est
+        comptée comme échec. Un appel d'essai se conclut toujours : une autre erreur du backend (quota,
+        contenu refusé) prouve qu'il répond (succès) ; un appel annulé, abandonné ou une erreur inattendue
+        compte comme un échec. Sinon le disjoncteur resterait demi-ouvert, refusant tout appel."""
+        probe = self.before_call()
+        try:
+            yield
+        except UpstreamBusyError:
+            if probe is not None: self._end_probe(probe, None) # Aucun appel parti : l'essai est seulement rendu
+            raise
+        except failures:
+            self.record_failure()
+            raise
+        except BaseException as e:
+            if probe is not None: self._end_probe(probe, isinstance(e, LLMError))
+            raise
+        else:
+            if probe is not None: self._end_probe(probe, True)
+
+    def _end_probe(self, probe, succeeded):
+        """Conclut l'appel d'essai `probe` s'il ne l'a pas encore été (succeeded None : sans verdict,
+        le disjoncteur reste ouvert et le prochain appel sert d'essai)."""
+        with self._lock:
+            if not (self._probing and self._probe_id == probe): return
+            if succeeded is None:
+                self._probing = False
+                return
+        self.record_success() if succeeded else self.record_failure()
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Backend LLM rétabli : disjoncteur refermé")
+            self._failures, self._opened_at, self._probing = 0, None, False
+
+    def record_failure(self):
+        if not self.failure_threshold: return
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                logger.warning("Backend LLM en échec (%s échecs consécutifs) : disjoncteur ouvert pour %ss", self._failures, self.reset_s)
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class ResilientProvider(ChatProvider):
+    """Enveloppe un backend : chaque tentative a un délai maximal, les erreurs transitoires et délais
+    dépassés sont retentés après une attente exponentielle aléatoire (« full jitter »), une requête de
+    couverture peut partir si la première dépasse le p95 observé (hedge), et un disjoncteur refuse
+    immédiatement les appels quand le backend est en panne. En streaming, le délai porte sur le premier
+    fragment et seules les tentatives avant celui-ci sont retentées, sans hedging.
+    Les appels synchrones partent dans des threads : une tentative abandonnée (délai dépassé, couverture
+    perdante) garde le sien jusqu'à la réponse du backend. Au plus `max_inflight` appels sont en cours,
+    abandonnés compris (donc au plus `max_inflight` threads retenus) ; au-delà, l'appel est refusé
+    (UpstreamBusyError) sans atteindre le réseau, et la couverture n'est envoyée que si une place est libre.
+    `shared` : enveloppe du même backend (autre schéma de réponse) dont le disjoncteur, les places, les
+    threads et la fenêtre de latence sont repris, pour un seul état par backend."""
+    RETRYABLE = (TransientError, UpstreamTimeoutError, ConnectionError)
+
+    def __init__(self, inner, timeout_s=60, max_attempts=3, backoff_base_s=0.5, backoff_max_s=8,
+                 hedge=False, hedge_min_delay_s=2, breaker=None, max_inflight=64, shared=None):
+        self.inner = inner
+        self.name = inner.name
+        self.model_name = inner.model_name
+        self.timeout_s = timeout_s
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.hedge = hedge
+        self.hedge_min_delay_s = hedge_min_delay_s
+        self.breaker = breaker or CircuitBreaker(0)
+        if shared is not None: # Même backend : un seul disjoncteur, une seule limite d'appels en cours
+            self.breaker, self.max_inflight = shared.breaker, shared.max_inflight
+            self._latencies, self._inflight, self._executor = shared._latencies, shared._inflight, shared._executor
+            return
+        self._latencies = collections.deque(maxlen=200) # Durées des dernières tentatives réussies (appels complets)
+        # Une place par thread : une place obtenue trouve toujours un thread libre (pas d'attente dans le pool)
+        self.max_inflight = max(1, max_inflight)
+        self._inflight = threading.BoundedSemaphore(self.max_inflight)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix='llm-call')
+
+    @property
+    def ready(self):
+        return self.inner.ready
+
+    def warm_up(self):
+        self.inner.warm_up()
+
+    def _backoff_s(self, attempt):
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** attempt))
+
+    def _hedge_delay_s(self):
+        """Attente avant la requête de couverture : p95 des dernières tentatives (au moins le minimum)."""
+        if len(self._latencies) < 20: return self.hedge_min_delay_s
+        ordered = sorted(self._latencies)
+        return max(self.hedge_min_delay_s, ordered[int(len(ordered) * 0.95) - 1])
+
+    def _record(self, started, sample=True):
+        """Tentative réussie ; sample=False (premier fragment d'un flux) : hors de la fenêtre du p95 des appels complets."""
+        if sample: self._latencies.append(time.monotonic() - started)
+        self.breaker.record_success()
+        LLM_CALL_EVENTS.inc(outcome="success")
+
+    def _on_failure(self, e, attempt):
+        """Compte l'échec d'une tentative ; retourne vrai s'il faut réessayer."""
+        if not isinstance(e, self.RETRYABLE):
+            return False
+        if attempt + 1 >= self.max_attempts:
+            LLM_CALL_EVENTS.inc(outcome="failed")
+            return False
+        LLM_CALL_EVENTS.inc(outcome="retry")
+        logger.warning("Appel LLM en échec (%s), nouvelle tentative %s/%s", type(e).__name__, attempt + 2, self.max_attempts)
+        return True
+
+    # --- Appels synchrones ---
+    def _submit(self, wait_s, func, *args):
+        """Lance func dans un thread dès qu'une place est libre (attente max wait_s) ; retourne la future,
+        ou None faute de place. La place n'est rendue qu'au retour effectif du backend."""
+        if not self._inflight.acquire(timeout=max(0.0, wait_s)): return None
+
+        def run():
+            try:
+                return func(*args)
+            finally:
+                self._inflight.release()
+        future = self._executor.submit(run)
+        future.add_done_callback(lambda f: self._inflight.release() if f.cancelled() else None) # Jamais démarrée
+        return future
+
+    def _busy_error(self):
+        LLM_CALL_EVENTS.inc(outcome="busy")
+        return UpstreamBusyError(f"{self.max_inflight} appels au backend LLM déjà en cours", max(1, int(self.timeout_s)))
+
+    def _attempt(self, func, *args):
+        """Une tentative (éventuellement doublée d'une requête de couverture) dans le délai imparti."""
+        started = time.monotonic()
+        deadline = started + self.timeout_s
+        future = self._submit(self.timeout_s, func, *args)
+        if future is None: raise self._busy_error()
+        futures = [future]
+        if self.hedge:
+            done, _ = concurrent.futures.wait(futures, timeout=max(0, min(self._hedge_delay_s(), deadline - time.monotonic())))
+            if not done:
+                hedge = self._submit(0, func, *args) # Couverture seulement si une place est libre tout de suite
+                if hedge is not None:
+                    LLM_CALL_EVENTS.inc(outcome="hedged")
+                    futures.append(hedge)
+        first_error = None
+        pending = set(futures)
+        while pending:
+            done, pending = concurrent.futures.wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done: break
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]: LLM_CALL_EVENTS.inc(outcome="hedge_won")
+                    for other in pending: other.cancel() # Celles déjà démarrées se terminent et sont ignorées
+                    self._record(started)
+                    return future.result()
+                first_error = first_error or future.exception()
+        if first_error is not None and not pending:
+            raise first_error
+        LLM_CALL_EVENTS.inc(outcome="timeout")
+        raise UpstreamTimeoutError(f"pas de réponse du backend LLM en {self.timeout_s}s")
+
+    def _call(self, func, *args):
+        for attempt in range(self.max_attempts):
+            try:
+                with self.breaker.call(self.RETRYABLE):
+                    return self._attempt(func, *args)
+            except Exception as e:
+                if not self._on_failure(e, attempt): raise
+            time.sleep(self._backoff_s(attempt))
+
+    def generate(self, system_instruction, history, message):
+        return self._call(self.inner.generate, system_instruction, history, message)
+
+    def complete(self, prompt):
+        return self._call(self.inner.complete, prompt)
+
+    def _first_fragment(self, fragments):
+        """Premier fragment d'un flux synchrone (None si vide), attendu au plus timeout_s.
+        En cas de délai dépassé, le flux est fermé dès que le backend rend la main."""
+        started = time.monotonic()
+        future = self._submit(self.timeout_s, next, fragments, None)
+        if future is None: raise self._busy_error()
+        try:
+            return future.result(timeout=max(0, started + self.timeout_s - time.monotonic()))
+        except concurrent.futures.TimeoutError:
+            future.add_done_callback(lambda _: fragments.close() if hasattr(fragments, 'close') else None)
+            LLM_CALL_EVENTS.inc(outcome="timeout")
+            raise UpstreamTimeoutError(f"pas de premier fragment du backend LLM en {self.timeout_s}s") from None
+
+    def stream(self, system_instruction, history, message):
+        for attempt in range(self.max_attempts):
+            try:
+                with self.breaker.call(self.RETRYABLE):
+                    started = time.monotonic()
+                    fragments = iter(self.inner.stream(system_instruction, history, message))
+                    first = self._first_fragment(fragments)
+                    self._record(started, sample=False)
+            except Exception as e:
+                if not self._on_failure(e, attempt): raise
+                time.sleep(self._backoff_s(attempt))
+                continue
+            if first is not None: yield first
+            yield from fragments
+            return
+
+    # --- Appels asyncio ---
+    async def _attempt_async(self, make_call):
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(make_call())]
+        try:
+            if self.hedge:
+                done, _ = await asyncio.wait(tasks, timeout=min(self._hedge_delay_s(), self.timeout_s))
+                if not done:
+                    LLM_CALL_EVENTS.inc(outcome="hedged")
+                    tasks.append(asyncio.ensure_future(make_call()))
+            first_error = None
+            pending = set(tasks)
+            deadline = started + self.timeout_s
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+                if not done: break
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]: LLM_CALL_EVENTS.inc(outcome="hedge_won")
+                        self._record(started)
+                        return task.result()
+                    first_error = first_error or task.exception()
+            if first_error is not None and not pending:
+                raise first_error
+            LLM_CALL_EVENTS.inc(outcome="timeout")
+            raise UpstreamTimeoutError(f"pas de réponse du backend LLM en {self.timeout_s}s")
+        finally:
+            for task in tasks:
+                if not task.done(): task.cancel() # En asyncio, la requête perdante est réellement annulée
+
+    async def generate_async(self, system_instruction, history, message):
+        for attempt in range(self.max_attempts):
+            try:
+                with self.breaker.call(self.RETRYABLE):
+                    return await self._attempt_async(lambda: self.inner.generate_async(system_instruction, history, message))
+            except Exception as e:
+                if not self._on_failure(e, attempt): raise
+            await asyncio.sleep(self._backoff_s(attempt))
+
+    async def stream_async(self, system_instruction, history, message):
+        for attempt in range(self.max_attempts):
+            try:
+                with self.breaker.call(self.RETRYABLE):
+                    started = time.monotonic()
+                    fragments = self.inner.stream_async(system_instruction, history, message).__aiter__()
+                    try:
+                        first = await asyncio.wait_for(fragments.__anext__(), self.timeout_s)
+                    except StopAsyncIteration:
+                        self._record(started, sample=False)
+                        return
+                    except asyncio.TimeoutError:
+                        await fragments.aclose()
+                        LLM_CALL_EVENTS.inc(outcome="timeout")
+                        raise UpstreamTimeoutError(f"pas de premier fragment du backend LLM en {self.timeout_s}s") from None
+                    self._record(started, sample=False)
+            except Exception as e:
+                if not self._on_failure(e, attempt): raise
+                await asyncio.sleep(self._backoff_s(attempt))
+                continue
+            yield first
+            async for fragment in fragments:
+                yield fragment
+            return
+
+
+def build_provider(name, response_schema=None):
+    """Instancie un backend à partir de son nom et des variables d'environnement
+    (response_schema : réponses JSON conformes à ce schéma)."""
+    if name == "gemini":
+        return GeminiProvider(
+            api_key=os.getenv("GEMINI_API_KEY"),
+            model_name=os.getenv("GEMINI_MODEL", DEFAULT_MODEL),
+            context_cache=os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() in ('true', '1', 't'),
+            context_cache_ttl_minutes=int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_MINUTES", 60)),
+            preload_sdk=LLM_PRELOAD_SDK, response_schema=response_schema
+        )
+    if name == "litellm":
+        return LiteLLMProvider(os.getenv("LITELLM_MODEL"), preload_sdk=LLM_PRELOAD_SDK, response_schema=response_schema)
+    if name == "mock":
+        return MockProvider(
+            latency_ms=float(os.getenv("MOCK_LLM_LATENCY_MS", 800)),
+            first_chunk_ms=float(os.getenv("MOCK_LLM_FIRST_CHUNK_MS", 150)),
+            chunks=int(os.getenv("MOCK_LLM_CHUNKS", 8)),
+            failure_rate=float(os.getenv("MOCK_LLM_FAILURE_RATE", 0)),
+            slow_rate=float(os.getenv("MOCK_LLM_SLOW_RATE", 0)),
+            response_schema=response_schema
+        )
+    raise ValueError(f"Backend LLM inconnu: {name}")
+
+
+def build_resilient_provider(name, response_schema=None, shared=None):
+    """Backend `name` enveloppé des délais, nouvelles tentatives, hedging et disjoncteur (LLM_*) ;
+    shared : enveloppe existante du même backend dont l'état est partagé."""
+    return ResilientProvider(
+        build_provider(name, response_schema), timeout_s=LLM_TIMEOUT_S, max_attempts=LLM_MAX_ATTEMPTS,
+        backoff_base_s=LLM_BACKOFF_BASE_MS / 1000, backoff_max_s=LLM_BACKOFF_MAX_MS / 1000,
+        hedge=LLM_HEDGE, hedge_min_delay_s=LLM_HEDGE_MIN_DELAY_MS / 1000,
+        breaker=CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_S), max_inflight=LLM_MAX_INFLIGHT, shared=shared
+    )
+
+
+def build_provider_from_env(response_schema=None, shared=None):
+    """Backend principal (LLM_PROVIDER), enveloppé d'une bascule si LLM_FALLBACK_PROVIDER est défini.
+    shared : fournisseur déjà construit par cette fonction (autre schéma de réponse) ; les deux partagent
+    disjoncteurs, places d'appel, threads et fenêtres de latence, un backend en panne l'étant pour tous."""
+    primary = build_resilient_provider(LLM_PROVIDER, response_schema, getattr(shared, 'primary', shared))
+    if LLM_FALLBACK_PROVIDER and LLM_FALLBACK_PROVIDER != LLM_PROVIDER:
+        logger.info("Backend LLM: %s (secours: %s, timeout %ss)", primary.name, LLM_FALLBACK_PROVIDER, LLM_FAILOVER_TIMEOUT_S)
+        fallback = build_resilient_provider(LLM_FALLBACK_PROVIDER, response_schema, getattr(shared, 'fallback', None))
+        return FailoverProvider(primary, fallback, LLM_FAILOVER_TIMEOUT_S, shared)
+    logger.info("Backend LLM: %s (modèle: %s)", primary.name, primary.model_name)
+    return primary
+
+# --- FIN llm.py ---
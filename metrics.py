@@ -0,0 +1,130 @@
+# metrics.py
+# Métriques en mémoire du pipeline de chat : durée de chaque étape d'un tour (histogrammes)
+# et compteurs de requêtes, exposés au format texte Prometheus sur /metrics.
+# Les valeurs sont propres au processus : avec plusieurs workers, chaque scrape n'en voit qu'un.
+import os
+import time
+import bisect
+import threading
+import contextlib
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("true", "1", "t")
+# Bornes des histogrammes de durée (secondes) : du cache mémoire (~ms) à l'appel modèle (~dizaines de s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs: return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, int): return str(value)
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Counter:
+    """Compteur monotone, éventuellement ventilé par labels."""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock: _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED: return
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock: values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """Histogramme cumulatif à bornes fixes (compatible Prometheus), ventilé par labels."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # labels -> [comptes par borne (+Inf inclus), somme, total]
+        self._lock = threading.Lock()
+        with _registry_lock: _registry.append(self)
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED: return
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        with self._lock:
+            snapshot = {key: (list(series[0]), series[1], series[2]) for key, series in self._series.items()}
+        lines = []
+        for key, (counts, total_sum, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# --- Métriques du pipeline de chat ---
+CHAT_STAGE_SECONDS = Histogram(
+    "chat_stage_seconds", "Durée de chaque étape d'un tour de chat.", labelnames=("stage",)
+)
+CHAT_REQUESTS = Counter(
+    "chat_requests_total", "Requêtes de chat traitées, par point d'entrée et code HTTP.", labelnames=("endpoint", "status")
+)
+
+
+def observe_stage(stage, seconds):
+    """Enregistre la durée d'une étape du pipeline (request_parse, db_read, llm_total...)."""
+    CHAT_STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+@contextlib.contextmanager
+def span(stage):
+    """Chronomètre le bloc et enregistre sa durée sous l'étape donnée (même en cas d'exception)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def render_prometheus():
+    """Toutes les métriques enregistrées, au format d'exposition texte Prometheus."""
+    with _registry_lock: metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+# --- FIN metrics.py ---
@@ -0,0 +1,138 @@
+# openings.py
+# Réserve de scènes d'ouverture pré-générées : la première réplique d'une partie ne dépend que du
+# thème, du public (âge) et du genre, tout le reste de l'instruction système étant commun. Quelques
+# ouvertures prêtes sont gardées par combinaison et remplacées en arrière-plan dès qu'une est servie :
+# une nouvelle partie se réduit alors à la création de la session en base.
+# L'état est propre au processus (remplissage à la première requête, donc après le fork des workers).
+import os
+import time
+import logging
+import threading
+import collections
+import concurrent.futures
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+OPENING_POOL_EVENTS = metrics.Counter(
+    "opening_pool_total", "Scènes d'ouverture : hit, miss, expired, generated, failed.", labelnames=("outcome",)
+)
+
+
+class OpeningPool:
+    """Ouvertures prêtes par clé (thème, âge, genre) : `depth` par clé, valables `ttl_s` secondes.
+    generate(clé) -> texte produit une ouverture (appelée dans les threads de remplissage).
+    Un thread par processus revoit chaque clé toutes les `check_interval_s` secondes (ouvertures
+    expirées retirées, manquantes relancées). Le remplissage initial est étalé sur `start_spread_s`
+    secondes (une clé demandée par un joueur passe devant) ; une clé en échec n'est retentée qu'après
+    une attente exponentielle (`retry_base_s` doublé à chaque échec, au plus `retry_max_s`)."""
+
+    def __init__(self, keys, generate, depth=2, ttl_s=3600, max_inflight=2,
+                 check_interval_s=30, start_spread_s=60, retry_base_s=5, retry_max_s=300):
+        self.keys = list(keys)
+        self.generate = generate
+        self.depth = depth
+        self.ttl_s = ttl_s
+        self.max_inflight = max_inflight
+        self.check_interval_s = check_interval_s
+        self.start_spread_s = start_spread_s
+        self.retry_base_s = retry_base_s
+        self.retry_max_s = retry_max_s
+        self._ready = collections.defaultdict(collections.deque) # clé -> [(expiration, texte)], la plus ancienne en tête
+        self._pending = collections.Counter() # clé -> générations en cours
+        self._failures = collections.Counter() # clé -> échecs consécutifs
+        self._start_at = {} # clé -> début de son remplissage initial (étalement)
+        self._retry_at = {} # clé -> fin de l'attente après un échec
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid = None # Processus ayant lancé le remplissage (repart de zéro après un fork)
+        self._executor = None
+
+    def ensure_started(self):
+        """Au premier usage dans ce processus : lance le thread de remplissage, qui étale les combinaisons."""
+        if self._pid == os.getpid(): return
+        with self._lock:
+            if self._pid == os.getpid(): return
+            self._ready.clear()
+            self._pending.clear()
+            self._failures.clear()
+            self._retry_at.clear()
+            now = time.monotonic()
+            step = self.start_spread_s / max(1, len(self.keys))
+            self._start_at = {key: now + i * step for i, key in enumerate(self.keys)}
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.max_inflight), thread_name_prefix='openings')
+            self._stop = threading.Event()
+            self._pid = os.getpid()
+            threading.Thread(target=self._loop, name='openings-refill', daemon=True).start()
+        logger.info("Remplissage de la réserve d'ouvertures (%s combinaisons x %s, étalé sur %ss)", len(self.keys), self.depth, self.start_spread_s)
+
+    def _loop(self):
+        while True:
+            now = time.monotonic()
+            for key in self.keys:
+                self._refill(key)
+            with self._lock:
+                upcoming = [at - now for at in list(self._start_at.values()) + list(self._retry_at.values()) if at > now]
+            if self._stop.wait(min([self.check_interval_s] + upcoming)): return
+
+    def stop(self):
+        self._stop.set()
+
+    def take(self, key):
+        """Retire et retourne une ouverture prête pour la clé (None si aucune) ; la remplaçante est lancée."""
+        if key not in self.keys: return None
+        self.ensure_started()
+        with self._lock:
+            self._drop_expired(key)
+            entries = self._ready[key]
+            text = entries.popleft()[1] if entries else None
+            self._start_at.pop(key, None) # Combinaison demandée : son remplissage n'attend plus son tour
+        OPENING_POOL_EVENTS.inc(outcome="hit" if text is not None else "miss")
+        self._refill(key)
+        return text
+
+    def _drop_expired(self, key):
+        """Retire les ouvertures expirées en tête de la clé (verrou pris)."""
+        entries = self._ready[key]
+        now = time.monotonic()
+        expired = 0
+        while entries and entries[0][0] <= now:
+            entries.popleft()
+            expired += 1
+        if expired: OPENING_POOL_EVENTS.inc(expired, outcome="expired")
+
+    def _refill(self, key):
+        """Lance les générations manquantes pour revenir à `depth` ouvertures valides (prêtes ou en cours),
+        sauf pendant l'étalement initial ou l'attente après un échec."""
+        if key not in self.keys: return
+        now = time.monotonic()
+        with self._lock:
+            if self._start_at.get(key, 0) > now or self._retry_at.get(key, 0) > now: return
+            self._drop_expired(key)
+            missing = self.depth - len(self._ready[key]) - self._pending[key]
+            if missing <= 0: return
+            self._pending[key] += missing
+        for _ in range(missing):
+            self._executor.submit(self._generate, key)
+
+    def _generate(self, key):
+        try:
+            text = self.generate(key)
+        except Exception as e:
+            OPENING_POOL_EVENTS.inc(outcome="failed")
+            with self._lock:
+                self._pending[key] -= 1
+                self._failures[key] += 1
+                delay = min(self.retry_max_s, self.retry_base_s * 2 ** (self._failures[key] - 1))
+                self._retry_at[key] = time.monotonic() + delay
+            logger.warning("Échec génération d'une ouverture %s (nouvel essai dans %ss): %s", key, delay, e)
+            return
+        OPENING_POOL_EVENTS.inc(outcome="generated")
+        with self._lock:
+            self._pending[key] -= 1
+            self._failures[key] = 0
+            self._retry_at.pop(key, None)
+            if text: self._ready[key].append((time.monotonic() + self.ttl_s, text))
+
+# --- FIN openings.py ---
@@ -15,6 +15,16 @@ A) [Description du choix A]
 B) [Description du choix B]
 C) [Description du choix C]
 Si tu ne proposes pas de choix explicites, termine toujours ta description en demandant 'Que fais-tu ?' (ou une formulation adaptée au contexte). Ne décide jamais de tes actions."""
+# Mode STRUCTURED_TURNS : remplace FORMAT_CHOIX_INSTRUCTION (réponse JSON au lieu des lignes A)/B)/C))
+STRUCTURED_FORMAT_INSTRUCTION = """
+FORMAT DE RÉPONSE : Réponds **uniquement** avec un objet JSON contenant :
+- "narration" : le texte de ta réplique, sans la liste des choix ;
+- "choices" : les actions proposées au joueur (trois au maximum, chacune en une courte phrase ; liste vide si tu demandes 'Que fais-tu ?') ;
+- "inventory_add" / "inventory_remove" : les objets que le joueur obtient / utilise ou perd pendant ce tour (listes vides sinon) ;
+- "story_end" : true uniquement quand l'aventure se termine à ce tour.
+Ne décide jamais des actions du joueur."""
+INVENTORY_STATE_TEMPLATE = "[Inventaire actuel du joueur : {items}]\n"
+
 TONE_TWIST_INSTRUCTION = """\n\nSTYLE DE NARRATION ET IMPRÉVISIBILITÉ : Sois très expressif/expressive, décrivant vivement émotions et réactions. **SURPRENDS LE JOUEUR !** N'hésite pas à introduire des **rebondissements inattendus**, des **révélations choquantes** . Utilise la **misdirection** et les **fausses pistes**. L'objectif est de rendre l'aventure dynamique, mémorable et **constamment surprenante**, tout en maintenant une cohérence interne (même si elle n'est révélée qu'à la fin)."""
 
 AGE_INSTRUCTIONS = {
@@ -40,6 +50,16 @@ NPC_INSTRUCTION = """\n\nPERSONNAGES NON-JOUEURS (PNJ - IA) : Peuple chaque aven
 4.  Un petit objectif ou secret (même simple).
 **TRÈS IMPORTANT :** Souviens-toi des interactions passées du joueur avec ces PNJ spécifiques. Fais-les réagir de manière cohérente en fonction de leur personnalité et de ce que le joueur leur a dit ou fait auparavant. Ils ne doivent pas être des coquilles vides qui oublient tout à chaque tour.""" # cite: 9
 
+# --- Résumé Glissant (compaction de l'historique) ---
+SUMMARY_INSTRUCTION = """Tu es l'assistant du narrateur d'une aventure textuelle. Mets à jour le résumé de l'aventure à partir du résumé précédent (s'il existe) et des nouveaux échanges ci-dessous.
+Le résumé sert de mémoire au narrateur : les échanges résumés ne lui seront plus relus.
+Conserve **obligatoirement** :
+- L'INVENTAIRE exact du joueur (objets obtenus, utilisés ou perdus) sous forme de liste.
+- Les PERSONNAGES NON-JOUEURS rencontrés : nom, apparence, personnalité, objectif/secret, et ce que le joueur leur a dit ou fait.
+- Les lieux visités, les indices découverts, les rebondissements et les décisions importantes du joueur.
+Sois factuel et concis (15 à 25 lignes maximum), en français, sans ajouter de nouveaux événements."""
+SUMMARY_HEADER = "[Résumé de l'aventure jusqu'ici (mémoire du narrateur)]"
+
 # --- Définition des Thèmes (Prompts Révisés) ---
 THEMES = [
     {
@@ -1,6 +1,9 @@
 -- schema.sql
 -- Ce script est destiné à être utilisé avec `flask init-db` pour une réinitialisation COMPLÈTE.
--- Il supprime l'ancienne table et la recrée avec la nouvelle colonne.
+-- Il supprime les anciennes tables et les recrée.
+DROP TABLE IF EXISTS session_search;
+DROP TABLE IF EXISTS archived_sessions;
+DROP TABLE IF EXISTS turns;
 DROP TABLE IF EXISTS sessions;
 
 CREATE TABLE sessions (
@@ -11,9 +14,42 @@ CREATE TABLE sessions (
     gender TEXT NOT NULL,                 -- Genre (Garçon/Fille)
     initial_turn_count INTEGER,           -- Nombre de tours visé au début (AJOUT)
     last_played TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, -- Date/heure dernière interaction
-    history TEXT                          -- Historique de la conversation (stocké en JSON)
+    history TEXT,                         -- Ancien historique JSON (migré vers turns par init_db, reste NULL)
+    summary TEXT,                         -- Résumé glissant des anciens tours
+    summary_upto INTEGER NOT NULL DEFAULT 0, -- Index du premier message non couvert par le résumé
+    version INTEGER NOT NULL DEFAULT 0    -- Nombre de messages (concurrence optimiste)
 );
 
--- Optionnel: Créer un index pour accélérer la recherche par nom ou date
--- CREATE INDEX idx_sessions_player_name ON sessions (player_name);
--- CREATE INDEX idx_sessions_last_played ON sessions (last_played);
\ No newline at end of file
+CREATE TABLE turns (
+    session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE, -- Session concernée
+    turn_index INTEGER NOT NULL,          -- Position du message dans l'historique (0, 1, 2...)
+    role TEXT NOT NULL,                   -- 'user' ou 'assistant'
+    content TEXT NOT NULL,                -- Texte du message
+    data TEXT,                            -- Sortie structurée du tour (JSON : choix, inventaire, fin), mode STRUCTURED_TURNS
+    PRIMARY KEY (session_id, turn_index)
+);
+
+CREATE TABLE archived_sessions (
+    session_id INTEGER PRIMARY KEY,       -- Session archivée (même ID qu'avant, restaurable)
+    player_name TEXT NOT NULL,            -- Nom du joueur
+    theme TEXT NOT NULL,                  -- Thème choisi
+    last_played TIMESTAMP NOT NULL,       -- Dernière interaction avant l'archivage
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, -- Date/heure de l'archivage
+    archive_file TEXT NOT NULL,           -- Fichier d'archive (dossier SESSION_ARCHIVE_PATH)
+    archive_offset BIGINT NOT NULL,       -- Position du membre gzip de la session dans ce fichier
+    archive_length INTEGER NOT NULL       -- Taille de ce membre gzip
+);
+
+-- Index pour la liste paginée des sessions (tri par date, filtres par nom ou thème)
+CREATE INDEX idx_sessions_last_played ON sessions (last_played DESC, id DESC);
+CREATE INDEX idx_sessions_player_name ON sessions (player_name, last_played DESC, id DESC);
+CREATE INDEX idx_sessions_theme ON sessions (theme, last_played DESC, id DESC);
+CREATE INDEX idx_archived_last_played ON archived_sessions (last_played DESC, session_id DESC);
+CREATE INDEX idx_archived_player_name ON archived_sessions (player_name, last_played DESC, session_id DESC);
+CREATE INDEX idx_archived_theme ON archived_sessions (theme, last_played DESC, session_id DESC);
+
+-- Index plein texte des messages (recherche /sessions/search) : une ligne par message, rowid = rowid de turns
+CREATE VIRTUAL TABLE session_search USING fts5(
+    player_name, theme, content, session_id UNINDEXED, turn_index UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
@@ -0,0 +1,48 @@
+-- schema_postgres.sql
+-- Équivalent PostgreSQL de schema.sql (utilisé par `flask init-db` quand DATABASE_URL désigne PostgreSQL).
+-- Il supprime les anciennes tables et les recrée.
+DROP TABLE IF EXISTS archived_sessions;
+DROP TABLE IF EXISTS turns;
+DROP TABLE IF EXISTS sessions;
+
+CREATE TABLE sessions (
+    id BIGSERIAL PRIMARY KEY,             -- Identifiant unique de la session
+    player_name TEXT NOT NULL,            -- Nom du joueur
+    theme TEXT NOT NULL,                  -- Thème choisi
+    age_group TEXT NOT NULL,              -- Groupe d'âge (Enfant/Adulte)
+    gender TEXT NOT NULL,                 -- Genre (Garçon/Fille)
+    initial_turn_count INTEGER,           -- Nombre de tours visé au début
+    last_played TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, -- Date/heure (UTC) dernière interaction
+    history TEXT,                         -- Ancien historique JSON (inutilisé, reste NULL)
+    summary TEXT,                         -- Résumé glissant des anciens tours
+    summary_upto INTEGER NOT NULL DEFAULT 0, -- Index du premier message non couvert par le résumé
+    version INTEGER NOT NULL DEFAULT 0    -- Nombre de messages (concurrence optimiste)
+);
+
+CREATE TABLE turns (
+    session_id BIGINT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE, -- Session concernée
+    turn_index INTEGER NOT NULL,          -- Position du message dans l'historique (0, 1, 2...)
+    role TEXT NOT NULL,                   -- 'user' ou 'assistant'
+    content TEXT NOT NULL,                -- Texte du message
+    data TEXT,                            -- Sortie structurée du tour (JSON : choix, inventaire, fin), mode STRUCTURED_TURNS
+    PRIMARY KEY (session_id, turn_index)
+);
+
+CREATE TABLE archived_sessions (
+    session_id BIGINT PRIMARY KEY,        -- Session archivée (même ID qu'avant, restaurable)
+    player_name TEXT NOT NULL,            -- Nom du joueur
+    theme TEXT NOT NULL,                  -- Thème choisi
+    last_played TIMESTAMP NOT NULL,       -- Dernière interaction avant l'archivage
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, -- Date/heure de l'archivage
+    archive_file TEXT NOT NULL,           -- Fichier d'archive (dossier SESSION_ARCHIVE_PATH)
+    archive_offset BIGINT NOT NULL,       -- Position du membre gzip de la session dans ce fichier
+    archive_length INTEGER NOT NULL       -- Taille de ce membre gzip
+);
+
+-- Index pour la liste paginée des sessions (tri par date, filtres par nom ou thème)
+CREATE INDEX idx_sessions_last_played ON sessions (last_played DESC, id DESC);
+CREATE INDEX idx_sessions_player_name ON sessions (player_name, last_played DESC, id DESC);
+CREATE INDEX idx_sessions_theme ON sessions (theme, last_played DESC, id DESC);
+CREATE INDEX idx_archived_last_played ON archived_sessions (last_played DESC, session_id DESC);
+CREATE INDEX idx_archived_player_name ON archived_sessions (player_name, last_played DESC, session_id DESC);
+CREATE INDEX idx_archived_theme ON archived_sessions (theme, last_played DESC, session_id DESC);
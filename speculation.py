@@ -0,0 +1,163 @@
+# speculation.py
+# Pré-génération spéculative : dès qu'une réplique proposant des choix A)/B)/C) est envoyée,
+# le tour suivant est généré en arrière-plan pour chaque choix. Si le joueur clique ensuite sur
+# l'un d'eux, la réponse est déjà prête (ou en cours) ; les autres sont abandonnées.
+# Le coût supplémentaire est plafonné (choix par tour, générations simultanées, tokens par heure).
+import time
+import logging
+import threading
+import collections
+import concurrent.futures
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SPECULATION_EVENTS = metrics.Counter(
+    "chat_speculation_total", "Tours spéculatifs : hit, miss, discarded, skipped, failed.", labelnames=("outcome",)
+)
+
+
+def estimate_turn_tokens(turn, reply=""):
+    """Estimation grossière (~4 caractères par token) du coût d'un tour : contexte envoyé + réponse."""
+    characters = len(turn.get("system_instruction") or "") + len(turn.get("message") or "") + len(reply)
+    characters += sum(len(entry.get("content") or "") for entry in turn.get("model_history") or [])
+    return characters // 4
+
+
+class _Entry:
+    """Spéculations d'une session : préparation commune puis une génération par choix."""
+    def __init__(self, letters, expires_at):
+        self.letters = letters
+        self.expires_at = expires_at
+        self.prepared = concurrent.futures.Future() # -> {lettre: Future[(turn, réponse)]}
+
+
+class Speculator:
+    """Cache des tours pré-générés, par session (une seule réplique en attente de choix à la fois)."""
+
+    def __init__(self, ttl_s=300, max_choices=3, max_inflight=16, token_budget_per_hour=0, wait_s=60):
+        self.ttl_s = ttl_s
+        self.max_choices = max_choices
+        self.max_inflight = max_inflight
+        self.token_budget_per_hour = token_budget_per_hour # 0 : pas de plafond
+        self.wait_s = wait_s # Attente max d'une génération encore en cours au moment du choix
+        self._entries = {}
+        self._inflight = 0
+        self._spent = collections.deque() # (horodatage, tokens) sur la dernière heure
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_inflight), thread_name_prefix='speculation')
+
+    # --- Budget ---
+    def _spent_last_hour(self, now):
+        while self._spent and self._spent[0][0] < now - 3600:
+            self._spent.popleft()
+        return sum(tokens for _, tokens in self._spent)
+
+    def _reserve(self, count, tokens_each):
+        """Réserve `count` générations si la concurrence et le budget le permettent."""
+        with self._lock:
+            now = time.monotonic()
+            if self._inflight + count > self.max_inflight:
+                return False
+            if self.token_budget_per_hour and self._spent_last_hour(now) + count * tokens_each > self.token_budget_per_hour:
+                return False
+            self._inflight += count
+            self._spent.append((now, count * tokens_each))
+            return True
+
+    def _release(self, reply_tokens):
+        with self._lock:
+            self._inflight -= 1
+            self._spent.append((time.monotonic(), reply_tokens))
+
+    # --- Cycle de vie ---
+    def schedule(self, session_id, letters, prepare, generate):
+        """Lance en arrière-plan : prepare(letter) -> turn (lecture de la session, commun aux choix),
+        puis generate(turn, letter) -> (turn du choix, réponse) pour chaque lettre."""
+        letters = letters[:self.max_choices]
+        if not letters: return
+        entry = _Entry(letters, time.monotonic() + self.ttl_s)
+        with self._lock:
+            stale = self._pop_expired()
+            previous = self._entries.pop(session_id, None)
+            self._entries[session_id] = entry
+        for stale_entry in stale + ([previous] if previous else []):
+            self._cancel(stale_entry)
+        self._executor.submit(self._prepare_and_launch, session_id, entry, prepare, generate)
+
+    def _prepare_and_launch(self, session_id, entry, prepare, generate):
+        try:
+            turn = prepare(entry.letters[0])
+            if not self._reserve(len(entry.letters), estimate_turn_tokens(turn)):
+                SPECULATION_EVENTS.inc(outcome="skipped")
+                logger.debug("Spéculation ignorée (plafond atteint) pour session %s", session_id)
+                entry.prepared.set_result({})
+                return
+            futures = {letter: self._executor.submit(self._generate, generate, turn, letter) for letter in entry.letters}
+            for future in futures.values():
+                # Une génération annulée avant de démarrer libère sa place sans rien consommer
+                future.add_done_callback(lambda f: f.cancelled() and self._release(0))
+            entry.prepared.set_result(futures)
+            logger.debug("Spéculation lancée pour session %s (choix %s)", session_id, "".join(entry.letters))
+        except Exception as e:
+            SPECULATION_EVENTS.inc(outcome="failed")
+            logger.warning("Échec préparation spéculative (session %s): %s", session_id, e)
+            entry.prepared.set_result({})
+
+    def _generate(self, generate, turn, letter):
+        reply = ""
+        try:
+            letter_turn, reply = generate(turn, letter)
+            return letter_turn, reply
+        finally:
+            self._release(len(reply) // 4)
+
+    def take(self, session_id, message):
+        """Retire les spéculations de la session et retourne (turn, réponse) si le message est l'un des
+        choix pré-générés (en attendant la fin de sa génération), sinon None. Les autres sont abandonnées."""
+        if session_id is None: return None
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+        if entry is None: return None
+        letter = (message or "").strip().upper().rstrip(").")
+        if time.monotonic() > entry.expires_at or letter not in entry.letters:
+            SPECULATION_EVENTS.inc(outcome="miss")
+            self._cancel(entry)
+            return None
+        try:
+            futures = entry.prepared.result(timeout=self.wait_s)
+            future = futures.get(letter)
+            for other, other_future in futures.items():
+                if other != letter:
+                    other_future.cancel()
+                    SPECULATION_EVENTS.inc(outcome="discarded")
+            if future is None: return None
+            result = future.result(timeout=self.wait_s)
+            SPECULATION_EVENTS.inc(outcome="hit")
+            return result
+        except Exception as e:
+            SPECULATION_EVENTS.inc(outcome="failed")
+            logger.warning("Tour spéculatif indisponible (session %s, choix %s): %s", session_id, letter, e)
+            return None
+
+    def discard(self, session_id):
+        """Oublie les spéculations d'une session (ex: suppression)."""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+        if entry: self._cancel(entry)
+
+    def _cancel(self, entry):
+        """Annule les générations pas encore démarrées (celles en cours se terminent et sont perdues)."""
+        def cancel_all(prepared):
+            for future in prepared.result().values():
+                if future.cancel() or not future.done():
+                    SPECULATION_EVENTS.inc(outcome="discarded")
+        entry.prepared.add_done_callback(cancel_all)
+
+    def _pop_expired(self):
+        """Retire les entrées expirées (appelé sous verrou ; l'annulation se fait hors verrou)."""
+        now = time.monotonic()
+        return [self._entries.pop(sid) for sid in [sid for sid, entry in self._entries.items() if entry.expires_at < now]]
+
+# --- FIN speculation.py ---
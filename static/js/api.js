@@ -2,17 +2,84 @@
 
 // Note: Ce module dépendra de fonctions UI importées pour gérer les états disabled/loading et afficher les erreurs.
 
+/**
+ * Envoie une requête à /chat/stream et lit la réponse Server-Sent Events au fil de l'eau.
+ * Les erreurs de validation (avant ouverture du flux) sont renvoyées en JSON classique.
+ * @param {object} body - Le corps JSON de la requête (mêmes champs que /chat).
+ * @param {Function | null} onDelta - Appelée avec chaque fragment de texte reçu.
+ * @returns {Promise<{ok: boolean, status: number, data: object}>} - Charge finale ('done') ou erreur.
+ */
+async function postChatStream(body, onDelta) {
+    // Même clé pour un éventuel renvoi : le serveur rejoue le tour au lieu de le générer une seconde fois
+    const idempotencyKey = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    const request = () => fetch('/chat/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream', 'Idempotency-Key': idempotencyKey },
+        body: JSON.stringify(body)
+    });
+    let response;
+    try {
+        response = await request();
+    } catch (error) {
+        console.warn('Erreur réseau, nouvel essai avec la même clé:', error);
+        response = await request();
+    }
+
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!response.ok || !contentType.startsWith('text/event-stream') || !response.body) {
+        const data = await response.json().catch(() => ({ error: `Erreur serveur ${response.status}` }));
+        return { ok: false, status: response.status, data };
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = { ok: false, status: 500, data: { error: "Flux interrompu avant la fin de la réponse." } };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Les événements SSE sont séparés par une ligne vide
+        let separatorIndex;
+        while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, separatorIndex);
+            buffer = buffer.slice(separatorIndex + 2);
+
+            let eventName = 'message';
+            const dataLines = [];
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+            });
+            if (dataLines.length === 0) continue;
+            const payload = JSON.parse(dataLines.join('\n'));
+
+            if (eventName === 'delta') {
+                if (onDelta && payload.text) onDelta(payload.text);
+            } else if (eventName === 'done') {
+                result = { ok: true, status: 200, data: payload };
+            } else if (eventName === 'error') {
+                result = { ok: false, status: payload.status || 500, data: payload };
+            }
+        }
+    }
+    return result;
+}
+
 /**
  * Envoie un message au backend et gère la réponse.
+ * Seul le nouveau message est transmis : le serveur relit l'historique de la session en base.
  * @param {string} messageContent - Le message à envoyer.
- * @param {Array<object>} currentHistory - L'historique actuel du chat.
  * @param {number} sessionId - L'ID de la session en cours.
  * @param {Function} addMessageFn - Fonction pour ajouter un message à l'UI (importée de ui.js).
  * @param {Function} setInputDisabledFn - Fonction pour gérer l'état disabled (importée de ui.js).
  * @param {object} uiElements - Références aux éléments UI nécessaires pour setInputDisabledFn.
+ * @param {Function | null} onDelta - Appelée avec chaque fragment de la réponse IA en cours de génération.
  * @returns {Promise<{success: boolean, data: object | null, error: string | null}>} - Résultat de l'opération.
  */
-export async function sendMessage(messageContent, currentHistory, sessionId, addMessageFn, setInputDisabledFn, uiElements) {
+export async function sendMessage(messageContent, sessionId, addMessageFn, setInputDisabledFn, uiElements, onDelta = null) {
     const messageToSend = messageContent.trim();
     if (messageToSend === '' || !sessionId) {
         return { success: false, data: null, error: "Message vide ou ID de session manquant." };
@@ -21,17 +88,11 @@ export async function sendMessage(messageContent, currentHistory, sessionId, add
     setInputDisabledFn(true, uiElements);
 
     try {
-        const response = await fetch('/chat', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                message: messageToSend,
-                history: currentHistory,
-                session_id: sessionId
-            })
-        });
-
-        const responseData = await response.json();
+        const response = await postChatStream({
+            message: messageToSend,
+            session_id: sessionId
+        }, onDelta);
+        const responseData = response.data;
 
         if (response.ok) {
             return { success: true, data: responseData, error: null };
@@ -60,28 +121,23 @@ export async function sendMessage(messageContent, currentHistory, sessionId, add
  * @param {Function} addMessageFn - Fonction pour ajouter un message à l'UI.
  * @param {Function} setInputDisabledFn - Fonction pour gérer l'état disabled.
  * @param {object} uiElements - Références aux éléments UI.
+ * @param {Function | null} onDelta - Appelée avec chaque fragment de la scène d'ouverture en cours de génération.
  * @returns {Promise<{success: boolean, data: object | null, error: string | null}>} - Résultat.
  */
-export async function startNewGame(gameData, addMessageFn, setInputDisabledFn, uiElements) {
+export async function startNewGame(gameData, addMessageFn, setInputDisabledFn, uiElements, onDelta = null) {
 
     setInputDisabledFn(true, uiElements);
 
     try {
-        const response = await fetch('/chat', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                theme: gameData.theme,
-                ageGroup: gameData.ageGroup,
-                gender: gameData.gender,
-                playerName: gameData.playerName,
-                turnCount: gameData.turnCount,
-                message: "Commence l'aventure.", // Message déclencheur
-                history: [] // Historique vide pour le début
-            })
-        });
-
-        const responseData = await response.json();
+        const response = await postChatStream({
+            theme: gameData.theme,
+            ageGroup: gameData.ageGroup,
+            gender: gameData.gender,
+            playerName: gameData.playerName,
+            turnCount: gameData.turnCount,
+            message: "Commence l'aventure." // Message déclencheur
+        }, onDelta);
+        const responseData = response.data;
 
         if (response.ok) {
             return { success: true, data: responseData, error: null };
@@ -123,15 +179,25 @@ export async function loadGame(sessionId) {
 }
 
 /**
- * Récupère la liste de toutes les sessions sauvegardées.
- * @returns {Promise<{success: boolean, data: Array<object> | null, error: string | null}>} - Résultat.
+ * Récupère une page de la liste des sessions sauvegardées (les plus récentes d'abord).
+ * @param {string | null} cursor - Curseur renvoyé par la page précédente (null pour la première page).
+ * @param {object} filters - Filtres optionnels.
+ * @param {string} [filters.playerName]
+ * @param {string} [filters.theme]
+ * @returns {Promise<{success: boolean, data: {sessions: Array<object>, next_cursor: string | null} | null, error: string | null}>} - Résultat.
  */
-export async function loadSessionList() {
+export async function loadSessionList(cursor = null, filters = {}) {
+    const params = new URLSearchParams();
+    if (cursor) params.set('cursor', cursor);
+    if (filters.playerName) params.set('player_name', filters.playerName);
+    if (filters.theme) params.set('theme', filters.theme);
+    const query = params.toString();
+
     try {
-        const response = await fetch('/sessions');
+        const response = await fetch(query ? `/sessions?${query}` : '/sessions');
         if (response.ok) {
-            const sessions = await response.json();
-            return { success: true, data: sessions, error: null };
+            const page = await response.json();
+            return { success: true, data: page, error: null };
         } else {
             console.error("Erreur API récupération sessions:", response.status);
             return { success: false, data: null, error: `Erreur serveur ${response.status}` };
@@ -34,6 +34,16 @@ export function initEventListeners(state, uiElements, handlers, themeHandlers) {
         });
     } else { console.warn("Élément manquant: sessionList"); }
 
+    // Défilement infini de la liste des sessions (la barre latérale est le conteneur scrollable)
+    if (uiElements.sidebar) {
+        uiElements.sidebar.addEventListener('scroll', () => {
+            const { scrollTop, scrollHeight, clientHeight } = uiElements.sidebar;
+            if (scrollHeight - scrollTop - clientHeight < 150) {
+                handlers.loadMoreSessions(state, uiElements);
+            }
+        });
+    } else { console.warn("Élément manquant: sidebar"); }
+
     // Boutons du Modal de Suppression
     if (uiElements.confirmDeleteBtn) {
         uiElements.confirmDeleteBtn.addEventListener('click', () => handlers.handleDeleteSession(state, uiElements)); // Pass state
@@ -5,6 +5,34 @@ import * as api from './api.js';
 
 // Note: These functions rely on state variables and uiElements passed from the main script.
 
+/**
+ * Creates the callbacks used to render a streamed AI reply incrementally.
+ * The AI message bubble is created on the first received fragment.
+ * @param {object} uiElements - Reference to the UI elements object.
+ * @returns {{onDelta: Function, finish: Function}} - onDelta(text) for each fragment, finish(reply) with the final text.
+ */
+function createStreamingReply(uiElements) {
+    let messageElement = null;
+    let streamedText = '';
+    return {
+        onDelta: (text) => {
+            streamedText += text;
+            if (!messageElement) {
+                messageElement = ui.addMessage(streamedText, 'ai', uiElements.chatbox, null);
+            } else {
+                ui.updateMessageContent(messageElement, streamedText, uiElements.chatbox);
+            }
+        },
+        finish: (reply) => {
+            if (!messageElement) {
+                ui.addMessage(reply, 'ai', uiElements.chatbox, null);
+            } else {
+                ui.updateMessageContent(messageElement, reply, uiElements.chatbox);
+            }
+        }
+    };
+}
+
 /**
  * Sends a message via API and updates UI.
  * @param {string} messageContent - The raw message content.
@@ -25,13 +53,15 @@ export async function handleSendMessage(messageContent, state, uiElements, displ
         uiElements.userInput.value = '';
     }
 
-    const result = await api.sendMessage(messageToSend, state.chatHistory, state.currentSessionId, ui.addMessage, ui.setInputDisabledState, uiElements);
+    const stream = createStreamingReply(uiElements);
+    const result = await api.sendMessage(messageToSend, state.currentSessionId, ui.addMessage, ui.setInputDisabledState, uiElements, stream.onDelta);
 
     if (result.success && result.data) {
-        state.chatHistory = result.data.history; // Update state directly
-        ui.addMessage(result.data.reply, 'ai', uiElements.chatbox, null);
+        // The server only returns the new reply: keep the local history in sync for choice lookups
+        state.chatHistory.push({ role: 'user', content: messageToSend }, { role: 'assistant', content: result.data.reply });
+        stream.finish(result.data.reply);
         ui.updateUITimestampAndTitle(state.currentSessionId, state.selectedTheme, state.selectedPlayerName, new Date(), uiElements.mainTitleElement, uiElements.sessionList, utils.formatDisplayDate);
-        state.currentTurnNumber++; // Update state
+        state.currentTurnNumber = result.data.turn || state.currentTurnNumber + 1; // Update state
         ui.updateTurnCounterDisplay(state.currentTurnNumber, state.totalTurnCount, uiElements.turnCounterDisplay, uiElements.turnCounterSpan);
     }
     // Errors handled by api.sendMessage
@@ -82,12 +112,13 @@ export async function handleStartNewGame(state, uiElements) {
     };
 
     // Call API
-    const result = await api.startNewGame(gameData, ui.addMessage, ui.setInputDisabledState, uiElements);
+    const stream = createStreamingReply(uiElements);
+    const result = await api.startNewGame(gameData, ui.addMessage, ui.setInputDisabledState, uiElements, stream.onDelta);
 
     if (result.success && result.data) {
-        state.chatHistory = result.data.history;
+        state.chatHistory = [{ role: 'assistant', content: result.data.reply }];
         state.currentSessionId = result.data.session_id;
-        ui.addMessage(result.data.reply, 'ai', uiElements.chatbox, null);
+        stream.finish(result.data.reply);
 
         if (!state.currentSessionId) {
             console.error("ID de session non reçu après startNewGame.");
@@ -165,16 +196,39 @@ export async function handleLoadGame(sessionId, state, uiElements) {
  */
 export async function refreshSessionList(state, uiElements) {
     uiElements.sessionList.innerHTML = '<li class="loading-sessions">Chargement...</li>';
+    state.sessionsNextCursor = null;
+    state.sessionsLoading = true;
     const result = await api.loadSessionList();
+    state.sessionsLoading = false;
 
     if (result.success && result.data) {
-        ui.displaySessionList(result.data, uiElements.sessionList, utils.formatDisplayDate, state.currentSessionId); // Pass state.currentSessionId
+        state.sessionsNextCursor = result.data.next_cursor;
+        ui.displaySessionList(result.data.sessions, uiElements.sessionList, utils.formatDisplayDate, state.currentSessionId); // Pass state.currentSessionId
     } else {
         console.error("Erreur refreshSessionList:", result.error);
         uiElements.sessionList.innerHTML = `<li class="no-sessions">Erreur chargement (${result.error || 'inconnue'}).</li>`;
     }
 }
 
+/**
+ * Loads the next page of sessions (sidebar infinite scroll), if any.
+ * @param {object} state - Reference to the global state object.
+ * @param {object} uiElements - Reference to the UI elements object.
+ */
+export async function loadMoreSessions(state, uiElements) {
+    if (!state.sessionsNextCursor || state.sessionsLoading) return;
+    state.sessionsLoading = true;
+    const result = await api.loadSessionList(state.sessionsNextCursor);
+    state.sessionsLoading = false;
+
+    if (result.success && result.data) {
+        state.sessionsNextCursor = result.data.next_cursor;
+        ui.displaySessionList(result.data.sessions, uiElements.sessionList, utils.formatDisplayDate, state.currentSessionId, true);
+    } else {
+        console.error("Erreur loadMoreSessions:", result.error);
+    }
+}
+
 /**
  * Handles the deletion of a session after confirmation.
  * @param {object} state - Reference to the global state object.
@@ -77,6 +77,8 @@ const appState = {
     currentTurnNumber: 0,
     currentSessionId: null,
     sessionIdToDelete: null,
+    sessionsNextCursor: null, // Curseur de la page suivante de la liste des sessions
+    sessionsLoading: false,
 };
 
 
@@ -6,6 +6,7 @@
  * @param {'user' | 'ai'} sender - L'expéditeur ('user' ou 'ai').
  * @param {HTMLElement} chatboxElement - L'élément HTML du chatbox.
  * @param {string | null} playerName - Le nom du joueur (pour label 'user').
+ * @returns {HTMLElement | undefined} L'élément du message ajouté.
  */
 export function addMessage(message, sender, chatboxElement, playerName) {
     if (!chatboxElement) return;
@@ -26,12 +27,8 @@ export function addMessage(message, sender, chatboxElement, playerName) {
     messageElement.appendChild(senderLabel);
 
     const messageContent = document.createElement('span');
-    // Sécurisation basique et formatage
-    const safeMessage = message.replace(/</g, "&lt;").replace(/>/g, "&gt;");
-    // Met en gras les choix A), B), C) en début de ligne
-    const formattedMessage = safeMessage.replace(/^(<strong>)?([A-C]\))(\s*<\/strong>)?/gm, '<strong>$2</strong>');
-    // Remplace les sauts de ligne par <br>
-    messageContent.innerHTML = formattedMessage.replace(/\n/g, '<br>');
+    messageContent.classList.add('message-content');
+    messageContent.innerHTML = formatMessageHtml(message);
     messageElement.appendChild(messageContent);
 
     chatboxElement.appendChild(messageElement);
@@ -39,6 +36,39 @@ export function addMessage(message, sender, chatboxElement, playerName) {
     requestAnimationFrame(() => {
         chatboxElement.scrollTop = chatboxElement.scrollHeight;
     });
+    return messageElement;
+}
+
+/**
+ * Sécurise et formate un message pour l'affichage (choix en gras, sauts de ligne).
+ * @param {string} message - Le texte brut du message.
+ * @returns {string} Le HTML formaté.
+ */
+function formatMessageHtml(message) {
+    // Sécurisation basique et formatage
+    const safeMessage = message.replace(/</g, "&lt;").replace(/>/g, "&gt;");
+    // Met en gras les choix A), B), C) en début de ligne
+    const formattedMessage = safeMessage.replace(/^(<strong>)?([A-C]\))(\s*<\/strong>)?/gm, '<strong>$2</strong>');
+    // Remplace les sauts de ligne par <br>
+    return formattedMessage.replace(/\n/g, '<br>');
+}
+
+/**
+ * Remplace le contenu d'un message déjà affiché (utilisé pendant le streaming de la réponse IA).
+ * @param {HTMLElement} messageElement - L'élément retourné par addMessage.
+ * @param {string} message - Le texte complet à afficher.
+ * @param {HTMLElement} chatboxElement - L'élément HTML du chatbox (pour le scroll).
+ */
+export function updateMessageContent(messageElement, message, chatboxElement) {
+    if (!messageElement) return;
+    const messageContent = messageElement.querySelector('.message-content');
+    if (!messageContent) return;
+    messageContent.innerHTML = formatMessageHtml(message);
+    if (chatboxElement) {
+        requestAnimationFrame(() => {
+            chatboxElement.scrollTop = chatboxElement.scrollHeight;
+        });
+    }
 }
 
 /**
@@ -233,13 +263,14 @@ export function resetChatAreaUI(elements) {
  * @param {HTMLElement} sessionListElement - L'élément UL de la liste.
  * @param {Function} formatDateFn - La fonction pour formater les dates.
  * @param {number|null} activeSessionId - L'ID de la session actuellement active.
+ * @param {boolean} append - true pour ajouter une page à la suite de la liste existante (défilement infini).
  */
-export function displaySessionList(sessions, sessionListElement, formatDateFn, activeSessionId) {
-    sessionListElement.innerHTML = ''; // Vider la liste
+export function displaySessionList(sessions, sessionListElement, formatDateFn, activeSessionId, append = false) {
+    if (!append) sessionListElement.innerHTML = ''; // Vider la liste
 
-    if (!sessions || sessions.length === 0) {
+    if (!append && (!sessions || sessions.length === 0)) {
         sessionListElement.innerHTML = '<li class="no-sessions">Aucune partie sauvegardée.</li>';
-    } else {
+    } else if (sessions && sessions.length > 0) {
         sessions.forEach(session => {
             const li = document.createElement('li');
             li.dataset.sessionId = session.id;
@@ -268,6 +299,15 @@ export function displaySessionList(sessions, sessionListElement, formatDateFn, a
             dateSpan.textContent = `Joué: ${formatDateFn(session.last_played)}`;
             li.appendChild(dateSpan);
 
+            // Partie archivée (inactive depuis longtemps) : rouverte par le serveur au chargement
+            if (session.archived) {
+                li.classList.add('archived-session');
+                const archivedSpan = document.createElement('span');
+                archivedSpan.className = 'session-archived';
+                archivedSpan.textContent = 'Archivée';
+                li.appendChild(archivedSpan);
+            }
+
             sessionListElement.appendChild(li);
         });
         // Marquer la session active APRES avoir ajouté tous les éléments
@@ -0,0 +1,164 @@
+# structured.py
+# Sortie structurée des tours (mode STRUCTURED_TURNS) : le modèle répond en JSON selon TURN_SCHEMA
+# (narration, choix, objets gagnés/perdus, fin de l'histoire). Le tour est analysé une seule fois :
+# la réplique affichée et sauvegardée reste le texte habituel (narration puis lignes A)/B)/C)),
+# et l'état compact du tour (choix, inventaire complet, fin) est conservé à part dans turns.data.
+import re
+import json
+
+CHOICE_LETTERS = "ABC"
+# Ligne de choix « A) ... » d'une réplique en texte libre (compilée une seule fois)
+CHOICE_PATTERN = re.compile(r"^\s*([ABC])\)\s*(.*?)\s*$", re.M | re.I)
+
+# Schéma JSON demandé au modèle ; « narration » vient en premier pour pouvoir la streamer
+TURN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "narration": {"type": "string"},
+        "choices": {"type": "array", "items": {"type": "string"}},
+        "inventory_add": {"type": "array", "items": {"type": "string"}},
+        "inventory_remove": {"type": "array", "items": {"type": "string"}},
+        "story_end": {"type": "boolean"},
+    },
+    "required": ["narration", "choices", "inventory_add", "inventory_remove", "story_end"],
+    "additionalProperties": False,
+}
+
+
+def parse_choices(text):
+    """Choix {lettre: texte} proposés par une réplique en texte libre (un seul passage de la regex)."""
+    choices = {}
+    for letter, choice in CHOICE_PATTERN.findall(text or ""):
+        letter = letter.upper()
+        if choice and letter not in choices:
+            choices[letter] = choice
+    return choices
+
+
+def entry_choices(entry):
+    """Choix {lettre: texte} d'un message assistant : sortie structurée stockée, sinon analyse du texte."""
+    data = entry.get("data")
+    if data and "choices" in data:
+        return dict(zip(CHOICE_LETTERS, data["choices"]))
+    return parse_choices(entry.get("content"))
+
+
+def last_state(history):
+    """Sortie structurée du dernier message assistant de l'historique (None si aucune)."""
+    for entry in reversed(history):
+        if entry.get("role") == "assistant":
+            return entry.get("data")
+    return None
+
+
+def replay_history(history):
+    """Historique rejoué au modèle en mode structuré (l'inventaire lui est fourni à part) : chaque
+    réplique passée perd son bloc de choix final, et une réponse par lettre qui la suit devient le choix
+    retenu (« A) ... »). La dernière réplique garde ses choix : le joueur y répond."""
+    last = max((i for i, entry in enumerate(history) if entry.get("role") == "assistant"), default=-1)
+    replayed, choices = [], {}
+    for i, entry in enumerate(history):
+        content = entry.get("content")
+        if entry.get("role") == "assistant":
+            choices = entry_choices(entry)
+            head, _, tail = (content or "").rpartition("\n\n")
+            if i != last and choices and head and all(CHOICE_PATTERN.match(line) for line in tail.splitlines()):
+                entry = dict(entry, content=head)
+        elif isinstance(content, str) and content.strip().upper() in choices:
+            letter = content.strip().upper()
+            entry = dict(entry, content=f"{letter}) {choices[letter]}")
+            choices = {}
+        replayed.append(entry)
+    return replayed
+
+
+def parse_turn(raw):
+    """Analyse la réponse JSON du modèle ; retourne le dict normalisé ou None si elle est illisible."""
+    text = (raw or "").strip()
+    if text.startswith("```"): # Bloc de code Markdown autour du JSON
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("narration"), str):
+        return None
+
+    def strings(name):
+        values = parsed.get(name)
+        return [value.strip() for value in values if isinstance(value, str) and value.strip()] if isinstance(values, list) else []
+
+    return {
+        "narration": parsed["narration"].strip(),
+        "choices": strings("choices")[:len(CHOICE_LETTERS)],
+        "inventory_add": strings("inventory_add"),
+        "inventory_remove": strings("inventory_remove"),
+        "story_end": bool(parsed.get("story_end")),
+    }
+
+
+def render_reply(turn_output):
+    """Réplique en texte habituel : la narration puis les choix au format A)/B)/C)."""
+    lines = [f"{letter}) {choice}" for letter, choice in zip(CHOICE_LETTERS, turn_output["choices"])]
+    return "\n\n".join([turn_output["narration"]] + (["\n".join(lines)] if lines else []))
+
+
+def apply_inventory(inventory, turn_output):
+    """Inventaire après le tour : objets retirés (sans tenir compte de la casse) puis objets ajoutés."""
+    removed = {item.casefold() for item in turn_output["inventory_remove"]}
+    items = [item for item in inventory if item.casefold() not in removed]
+    known = {item.casefold() for item in items}
+    for item in turn_output["inventory_add"]:
+        if item.casefold() not in known:
+            items.append(item)
+            known.add(item.casefold())
+    return items
+
+
+class NarrationStream:
+    """Extrait au fil des fragments JSON reçus le texte de la valeur « narration » (streaming)."""
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+    _START = re.compile(r'"narration"\s*:\s*"')
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = None # Index du prochain caractère de la narration dans le tampon
+        self._done = False
+
+    def feed(self, fragment):
+        """Ajoute un fragment brut ; retourne le texte de narration nouvellement disponible."""
+        if self._done: return ""
+        self._buffer += fragment
+        if self._position is None:
+            match = self._START.search(self._buffer)
+            if not match: return ""
+            self._position = match.end()
+        out = []
+        i, buffer = self._position, self._buffer
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self._done = True
+                break
+            if char == '\\':
+                if i + 1 >= len(buffer): break # Échappement coupé entre deux fragments
+                code = buffer[i + 1]
+                if code == 'u':
+                    # \uXXXX, ou paire de substitution (\ud83d\ude00) décodée d'un bloc
+                    size = 12 if buffer[i + 2:i + 3].lower() == 'd' and buffer[i + 3:i + 4].lower() in '89ab' else 6
+                    if i + size > len(buffer): break
+                    try:
+                        out.append(json.loads(f'"{buffer[i:i + size]}"'))
+                    except ValueError:
+                        pass # Échappement invalide : ignoré (la réplique finale est relue en entier)
+                    i += size
+                    continue
+                out.append(self._ESCAPES.get(code, code))
+                i += 2
+                continue
+            out.append(char)
+            i += 1
+        self._position = i
+        return "".join(out)
+
+# --- FIN structured.py ---
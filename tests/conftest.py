@@ -0,0 +1,8 @@
+# tests/conftest.py
+# Les modules de l'application sont à la racine du dépôt (pas de paquet) : on les rend importables.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# --- FIN tests/conftest.py ---
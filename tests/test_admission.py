@@ -0,0 +1,57 @@
+# tests/test_admission.py
+# Contrôle d'admission : un appel refusé (file pleine, délai dépassé) ne consomme pas le débit du joueur.
+import asyncio
+
+import pytest
+
+import admission
+
+
+def test_queue_full_refunds_token():
+    controller = admission.AdmissionController(max_concurrency=1, max_queue=0, rate_per_minute=60, burst=2)
+    with controller.admit("autre"):
+        for _ in range(5): # Plus de refus que de jetons : aucun ne doit passer en rate_limited
+            with pytest.raises(admission.AdmissionRejected) as rejected:
+                controller.admit("joueur")
+            assert rejected.value.reason == "queue_full"
+    with controller.admit("joueur"), pytest.raises(admission.AdmissionRejected):
+        controller.admit("joueur", queue=False) # Occupé, mais le jeton reste disponible
+    assert controller._buckets["joueur"][0] >= 0.9
+
+
+def test_queue_timeout_refunds_token():
+    controller = admission.AdmissionController(max_concurrency=1, max_queue=4, queue_timeout_s=0.05, rate_per_minute=60, burst=1)
+    with controller.admit("autre"):
+        with pytest.raises(admission.AdmissionRejected) as rejected:
+            controller.admit("joueur")
+        assert rejected.value.reason == "queue_timeout"
+    with controller.admit("joueur"): # Le jeton a été rendu : pas de rate_limited
+        pass
+
+
+def test_async_cancel_refunds_token():
+    controller = admission.AdmissionController(max_concurrency=1, max_queue=4, queue_timeout_s=5, rate_per_minute=60, burst=1)
+
+    async def scenario():
+        with controller.admit("autre"):
+            waiting = asyncio.ensure_future(controller.admit_async("joueur"))
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+        slot = await controller.admit_async("joueur")
+        slot.release()
+
+    asyncio.run(scenario())
+    assert controller._inflight == 0
+
+
+def test_admitted_call_uses_token():
+    controller = admission.AdmissionController(rate_per_minute=60, burst=1)
+    with controller.admit("joueur"):
+        pass
+    with pytest.raises(admission.AdmissionRejected) as rejected:
+        controller.admit("joueur")
+    assert rejected.value.reason == "rate_limited"
+
+# --- FIN tests/test_admission.py ---
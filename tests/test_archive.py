@@ -0,0 +1,53 @@
+# tests/test_archive.py
+# Sessions archivées (SQLite) : consultées depuis l'archive sans être remises en base, restaurées au
+# premier tour avec leur date de dernière partie d'origine.
+import flask
+import pytest
+
+import database
+
+pytestmark = pytest.mark.skipif(database.BACKEND.name != 'sqlite', reason="Test sur fichier SQLite temporaire")
+
+HISTORY = [{"role": "user", "content": "Commence l'aventure."}, {"role": "assistant", "content": "Tu entres dans la crypte."}]
+LAST_PLAYED = '2020-01-02 03:04:05'
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = flask.Flask(__name__, instance_path=str(tmp_path))
+    assert database.init_db(app)
+    with app.app_context():
+        yield app
+        database.close_connection()
+
+
+@pytest.fixture
+def archived_id(app):
+    db = database.get_db()
+    session_id = database.create_session("Zoé", "Espace", "Adulte", "Fille", 10, HISTORY)
+    db.execute('UPDATE sessions SET last_played = ? WHERE id = ?', (LAST_PLAYED, session_id))
+    db.commit()
+    database._session_cache.invalidate(flask.g.db_path, session_id)
+    assert database.archive_stale_sessions(db, database.session_archive(app), older_than_days=30) == 1
+    return session_id
+
+
+def live_count(session_id):
+    return database.get_db().execute('SELECT COUNT(*) FROM sessions WHERE id = ?', (session_id,)).fetchone()[0]
+
+
+def test_viewing_an_archived_session_leaves_it_archived(archived_id):
+    details = database.get_session_details(archived_id)
+    assert details["archived"] is True and details["version"] == 2
+    assert [entry["content"] for entry in details["history"]] == [entry["content"] for entry in HISTORY]
+    assert str(details["last_played"]) == LAST_PLAYED
+    assert live_count(archived_id) == 0
+
+
+def test_playing_restores_with_original_last_played(archived_id):
+    details = database.get_session_details(archived_id, restore=True)
+    assert not details.get("archived") and live_count(archived_id) == 1
+    assert str(details["last_played"]) == LAST_PLAYED
+    assert database.append_session_turns(archived_id, 2, HISTORY) is True
+
+# --- FIN tests/test_archive.py ---
@@ -0,0 +1,117 @@
+# tests/test_db_backends.py
+# Backend PostgreSQL sans serveur : conversion des paramètres « ? » -> « %s » et écriture d'un tour
+# gardée par la version de la session, contre une connexion psycopg factice.
+import flask
+import pytest
+
+import database
+import db_backends
+
+
+class FakeCursor:
+    """Curseur psycopg minimal : applique le UPDATE gardé par version à l'état de la connexion."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.rowcount = -1
+
+    def execute(self, sql, params):
+        self.raw.statements.append((sql, tuple(params)))
+        if sql.startswith('UPDATE sessions SET last_played'):
+            new_version, session_id, expected = params
+            if self.raw.versions.get(session_id) == expected:
+                self.raw.versions[session_id] = new_version
+                self.rowcount = 1
+            else:
+                self.rowcount = 0
+
+    def executemany(self, sql, seq_of_params):
+        rows = [tuple(params) for params in seq_of_params]
+        self.raw.statements.append((sql, rows))
+        self.rowcount = len(rows)
+
+
+class FakeRawConnection:
+    def __init__(self, versions):
+        self.versions = dict(versions)
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ('SELECT * FROM sessions WHERE id = ?', 'SELECT * FROM sessions WHERE id = %s'),
+    ('UPDATE t SET a = ?, b = ? WHERE c = ?', 'UPDATE t SET a = %s, b = %s WHERE c = %s'),
+    ("SELECT * FROM sessions WHERE theme LIKE '%x%' AND id = ?", "SELECT * FROM sessions WHERE theme LIKE '%%x%%' AND id = %s"),
+    ('SELECT 1', 'SELECT 1'),
+])
+def test_to_pyformat(sql, expected):
+    assert db_backends._to_pyformat(sql) == expected
+
+
+def test_connection_converts_placeholders():
+    raw = FakeRawConnection({})
+    conn = db_backends.PostgresConnection(raw)
+    conn.execute('SELECT version FROM sessions WHERE id = ?', (7,))
+    conn.executemany('INSERT INTO turns (session_id, turn_index) VALUES (?, ?)', [(7, 0), (7, 1)])
+    assert raw.statements == [
+        ('SELECT version FROM sessions WHERE id = %s', (7,)),
+        ('INSERT INTO turns (session_id, turn_index) VALUES (%s, %s)', [(7, 0), (7, 1)]),
+    ]
+
+
+def test_bump_version_sql_is_guarded():
+    raw = FakeRawConnection({1: 4})
+    conn = db_backends.PostgresConnection(raw)
+    assert conn.execute(database._BUMP_VERSION_SQL, (6, 1, 4)).rowcount == 1
+    assert raw.statements[-1][0] == 'UPDATE sessions SET last_played = CURRENT_TIMESTAMP, version = %s WHERE id = %s AND version = %s'
+    # Même version attendue une seconde fois : la session a déjà avancé
+    assert conn.execute(database._BUMP_VERSION_SQL, (6, 1, 4)).rowcount == 0
+    assert raw.versions[1] == 6
+
+
+@pytest.fixture
+def postgres_context(monkeypatch):
+    """Contexte d'application dont la connexion est une PostgresConnection factice (session 1 à la version 2)."""
+    monkeypatch.setattr(database, 'DB_WRITE_BEHIND', False)
+    monkeypatch.setattr(database, 'SEARCH_ENABLED', False)
+    raw = FakeRawConnection({1: 2})
+    app = flask.Flask(__name__)
+    with app.app_context():
+        flask.g.db = db_backends.PostgresConnection(raw)
+        flask.g.db_path = 'postgresql://test'
+        yield raw
+        flask.g.pop('db')
+    database._session_cache.invalidate('postgresql://test', 1)
+
+
+TURN = [{"role": "user", "content": "A"}, {"role": "assistant", "content": "La porte s'ouvre."}]
+
+
+def test_append_session_turns_writes_at_expected_version(postgres_context):
+    raw = postgres_context
+    assert database.append_session_turns(1, 2, TURN) is True
+    assert raw.versions[1] == 4
+    assert raw.commits == 1
+    inserted = raw.statements[-1]
+    assert '%s' in inserted[0] and '?' not in inserted[0]
+    assert [row[:2] for row in inserted[1]] == [(1, 2), (1, 3)]
+
+
+def test_append_session_turns_rejects_concurrent_turn(postgres_context):
+    raw = postgres_context
+    assert database.append_session_turns(1, 0, TURN) is False
+    assert raw.versions[1] == 2
+    assert raw.rollbacks == 1 and raw.commits == 0
+    assert len(raw.statements) == 1 # Aucun message inséré
+
+# --- FIN tests/test_db_backends.py ---
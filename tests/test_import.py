@@ -0,0 +1,57 @@
+# tests/test_import.py
+# Import NDJSON (SQLite) : rôles de l'historique validés, tours numérotés sans trou, de sorte que
+# la version de la session (nombre de messages) permette de jouer le tour suivant.
+import json
+
+import flask
+import pytest
+
+import database
+
+pytestmark = pytest.mark.skipif(database.BACKEND.name != 'sqlite', reason="Test sur fichier SQLite temporaire")
+
+HISTORY = [{"role": "user", "content": "Commence l'aventure."}, {"role": "assistant", "content": "Tu entres dans la crypte."}]
+TURN = [{"role": "user", "content": "A"}, {"role": "assistant", "content": "La porte s'ouvre."}]
+
+
+@pytest.fixture
+def db(tmp_path):
+    app = flask.Flask(__name__, instance_path=str(tmp_path))
+    assert database.init_db(app)
+    with app.app_context():
+        yield database.get_db()
+        database.close_connection()
+
+
+def record_line(history, **fields):
+    return json.dumps(dict(dict(player_name="Zoé", theme="Espace", age_group="Adulte", gender="Fille", history=history), **fields))
+
+
+@pytest.mark.parametrize("role", ["system", "", None])
+def test_import_rejects_unknown_roles(db, role):
+    history = [HISTORY[0], {"role": role, "content": "Consigne cachée."}, HISTORY[1]]
+    stats = database.import_sessions(db, [record_line(history)])
+    assert stats["invalid"] == 1 and stats["imported"] == 0
+
+
+def test_import_then_play_a_turn(db):
+    assert database.import_sessions(db, [record_line(HISTORY, id=7)])["imported"] == 1
+    details = database.get_session_details(7)
+    assert details["version"] == 2
+    assert database.append_session_turns(7, details["version"], TURN) is True
+    database.flush_pending_writes()
+    rows = db.execute('SELECT turn_index FROM turns WHERE session_id = 7 ORDER BY turn_index').fetchall()
+    assert [row['turn_index'] for row in rows] == [0, 1, 2, 3]
+
+
+def test_skipped_entries_leave_no_gap(db):
+    # Entrée sans rôle (ancien historique, archive) : ignorée, les suivantes prennent sa place
+    history = [HISTORY[0], {"role": "", "content": "?"}, HISTORY[1]]
+    session_id = database.create_session("Zoé", "Espace", "Adulte", "Fille", 10, history)
+    assert database.get_session_details(session_id)["version"] == 2
+    assert database.append_session_turns(session_id, 2, TURN) is True
+    database.flush_pending_writes()
+    if database.SEARCH_ENABLED:
+        assert [session["id"] for session in database.search_sessions("crypte")[0]] == [session_id]
+
+# --- FIN tests/test_import.py ---
@@ -0,0 +1,89 @@
+# tests/test_openings.py
+# Réserve d'ouvertures : remplissage étalé par le thread périodique, ouvertures expirées non comptées
+# comme stock, combinaisons en échec retentées après une attente exponentielle.
+import time
+import threading
+
+import pytest
+
+import openings
+
+
+class Generator:
+    """generate(clé) comptant ses appels ; lève une erreur tant que `failures` n'est pas épuisé."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, key):
+        with self._lock:
+            self.calls.append((time.monotonic(), key))
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("backend indisponible")
+        return f"ouverture {key}"
+
+
+def pool(generate, keys=("a",), **options):
+    options = dict(dict(depth=1, ttl_s=60, check_interval_s=0.05, start_spread_s=0, retry_base_s=0.1, retry_max_s=1), **options)
+    opening_pool = openings.OpeningPool(keys, generate, **options)
+    opening_pool.ensure_started()
+    return opening_pool
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline: pytest.fail("condition jamais remplie")
+        time.sleep(0.01)
+
+
+def test_fills_without_take():
+    generate = Generator()
+    opening_pool = pool(generate, keys=("a", "b"))
+    try:
+        wait_for(lambda: len(generate.calls) == 2)
+        wait_for(lambda: opening_pool._ready["b"])
+        assert opening_pool.take("b") == "ouverture b"
+    finally:
+        opening_pool.stop()
+
+
+def test_initial_fill_is_spread():
+    generate = Generator()
+    opening_pool = pool(generate, keys=("a", "b", "c"), start_spread_s=0.6)
+    try:
+        time.sleep(0.1)
+        assert [key for _, key in generate.calls] == ["a"]
+        assert opening_pool.take("c") is None # Demandée : passe devant « b »
+        wait_for(lambda: len(generate.calls) == 2)
+        assert generate.calls[1][1] == "c"
+        wait_for(lambda: len(generate.calls) == 3)
+    finally:
+        opening_pool.stop()
+
+
+def test_expired_openings_are_replaced():
+    generate = Generator()
+    opening_pool = pool(generate, ttl_s=0.1)
+    try:
+        wait_for(lambda: len(generate.calls) >= 2) # Première ouverture expirée puis remplacée sans take()
+        assert opening_pool.take("a") == "ouverture a"
+    finally:
+        opening_pool.stop()
+
+
+def test_failures_are_retried_with_backoff():
+    generate = Generator(failures=2)
+    opening_pool = pool(generate)
+    try:
+        wait_for(lambda: opening_pool._ready["a"])
+        first, second, third = [at for at, _ in generate.calls]
+        assert second - first >= 0.1 and third - second >= 0.2 # 0,1 s puis 0,2 s
+        assert opening_pool.take("a") == "ouverture a"
+    finally:
+        opening_pool.stop()
+
+# --- FIN tests/test_openings.py ---
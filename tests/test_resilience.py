@@ -0,0 +1,233 @@
+# tests/test_resilience.py
+# ResilientProvider autour du backend mock : délai par tentative, nouvelles tentatives, hedging et
+# transitions du disjoncteur (fermé -> ouvert -> demi-ouvert -> fermé/rouvert).
+# Les pannes viennent de MOCK_LLM_FAILURE_RATE / MOCK_LLM_SLOW_RATE (lenteur x10), tirées par random.random.
+import time
+import asyncio
+
+import pytest
+
+import llm
+
+LATENCY_MS = 40 # Appel normal : 40 ms ; appel lent : 400 ms
+
+
+def mock_provider(monkeypatch, failure_rate=0, slow_rate=0):
+    monkeypatch.setenv("MOCK_LLM_LATENCY_MS", str(LATENCY_MS))
+    monkeypatch.setenv("MOCK_LLM_FIRST_CHUNK_MS", str(LATENCY_MS))
+    monkeypatch.setenv("MOCK_LLM_FAILURE_RATE", str(failure_rate))
+    monkeypatch.setenv("MOCK_LLM_SLOW_RATE", str(slow_rate))
+    return llm.build_provider("mock")
+
+
+def resilient(inner, **options):
+    options = dict(dict(timeout_s=0.2, max_attempts=1, backoff_base_s=0.01, backoff_max_s=0.01), **options)
+    return llm.ResilientProvider(inner, **options)
+
+
+def draws(monkeypatch, *values):
+    """Fixe les tirages successifs de random.random (pannes du mock), puis 0.99 (aucune panne)."""
+    sequence = iter(values)
+    monkeypatch.setattr(llm.random, "random", lambda: next(sequence, 0.99))
+
+
+def events(outcome):
+    return llm.LLM_CALL_EVENTS._values.get((outcome,), 0)
+
+
+def consume(provider):
+    return "".join(provider.stream("système", [], "A"))
+
+
+# --- Délai par tentative ---
+def test_generate_timeout(monkeypatch):
+    provider = resilient(mock_provider(monkeypatch, slow_rate=1))
+    started = time.monotonic()
+    with pytest.raises(llm.UpstreamTimeoutError):
+        provider.generate("système", [], "A")
+    assert time.monotonic() - started < 0.35
+
+
+def test_stream_first_fragment_timeout(monkeypatch):
+    provider = resilient(mock_provider(monkeypatch, slow_rate=1))
+    started = time.monotonic()
+    with pytest.raises(llm.UpstreamTimeoutError):
+        consume(provider)
+    assert time.monotonic() - started < 0.35
+
+
+def test_stream_async_first_fragment_timeout(monkeypatch):
+    provider = resilient(mock_provider(monkeypatch, slow_rate=1))
+
+    async def scenario():
+        return [fragment async for fragment in provider.stream_async("système", [], "A")]
+
+    with pytest.raises(llm.UpstreamTimeoutError):
+        asyncio.run(scenario())
+
+
+# --- Nouvelles tentatives ---
+def test_retry_recovers_from_transient_failures(monkeypatch):
+    provider = resilient(mock_provider(monkeypatch, failure_rate=0.5), max_attempts=3)
+    draws(monkeypatch, 0.1, 0.1) # Deux pannes, puis succès
+    retries = events("retry")
+    assert "A)" in provider.generate("système", [], "A")
+    assert events("retry") - retries == 2
+
+
+def test_retry_gives_up_after_max_attempts(monkeypatch):
+    provider = resilient(mock_provider(monkeypatch, failure_rate=1), max_attempts=3)
+    failed = events("failed")
+    with pytest.raises(llm.TransientError):
+        provider.generate("système", [], "A")
+    assert events("failed") - failed == 1
+
+
+def test_stream_retries_slow_first_fragment(monkeypatch):
+    provider = resilient(mock_provider(monkeypatch, slow_rate=0.5), max_attempts=2)
+    draws(monkeypatch, 0.1) # Première tentative lente (délai dépassé), seconde normale
+    assert "A)" in consume(provider)
+
+
+# --- Hedging ---
+def test_hedge_wins_over_slow_request(monkeypatch):
+    provider = resilient(mock_provider(monkeypatch, slow_rate=0.5), timeout_s=2, hedge=True, hedge_min_delay_s=0.05)
+    draws(monkeypatch, 0.1, 0.9) # Requête initiale lente, couverture normale
+    hedge_won = events("hedge_won")
+    started = time.monotonic()
+    assert "A)" in provider.generate("système", [], "A")
+    assert time.monotonic() - started < 0.3
+    assert events("hedge_won") - hedge_won == 1
+
+
+def test_hedge_async_wins_over_slow_request(monkeypatch):
+    provider = resilient(mock_provider(monkeypatch, slow_rate=0.5), timeout_s=2, hedge=True, hedge_min_delay_s=0.05)
+    draws(monkeypatch, 0.1, 0.9)
+    started = time.monotonic()
+    assert "A)" in asyncio.run(provider.generate_async("système", [], "A"))
+    assert time.monotonic() - started < 0.3
+
+
+def test_stream_first_fragment_not_sampled_for_hedge(monkeypatch):
+    provider = resilient(mock_provider(monkeypatch))
+    consume(provider)
+    assert "A)" in asyncio.run(provider.generate_async("système", [], "A"))
+    assert len(provider._latencies) == 1 # Seul l'appel complet compte pour le p95
+
+
+def test_shared_provider_uses_one_breaker_and_slot_pool(monkeypatch):
+    inner = mock_provider(monkeypatch)
+    provider = resilient(inner, breaker=llm.CircuitBreaker(failure_threshold=1, reset_s=10), max_inflight=1)
+    structured_provider = resilient(inner, shared=provider)
+    assert structured_provider.breaker is provider.breaker and structured_provider._inflight is provider._inflight
+    provider.breaker.record_failure() # Panne vue par les résumés : les tours sont refusés aussi
+    with pytest.raises(llm.CircuitOpenError):
+        structured_provider.generate("système", [], "A")
+
+
+# --- Appels en cours (tentatives abandonnées comprises) ---
+def test_abandoned_attempts_hold_their_slot(monkeypatch):
+    provider = resilient(mock_provider(monkeypatch, slow_rate=0.5), timeout_s=0.1, max_inflight=1)
+    draws(monkeypatch, 0.1) # Tentative lente (0,4 s), abandonnée après 0,1 s
+    with pytest.raises(llm.UpstreamTimeoutError):
+        provider.generate("système", [], "A")
+    busy = events("busy")
+    with pytest.raises(llm.UpstreamBusyError): # Son thread attend encore le backend : pas de nouvel appel
+        provider.generate("système", [], "A")
+    assert events("busy") - busy == 1
+    time.sleep(0.3) # Le backend a répondu : la place est rendue
+    assert "A)" in provider.generate("système", [], "A")
+
+
+def test_hedge_skipped_without_free_slot(monkeypatch):
+    provider = resilient(mock_provider(monkeypatch, slow_rate=0.5), timeout_s=2, hedge=True, hedge_min_delay_s=0.05, max_inflight=1)
+    draws(monkeypatch, 0.1)
+    hedged = events("hedged")
+    assert "A)" in provider.generate("système", [], "A") # Réponse lente de la requête initiale
+    assert events("hedged") == hedged
+
+
+# --- Disjoncteur ---
+def breaker_provider(monkeypatch, failure_rate=1):
+    breaker = llm.CircuitBreaker(failure_threshold=2, reset_s=0.1)
+    return resilient(mock_provider(monkeypatch, failure_rate=failure_rate), breaker=breaker), breaker
+
+
+def open_breaker(provider):
+    for _ in range(2):
+        with pytest.raises(llm.TransientError):
+            provider.generate("système", [], "A")
+    with pytest.raises(llm.CircuitOpenError):
+        provider.generate("système", [], "A")
+
+
+def test_breaker_opens_then_closes_after_successful_probe(monkeypatch):
+    provider, breaker = breaker_provider(monkeypatch)
+    open_breaker(provider)
+    time.sleep(0.12)
+    provider.inner.failure_rate = 0 # Backend rétabli : l'appel d'essai réussit
+    assert "A)" in provider.generate("système", [], "A")
+    assert breaker._opened_at is None and not breaker._probing
+    assert "A)" in provider.generate("système", [], "A")
+
+
+def test_breaker_reopens_after_failed_probe(monkeypatch):
+    provider, breaker = breaker_provider(monkeypatch)
+    open_breaker(provider)
+    time.sleep(0.12)
+    with pytest.raises(llm.TransientError): # Appel d'essai en échec
+        provider.generate("système", [], "A")
+    with pytest.raises(llm.CircuitOpenError):
+        provider.generate("système", [], "A")
+    assert not breaker._probing
+
+
+def test_breaker_refuses_concurrent_calls_during_probe(monkeypatch):
+    breaker = llm.CircuitBreaker(failure_threshold=1, reset_s=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    with breaker.call():
+        with pytest.raises(llm.CircuitOpenError):
+            breaker.before_call()
+    assert breaker._opened_at is None # Essai terminé sans erreur : refermé
+
+
+@pytest.mark.parametrize("error", [llm.QuotaExceededError("quota"), llm.BlockedPromptError("refus")])
+def test_breaker_probe_with_non_retryable_error_closes(monkeypatch, error):
+    provider, breaker = breaker_provider(monkeypatch)
+    open_breaker(provider)
+    time.sleep(0.12)
+
+    def refuse(*args):
+        raise error
+    monkeypatch.setattr(provider.inner, "generate", refuse)
+    with pytest.raises(type(error)):
+        provider.generate("système", [], "A")
+    assert not breaker._probing and breaker._opened_at is None # Le backend répond : plus de refus
+    monkeypatch.undo()
+    provider.inner.failure_rate = 0
+    assert "A)" in provider.generate("système", [], "A")
+
+
+def test_breaker_cancelled_probe_reopens(monkeypatch):
+    provider, breaker = breaker_provider(monkeypatch)
+    open_breaker(provider)
+    time.sleep(0.12)
+    provider.inner.failure_rate = 0
+    provider.inner.latency = 1 # Appel d'essai assez long pour être annulé
+
+    async def scenario():
+        task = asyncio.ensure_future(provider.generate_async("système", [], "A"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert not breaker._probing and breaker._opened_at is not None # Rouvert, pas bloqué en demi-ouvert
+    time.sleep(0.12)
+    provider.inner.latency = LATENCY_MS / 1000
+    assert "A)" in provider.generate("système", [], "A")
+    assert breaker._opened_at is None
+
+# --- FIN tests/test_resilience.py ---
@@ -0,0 +1,69 @@
+# tests/test_search.py
+# Index plein texte (SQLite FTS5) : joueur et thème indexés une fois par session, bornage des
+# correspondances signalé (truncated), reconstruction d'un index à l'ancien format.
+import flask
+import pytest
+
+import database
+import db_backends
+
+pytestmark = pytest.mark.skipif(not database.SEARCH_ENABLED, reason="SQLite sans FTS5 ou backend PostgreSQL")
+
+
+@pytest.fixture
+def db(tmp_path):
+    app = flask.Flask(__name__, instance_path=str(tmp_path))
+    assert database.init_db(app)
+    with app.app_context():
+        yield database.get_db()
+        database.close_connection()
+
+
+def new_session(player_name, messages, theme="Espace"):
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": text} for i, text in enumerate(messages)]
+    return database.create_session(player_name, theme, "Adulte", "Fille", 10, history)
+
+
+def test_player_indexed_once_per_session(db):
+    session_id = new_session("Zoé", ["Commence.", "Un dragon rouge.", "A", "Le dragon dort."])
+    rows = db.execute(f'SELECT rowid, player_name, content FROM {db_backends.SEARCH_TABLE} ORDER BY rowid').fetchall()
+    assert [(row['rowid'], row['player_name']) for row in rows][0] == (-session_id, "Zoé")
+    assert all(row['player_name'] is None for row in rows[1:]) and len(rows) == 5
+
+
+def test_player_found_beyond_message_hits(db, monkeypatch):
+    monkeypatch.setattr(database, "SEARCH_MAX_HITS", 3)
+    old_id = new_session("Zoé", ["Commence.", "La forêt."])
+    for _ in range(2): new_session("Léa", ["Commence.", "Zoé la fée passe.", "A", "Zoé revient."])
+    sessions, _, truncated = database.search_sessions("zoe")
+    assert old_id in [session["id"] for session in sessions] # Ligne de la session, hors des messages récents
+    assert truncated # 4 messages correspondent, 3 classés
+
+
+def test_search_not_truncated_below_limit(db):
+    session_id = new_session("Zoé", ["Commence.", "Un dragon rouge."])
+    sessions, next_offset, truncated = database.search_sessions("dragon")
+    assert [session["id"] for session in sessions] == [session_id]
+    assert "<mark>dragon</mark>" in sessions[0]["snippet"]
+    assert next_offset is None and not truncated
+
+
+def test_delete_removes_session_row(db):
+    session_id = new_session("Zoé", ["Commence.", "Un dragon rouge."])
+    assert database.delete_session(session_id)
+    assert db.execute(f'SELECT COUNT(*) FROM {db_backends.SEARCH_TABLE}').fetchone()[0] == 0
+
+
+def test_outdated_index_is_rebuilt(db, tmp_path):
+    session_id = new_session("Zoé", ["Commence.", "Un dragon rouge."])
+    # Ancien format : joueur et thème recopiés sur chaque message
+    db.execute(f'DELETE FROM {db_backends.SEARCH_TABLE}')
+    db.execute(f'''INSERT INTO {db_backends.SEARCH_TABLE} (rowid, player_name, theme, content, session_id, turn_index)
+                   SELECT turns.rowid, 'Zoé', 'Espace', turns.content, turns.session_id, turns.turn_index FROM turns''')
+    db.commit()
+    assert database._search_index_outdated(db)
+    assert database.init_db(flask.Flask(__name__, instance_path=str(tmp_path)))
+    assert not database._search_index_outdated(db)
+    assert [session["id"] for session in database.search_sessions("zoe")[0]] == [session_id]
+
+# --- FIN tests/test_search.py ---
@@ -0,0 +1,25 @@
+# tests/test_structured.py
+# Historique rejoué en mode structuré : narration seule pour les répliques passées, choix retenu en clair.
+import structured
+
+HISTORY = [
+    {"role": "user", "content": "Commence l'aventure."},
+    {"role": "assistant", "content": "La nuit tombe.\n\nA) Fuir\nB) Rester", "data": {"choices": ["Fuir", "Rester"]}},
+    {"role": "user", "content": "b"},
+    {"role": "assistant", "content": "Tu restes.\n\nA) Dormir\nB) Veiller"}, # Ancienne réplique en texte libre
+]
+
+
+def test_replay_history_keeps_only_the_last_choices():
+    replayed = structured.replay_history(HISTORY)
+    assert [entry["content"] for entry in replayed] == [
+        "Commence l'aventure.", "La nuit tombe.", "B) Rester", "Tu restes.\n\nA) Dormir\nB) Veiller"
+    ]
+    assert HISTORY[1]["content"].endswith("B) Rester") # Historique d'origine intact
+
+
+def test_replay_history_keeps_free_text_answers():
+    history = HISTORY[:2] + [{"role": "user", "content": "Je grimpe à l'arbre."}, HISTORY[3]]
+    assert structured.replay_history(history)[2]["content"] == "Je grimpe à l'arbre."
+
+# --- FIN tests/test_structured.py ---
@@ -0,0 +1,40 @@
+# tests/test_write_behind.py
+# File d'écriture différée : contrôle de version à la mise en file, lecture de la base hors du verrou.
+import database
+
+
+def make_queue():
+    return database.WriteBehindQueue(interval_s=0.01, batch_size=10)
+
+
+TURN = [{"role": "user", "content": "A"}, {"role": "assistant", "content": "B"}]
+
+
+def test_version_read_outside_lock(monkeypatch):
+    queue = make_queue()
+    monkeypatch.setattr(queue, "_ensure_worker", lambda: None) # Pas d'écriture réelle
+
+    def read_version():
+        assert not queue._lock.locked()
+        return 2
+    assert queue.enqueue("db", 1, 2, TURN, read_version) is True
+    # Tour en file : la version attendue vient de la file, sans relire la base
+    assert queue.enqueue("db", 1, 4, TURN, lambda: 1 / 0) is True
+    assert queue.enqueue("db", 1, 4, TURN, lambda: 1 / 0) is False
+
+
+def test_version_reread_after_concurrent_flush(monkeypatch):
+    queue = make_queue()
+    monkeypatch.setattr(queue, "_ensure_worker", lambda: None)
+    versions = iter([2, 4])
+
+    def read_version():
+        version = next(versions)
+        if version == 2: # Un lot est écrit pendant la lecture : la valeur lue est dépassée
+            queue._pending[("db", 1)] = [(2, TURN)]
+            queue._forget("db", 1, 2)
+        return version
+    assert queue.enqueue("db", 1, 2, TURN, read_version) is False
+    assert queue.pending_for("db", 1) == []
+
+# --- FIN tests/test_write_behind.py ---